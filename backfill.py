@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from telethon.errors import FloodWaitError
+
+from database import IOCDatabase, IOCRecord
+from ioc_extractor import IOCExtractor
+from read_ack import FLOOD_WAITS
+
+log = logging.getLogger(__name__)
+
+
+class Backfiller:
+    """
+    Walk chat history and store the IOCs it contains.
+
+    Chats are read concurrently (at most `concurrency` at a time), oldest
+    message first, starting after each chat's checkpoint. IOCs are saved in
+    batches in the same transaction as the id of the last message covered,
+    so an interrupted run resumes where it stopped and later runs only read
+    what is new.
+    """
+
+    def __init__(self, client, db: IOCDatabase, extractor: IOCExtractor,
+                 concurrency: int = 4, batch_size: int = 500):
+        """
+        Initialize the backfiller.
+
+        Args:
+            client: Telethon client (or anything with async get_entity,
+                get_peer_id and an async-iterable iter_messages)
+            db: Database to write to
+            extractor: Extractor used by the live collector
+            concurrency: Maximum number of chats read at the same time
+            batch_size: Messages per write transaction / checkpoint
+        """
+        self.client = client
+        self.db = db
+        self.extractor = extractor
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+        self.messages = 0
+        self.new_iocs = 0
+
+    async def run(self, chats: Iterable[Any], limit: Optional[int] = None) -> Dict[int, int]:
+        """
+        Backfill several chats concurrently.
+
+        Args:
+            chats: Chat IDs, usernames or entities
+            limit: Read at most this many messages per chat
+
+        Returns:
+            Number of new IOCs per chat ID (chats that failed are left out)
+        """
+        chats = list(chats)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(chat):
+            async with semaphore:
+                return await self.backfill_chat(chat, limit)
+
+        results = await asyncio.gather(*(bounded(chat) for chat in chats), return_exceptions=True)
+
+        summary = {}
+        for chat, result in zip(chats, results):
+            if isinstance(result, Exception):
+                if isinstance(result, FloodWaitError):
+                    FLOOD_WAITS.inc("backfill")
+                log.error("❌ Backfill of %s failed: %s", chat, result, extra={"chat": chat})
+            else:
+                chat_id, new_iocs = result
+                summary[chat_id] = new_iocs
+        return summary
+
+    async def backfill_chat(self, chat: Any, limit: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Read one chat's history from its checkpoint onwards.
+
+        Returns:
+            Tuple of (chat ID, number of new IOCs)
+
+        Raises:
+            sqlite3.Error: If a batch could not be stored; the checkpoint
+                stays at the last batch that was
+        """
+        entity = await self.client.get_entity(chat)
+        chat_id = await self.client.get_peer_id(entity)
+        chat_title = getattr(entity, 'title', getattr(entity, 'first_name', 'Unknown'))
+        checkpoint = (await asyncio.to_thread(self.db.get_checkpoints)).get(chat_id, 0)
+
+        new_iocs = 0
+        records = []
+        pending = 0
+        last_id = checkpoint
+        async for message in self.client.iter_messages(entity, limit=limit, min_id=checkpoint, reverse=True):
+            text = getattr(message, 'message', None)  # service messages have no text
+            for ioc in self.extractor.extract(text or ""):
+                records.append(IOCRecord(ioc.value, ioc.type, chat_id, chat_title, message.id, text,
+                                         message.sender_id, getattr(message.sender, 'username', None)))
+            last_id = message.id
+            pending += 1
+            if pending >= self.batch_size:
+                new_iocs += await self._save(records, chat_id, last_id)
+                records = []
+                pending = 0
+
+        if pending:
+            new_iocs += await self._save(records, chat_id, last_id)
+        return chat_id, new_iocs
+
+    async def _save(self, records, chat_id: int, last_id: int) -> int:
+        # A failed batch fails the chat, so no later batch moves its checkpoint past the gap
+        results = await asyncio.to_thread(self.db.insert_iocs, records, (chat_id, last_id))
+        new_iocs = sum(results)
+        self.new_iocs += new_iocs
+        return new_iocs
+
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Extraction throughput benchmark.
+
+Compares the pre-compiled single-pass IOCExtractor against the original
+per-word logic from main.handler and reports messages per second.
+
+    python -m benchmarks.extraction
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from typing import Callable, List
+
+from ioc_extractor import IOCExtractor, parse_tlds
+from tld_registry import SNAPSHOT_PATH
+
+SAMPLE_MESSAGES = [
+    "New phishing kit hosted at https://login-secure-update.com/auth/index.php please block",
+    "C2 servers: 45.9.148.3 91.215.85.12 185.220.101.4 all on port 443",
+    "Dropper pulls from cdn.files-mirror.net and stage2 from update.microsoft-support.ru",
+    "gm everyone, anyone seen the new release notes? nothing interesting today",
+    "lol that meme is great 😂😂",
+    "IOCs from today's campaign:\nhttp://198.51.100.23/a.exe\nbad-domain.xyz\nnotes.txt readme.md",
+    "Meeting moved to 3pm, see you all there. Agenda in the usual doc.",
+    "ransom note mentions contact@decrypt-help.onion and payment.site.top",
+]
+
+
+def legacy_extract(message_text: str, tlds: List[str]) -> list:
+    """The original main.handler detection loop, minus printing and saving."""
+    regex = r"^(?:(?:[0-1]?[0-9]{1,2}|2[0-4][0-9]|25[0-5])\.){3}(?:[0-1]?[0-9]{1,2}|2[0-4][0-9]|25[0-5])$|^(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}$"
+    words = message_text.split(" ")
+    iocs_found = []
+    for word in words:
+        if word.startswith("http"):
+            iocs_found.append((word, "url"))
+        if re.match(regex, word):
+            if re.match(r"^(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}$", word):
+                domain = word.split(".")[-1].lower()
+                if domain in tlds:
+                    iocs_found.append((word, "domain"))
+            else:
+                iocs_found.append((word, "ip"))
+    return iocs_found
+
+
+def build_corpus(count: int, seed: int = 1337) -> List[str]:
+    """Build a reproducible list of messages from the samples."""
+    rng = random.Random(seed)
+    return [rng.choice(SAMPLE_MESSAGES) for _ in range(count)]
+
+
+def measure(name: str, extract: Callable[[str], list], corpus: List[str]) -> float:
+    """Run extract over the corpus and return messages per second."""
+    found = 0
+    start = time.perf_counter()
+    for message in corpus:
+        found += len(extract(message))
+    elapsed = time.perf_counter() - start
+    rate = len(corpus) / elapsed
+    print(f"{name:<10} {rate:>12,.0f} msg/s  ({found} IOCs in {elapsed:.3f}s)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IOC extraction throughput benchmark")
+    parser.add_argument("--messages", type=int, default=20000, help="Number of messages to process")
+    parser.add_argument("--tlds", default=SNAPSHOT_PATH, help="IANA-format TLD list (default: bundled snapshot)")
+    args = parser.parse_args()
+
+    with open(args.tlds, encoding="utf-8") as f:
+        tlds = parse_tlds(f.read())
+
+    if not tlds:
+        print("❌ No TLDs loaded")
+        sys.exit(1)
+
+    corpus = build_corpus(args.messages)
+    extractor = IOCExtractor(tlds)
+
+    print(f"📊 {len(corpus)} messages, {len(tlds)} TLDs")
+    legacy_rate = measure("legacy", lambda text: legacy_extract(text, tlds), corpus)
+    compiled_rate = measure("compiled", extractor.extract, corpus)
+    print(f"🚀 Speedup: {compiled_rate / legacy_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
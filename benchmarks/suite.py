@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Reproducible performance benchmark suite.
+
+Builds (or reuses) a synthetic database of --rows IOCs and measures the
+paths that matter in production: extraction, the Telegram message handler
+driven by fake events, writes, the query API, CSV export and the Flask
+JSON endpoints. Results are written as JSON together with the versions and
+parameters they were measured with, so runs can be compared over time.
+
+    python -m benchmarks.suite --rows 1000000 --output results.json
+    python -m benchmarks.suite --compare baseline.json --output results.json
+
+Writes made while benchmarking are deleted afterwards, so the database can
+be reused across runs.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from database import IOCDatabase, IOCRecord
+from ioc_extractor import IOCExtractor, parse_tlds
+from tld_registry import SNAPSHOT_PATH
+
+from benchmarks.synthetic import MessageGenerator, SyntheticMessage, iter_texts, populate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def latency(run: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Call `run` `repeat` times after one warm-up call; percentiles in milliseconds."""
+    run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def throughput(count: int, elapsed: float, unit: str) -> Dict[str, float]:
+    return {f"{unit}_per_s": round(count / elapsed, 1), "seconds": round(elapsed, 3), unit: count}
+
+
+@contextlib.contextmanager
+def scratch_writes(db_path: str) -> Iterator[None]:
+    """Delete the IOCs and messages added inside the block, so the database is reusable."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    last_ioc, last_message = conn.execute(
+        "SELECT (SELECT COALESCE(MAX(id), 0) FROM iocs), (SELECT COALESCE(MAX(id), 0) FROM messages)"
+    ).fetchone()
+    try:
+        yield
+    finally:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM iocs WHERE id > ?", (last_ioc,))
+        conn.execute("DELETE FROM messages WHERE id > ?", (last_message,))
+        conn.execute("COMMIT")
+        conn.close()
+
+
+def new_messages(db_path: str, count: int, seed: int) -> List[SyntheticMessage]:
+    """Messages that continue the stream stored in the database."""
+    conn = sqlite3.connect(db_path)
+    last_message_id = conn.execute("SELECT COALESCE(MAX(message_id), 0) FROM messages").fetchone()[0]
+    conn.close()
+    return MessageGenerator(seed=seed).continue_after(last_message_id).messages(count)
+
+
+def bench_extraction(args: argparse.Namespace) -> Dict[str, Any]:
+    """IOCExtractor.extract over the synthetic stream."""
+    with open(SNAPSHOT_PATH, encoding="utf-8") as f:
+        extractor = IOCExtractor(parse_tlds(f.read()))
+    texts = list(iter_texts(args.messages, seed=args.seed))
+
+    start = time.perf_counter()
+    found = sum(len(extractor.extract(text)) for text in texts)
+    result = throughput(len(texts), time.perf_counter() - start, "messages")
+    result["iocs"] = found
+    return result
+
+
+class FakeEvent:
+    """Just enough of a telethon NewMessage event for main.handler."""
+
+    def __init__(self, message: SyntheticMessage):
+        self.message = SimpleNamespace(id=message.message_id, message=message.text)
+        self.chat_id = message.chat_id
+        self.sender_id = message.sender_id
+        self.input_chat = message.chat_id
+        self._chat = SimpleNamespace(title=message.chat_title)
+        self._sender = SimpleNamespace(username=message.sender_username)
+
+    async def get_chat(self):
+        return self._chat
+
+    async def get_sender(self):
+        return self._sender
+
+
+class FakeClient:
+    """Stands in for the Telegram client behind the read acknowledgements."""
+
+    async def send_read_acknowledge(self, entity, max_id=None):
+        pass
+
+
+def bench_handler(args: argparse.Namespace) -> Dict[str, Any]:
+    """main.handler fed fake events: inline extraction and the spooling (monitor default) path."""
+    os.environ.setdefault("API_ID", "1")
+    os.environ.setdefault("API_HASH", "benchmark")
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import main
+    main.tld_registry.stop()
+    main.writer.close()
+    main.db.close()
+    main.read_acks.client = FakeClient()
+
+    from ioc_writer import IOCWriter
+    from spool import SpoolWriter
+
+    events = [FakeEvent(message) for message in new_messages(args.db, args.messages, args.seed + 1)]
+
+    async def feed():
+        for event in events:
+            await main.handler(event)
+        await main.read_acks.close()
+
+    results = {}
+    db = IOCDatabase(args.db)
+    for mode in ("inline", "spool"):
+        if mode == "spool":
+            main.spools.append(SpoolWriter(os.path.join("spool", "p0")))
+        main.writer = IOCWriter(db).start()
+        with scratch_writes(args.db), contextlib.redirect_stdout(open(os.devnull, "w")):
+            start = time.perf_counter()
+            asyncio.run(feed())
+            main.writer.flush()
+            for spool in main.spools:
+                spool.sync()
+            elapsed = time.perf_counter() - start
+            main.writer.close()
+        for spool in main.spools:
+            spool.close()
+        main.spools.clear()
+        results[mode] = throughput(len(events), elapsed, "messages")
+    db.close()
+    return results
+
+
+def bench_writes(args: argparse.Namespace) -> Dict[str, Any]:
+    """save_ioc one row per transaction, and save_iocs in batches of 500."""
+    messages = new_messages(args.db, args.messages, args.seed + 2)
+    records = [IOCRecord(value, ioc_type, m.chat_id, m.chat_title, m.message_id, m.text,
+                         m.sender_id, m.sender_username)
+               for m in messages for value, ioc_type in m.iocs]
+    single = records[:min(len(records), 2000)]
+
+    results = {}
+    db = IOCDatabase(args.db)
+    with scratch_writes(args.db):
+        start = time.perf_counter()
+        for record in single:
+            db.save_ioc(*record)
+        results["save_ioc"] = throughput(len(single), time.perf_counter() - start, "rows")
+    with scratch_writes(args.db):
+        start = time.perf_counter()
+        for i in range(0, len(records), 500):
+            db.save_iocs(records[i:i + 500])
+        results["save_iocs"] = throughput(len(records), time.perf_counter() - start, "rows")
+    db.close()
+    return results
+
+
+def bench_queries(args: argparse.Namespace) -> Dict[str, Any]:
+    """Latency of the read API against the full database."""
+    db = IOCDatabase(args.db, read_only_pool=True)
+    popular = db.get_unique_iocs(sort="sightings", limit=1)[0]
+    rare = db.get_unique_iocs(sort="recent", limit=50)[0][-1]
+    _, deep_cursor = db.get_ioc_page(limit=5000)
+    values = [ioc["ioc_value"] for ioc in db.get_unique_iocs(limit=1000)[0]]
+
+    queries = {
+        "get_stats": db.get_stats,
+        "get_iocs": lambda: db.get_iocs(limit=100),
+        "get_iocs_by_type": lambda: db.get_iocs(ioc_type="url", limit=100),
+        "get_ioc_page_deep": lambda: db.get_ioc_page(limit=100, cursor=deep_cursor),
+        "search_ioc_popular": lambda: db.search_ioc(popular[0]["ioc_value"][:12], limit=100),
+        "search_ioc_rare": lambda: db.search_ioc(rare["ioc_value"], limit=100),
+        "search_ioc_short": lambda: db.search_ioc("ab", limit=100),
+        "lookup_ioc": lambda: db.lookup_ioc(rare["ioc_value"]),
+        "lookup_many_1000": lambda: list(db.lookup_many(values)),
+        "unique_iocs_by_value": lambda: db.get_unique_iocs(limit=100),
+        "unique_iocs_by_sightings": lambda: db.get_unique_iocs(sort="sightings", limit=100),
+        "activity_30d": lambda: db.get_activity(datetime.utcnow() - timedelta(days=30)),
+    }
+    results = {name: latency(query, args.repeat) for name, query in queries.items()}
+    db.close()
+    return results
+
+
+def bench_export(args: argparse.Namespace) -> Dict[str, Any]:
+    """Full CSV export through iter_csv_export, plain and gzip-compressed."""
+    db = IOCDatabase(args.db, read_only_pool=True)
+    rows = db.get_stats().get("total_iocs", 0)
+    results = {}
+    for name, compress in (("csv", False), ("csv_gzip", True)):
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in db.iter_csv_export(compress=compress))
+        results[name] = throughput(rows, time.perf_counter() - start, "rows")
+        results[name]["megabytes"] = round(size / 1e6, 2)
+    db.close()
+    return results
+
+
+def bench_api(args: argparse.Namespace) -> Dict[str, Any]:
+    """The Flask JSON endpoints through the test client: uncached, cached and 304."""
+    import web_gui
+    web_gui.db.close()
+    web_gui.db = IOCDatabase(args.db, read_only_pool=True)
+    client = web_gui.app.test_client()
+
+    results = {}
+    for url in ("/api/stats", "/api/iocs?limit=100", "/api/iocs?type=domain&limit=100",
+                "/api/iocs?search=abc&limit=100", "/api/unique_iocs?limit=100",
+                "/api/unique_iocs?sort=sightings&limit=100"):
+        etag = client.get(url).headers.get("ETag")
+
+        def uncached():
+            web_gui.response_cache = web_gui.ResponseCache()
+            assert client.get(url).status_code == 200
+
+        results[url] = {
+            "uncached": latency(uncached, args.repeat),
+            "cached": latency(lambda: client.get(url), args.repeat),
+            "not_modified": latency(lambda: client.get(url, headers={"If-None-Match": etag}), args.repeat),
+        }
+
+    values = [ioc["ioc_value"] for ioc in web_gui.db.get_unique_iocs(limit=1000)[0]]
+    results["/api/lookup (1000 values)"] = latency(
+        lambda: client.post("/api/lookup", json=values).get_data(), args.repeat)
+    web_gui.db.close()
+    return results
+
+
+BENCHMARKS = {
+    "extraction": bench_extraction,
+    "handler": bench_handler,
+    "writes": bench_writes,
+    "queries": bench_queries,
+    "export": bench_export,
+    "api": bench_api,
+}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Turn nested results into {'queries.get_stats.p50_ms': 0.1, ...}."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]):
+    """Print the change of every timing and rate against an earlier run."""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\n📈 Compared with {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    for name, value in new.items():
+        if not name.endswith(("_ms", "_per_s")) or not old.get(name):
+            continue
+        change = (value - old[name]) / old[name] * 100
+        # Lower is better for latencies, higher for rates
+        better = change < 0 if name.endswith("_ms") else change > 0
+        marker = "  " if abs(change) < 10 else ("✅" if better else "⚠️")
+        print(f"{marker} {name:<60} {old[name]:>12,.3f} → {value:>12,.3f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IOC collector performance benchmark suite")
+    parser.add_argument("--db", default="bench.db", help="Benchmark database (created or topped up to --rows)")
+    parser.add_argument("--rows", type=int, default=1000000, help="IOC rows in the benchmark database")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages for the extraction, handler and write benchmarks")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per latency measurement")
+    parser.add_argument("--seed", type=int, default=1337, help="Random seed")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--output", default="benchmark_results.json", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    args.db = os.path.abspath(args.db)
+    args.output = os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"🗄️ Preparing {args.db} with {args.rows:,} rows...")
+    start = time.perf_counter()
+    added = populate(args.db, args.rows, seed=args.seed)
+    if added:
+        print(f"✅ Added {added:,} rows in {time.perf_counter() - start:.1f}s")
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {"rows": args.rows, "messages": args.messages, "repeat": args.repeat, "seed": args.seed},
+        "results": {},
+    }
+
+    # main and web_gui open their default database files in the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        for name in args.only or BENCHMARKS:
+            print(f"⏱️ {name}...")
+            report["results"][name] = BENCHMARKS[name](args)
+            for metric, value in flatten(report["results"][name]).items():
+                print(f"   {metric:<60} {value:>14,.3f}")
+        os.chdir(cwd)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results written to {args.output}")
+
+    if baseline:
+        compare(baseline, report)
+
+
+if __name__ == "__main__":
+    main()
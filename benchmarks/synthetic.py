@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Synthetic Telegram traffic for benchmarks.
+
+MessageGenerator produces a reproducible stream of messages shaped like
+threat-intel channels: mostly chatter, indicators drawn from a skewed pool
+(so popular ones repeat), defanged forms, URLs followed by punctuation and
+occasional long pastes. populate() fills a database with millions of such
+sightings spread over a time range.
+
+    python -m benchmarks.synthetic --db bench.db --rows 1000000
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from database import (BULK_LOAD_TRIGGERS, IOCDatabase, IOCRecord, create_schema, rebuild_rollups,
+                      rebuild_search_index, rebuild_summary, recount_stats, store_messages)
+from ioc_extractor import canonicalize
+
+WORDS = (
+    "the a to and of in is for on that with this new be are from please check "
+    "update anyone seen today block campaign sample payload dropper loader stealer "
+    "phishing kit panel c2 beacon infra report hash victims spreading fresh "
+    "lol thanks gm ok sure meeting later docs link posted yesterday"
+).split()
+TLDS = ("com", "net", "org", "ru", "xyz", "top", "info", "io", "cn", "online", "site", "club")
+LABEL_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789-"
+PATHS = ("", "/", "/login.php", "/wp-admin/", "/a.exe", "/gate.php?id=", "/download/update.bin",
+         "/auth/index.php", "/files/invoice.pdf.exe", "/api/v1/beacon")
+
+
+class SyntheticMessage(NamedTuple):
+    """One generated message and the indicators planted in it, as written."""
+    chat_id: int
+    chat_title: str
+    message_id: int
+    sender_id: int
+    sender_username: str
+    text: str
+    iocs: List[Tuple[str, str]]
+
+
+class MessageGenerator:
+    """Reproducible stream of synthetic channel messages."""
+
+    def __init__(self, seed: int = 1337, chats: int = 50, senders: int = 500, indicators: int = 50000):
+        """
+        Args:
+            seed: Random seed; the same seed yields the same stream
+            chats: Number of distinct chats
+            senders: Number of distinct senders
+            indicators: Size of the pool indicators are drawn from
+        """
+        self.rng = random.Random(seed)
+        self.chats = [(-1001000000000 - i, f"Threat Intel {i}") for i in range(chats)]
+        self.senders = [(100000 + i, f"analyst{i}") for i in range(senders)]
+        self.domains = [self._domain() for _ in range(indicators)]
+        self.ips = [".".join(str(self.rng.randint(1, 254)) for _ in range(4)) for _ in range(indicators)]
+        self.message_ids = {chat_id: 0 for chat_id, _ in self.chats}
+
+    def _domain(self) -> str:
+        labels = ["".join(self.rng.choices(LABEL_CHARS, k=self.rng.randint(4, 14))).strip("-") or "x"
+                  for _ in range(self.rng.randint(1, 3))]
+        return ".".join(labels) + "." + self.rng.choice(TLDS)
+
+    def _pick(self, pool: List[str]) -> str:
+        # A fifth of the picks favour the start of the pool, so a few
+        # indicators show up everywhere while most are rare
+        if self.rng.random() < 0.2:
+            return pool[min(int(self.rng.paretovariate(1.2)) - 1, len(pool) - 1)]
+        return self.rng.choice(pool)
+
+    def _indicator(self, defanged: bool = False) -> Tuple[str, str]:
+        kind = self.rng.random()
+        if kind < 0.35:
+            value, ioc_type = self._pick(self.ips), "ip"
+        elif kind < 0.7:
+            value, ioc_type = self._pick(self.domains), "domain"
+        else:
+            scheme = self.rng.choice(("http", "https"))
+            host = self._pick(self.domains if self.rng.random() < 0.8 else self.ips)
+            value, ioc_type = f"{scheme}://{host}{self.rng.choice(PATHS)}", "url"
+        if defanged:
+            value = value.replace("http", "hxxp", 1).replace(".", "[.]", 1)
+        return value, ioc_type
+
+    def _chatter(self, words: int) -> str:
+        return " ".join(self.rng.choices(WORDS, k=words))
+
+    def text(self) -> Tuple[str, List[Tuple[str, str]]]:
+        """Generate one message body and the indicators planted in it."""
+        roll = self.rng.random()
+        if roll < 0.55:
+            return self._chatter(self.rng.randint(3, 30)).capitalize() + ".", []
+
+        if roll < 0.99:
+            count = 1 if roll < 0.8 else self.rng.randint(2, 6)
+            defanged = 0.92 <= roll
+            iocs = [self._indicator(defanged) for _ in range(count)]
+            parts = [self._chatter(self.rng.randint(2, 12))]
+            for value, _ in iocs:
+                parts.append(value + self.rng.choice(("", "", ",", ".", ")")))
+                parts.append(self._chatter(self.rng.randint(0, 6)))
+            return " ".join(parts), iocs
+
+        # Long paste: a feed dump with many indicators and filler
+        iocs = [self._indicator(self.rng.random() < 0.3) for _ in range(self.rng.randint(10, 60))]
+        lines = [f"{value}  # {self._chatter(self.rng.randint(1, 8))}" for value, _ in iocs]
+        return "IOC dump:\n" + "\n".join(lines), iocs
+
+    def message(self) -> SyntheticMessage:
+        """Generate the next message in a random chat."""
+        chat_id, chat_title = self.rng.choice(self.chats)
+        sender_id, sender_username = self.rng.choice(self.senders)
+        self.message_ids[chat_id] += 1
+        text, iocs = self.text()
+        return SyntheticMessage(chat_id, chat_title, self.message_ids[chat_id], sender_id,
+                                sender_username, text, iocs)
+
+    def messages(self, count: int) -> List[SyntheticMessage]:
+        return [self.message() for _ in range(count)]
+
+    def continue_after(self, message_id: int) -> "MessageGenerator":
+        """Number new messages after `message_id` in every chat (to add to an existing database)."""
+        self.message_ids = dict.fromkeys(self.message_ids, message_id)
+        return self
+
+
+def populate(db_path: str, rows: int, days: int = 365, seed: int = 1337, batch_size: int = 50000,
+             progress: Optional[Callable[[int, float], None]] = None) -> int:
+    """
+    Fill a database with synthetic sightings until it holds at least `rows` IOCs.
+
+    Sightings get increasing timestamps spread over the last `days` days.
+    The insert triggers are dropped while loading and the counters, rollups,
+    summary and search indexes are rebuilt from scratch afterwards, in the
+    same transaction as the last batch, so the result is indistinguishable
+    from a database filled by the collector. An interrupted run is resumed
+    by running it again; a finished one is only topped up.
+
+    Args:
+        db_path: SQLite database file (created if missing)
+        rows: Target number of IOC rows
+        days: Time range the sightings are spread over
+        seed: Random seed
+        batch_size: Rows per transaction
+        progress: Optional callback(rows_stored, elapsed_seconds) after each batch
+
+    Returns:
+        Number of rows added
+    """
+    IOCDatabase(db_path).close()  # create or upgrade the schema
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA cache_size = -262144")
+    cursor = conn.cursor()
+    existing = cursor.execute("SELECT COUNT(*) FROM iocs").fetchone()[0]
+    if existing >= rows:
+        conn.close()
+        return 0
+
+    # Another seed per top-up, with message IDs carrying on after the stored ones
+    last_message_id = cursor.execute("SELECT COALESCE(MAX(message_id), 0) FROM messages").fetchone()[0]
+    generator = MessageGenerator(seed=seed + existing, indicators=max(50000, rows // 10))
+    generator.continue_after(last_message_id)
+    start = datetime.utcnow() - timedelta(days=days)
+    step = timedelta(days=days) / rows
+
+    stored = existing
+    started = time.perf_counter()
+    try:
+        for name in BULK_LOAD_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        while stored < rows:
+            records = []
+            while len(records) < min(batch_size, rows - stored):
+                message = generator.message()
+                records.extend(IOCRecord(value, ioc_type, message.chat_id, message.chat_title,
+                                         message.message_id, message.text, message.sender_id,
+                                         message.sender_username)
+                               for value, ioc_type in message.iocs)
+
+            cursor.execute("BEGIN")
+            refs = store_messages(cursor, records)
+            cursor.executemany("""
+                INSERT OR IGNORE INTO iocs (ioc_value, ioc_key, ioc_type, message_ref, detected_at, chat_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(record.ioc_value, canonicalize(record.ioc_value, record.ioc_type), record.ioc_type, ref,
+                   (start + step * min(stored + i, rows)).strftime("%Y-%m-%d %H:%M:%S"), record.chat_id)
+                  for i, (record, ref) in enumerate(zip(records, refs))])
+            stored += cursor.rowcount
+            if stored >= rows:
+                recount_stats(cursor)
+                rebuild_rollups(cursor)
+                rebuild_summary(cursor)
+                rebuild_search_index(cursor)
+                create_schema(cursor)
+            cursor.execute("COMMIT")
+            if progress:
+                progress(stored, time.perf_counter() - started)
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+    return stored - existing
+
+
+def iter_texts(count: int, seed: int = 1337) -> Iterator[str]:
+    """Yield just the message bodies of a generated stream."""
+    generator = MessageGenerator(seed=seed)
+    for _ in range(count):
+        yield generator.text()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic IOC database for benchmarks")
+    parser.add_argument("--db", default="bench.db", help="Database file to create or top up")
+    parser.add_argument("--rows", type=int, default=1000000, help="Target number of IOC rows")
+    parser.add_argument("--days", type=int, default=365, help="Spread sightings over this many days")
+    parser.add_argument("--seed", type=int, default=1337, help="Random seed")
+    parser.add_argument("--sample", type=int, help="Print this many generated messages instead")
+    args = parser.parse_args()
+
+    if args.sample:
+        for message in MessageGenerator(seed=args.seed).messages(args.sample):
+            print(f"[{message.chat_title}] {message.text[:200]!r} -> {len(message.iocs)} IOC(s)")
+        return
+
+    def progress(stored, elapsed):
+        print(f"\r🔄 {stored:,} rows ({stored / max(elapsed, 1e-9):,.0f} rows/s)", end="", flush=True, file=sys.stderr)
+
+    added = populate(args.db, args.rows, days=args.days, seed=args.seed, progress=progress)
+    print(f"\n✅ Added {added:,} rows to {args.db}")
+
+
+if __name__ == "__main__":
+    main()
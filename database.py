@@ -1,51 +1,1040 @@
 #!/usr/bin/env python3
 
+import base64
+import csv
+import functools
+import gzip
+import io
+import itertools
+import json
+import logging
 import sqlite3
 import os
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import sys
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Callable, NamedTuple, Sequence, Iterable, Iterator, Tuple
+from urllib.parse import quote
+
+import metrics
+from ioc_extractor import IOC_TYPES, canonicalize
+
+log = logging.getLogger(__name__)
+
+
+class IOCRecord(NamedTuple):
+    """One IOC sighting, in the same order as IOCDatabase.save_ioc arguments."""
+    ioc_value: str
+    ioc_type: str
+    chat_id: Optional[int] = None
+    chat_title: Optional[str] = None
+    message_id: Optional[int] = None
+    message_content: Optional[str] = None
+    sender_id: Optional[int] = None
+    sender_username: Optional[str] = None
+
+
+# Running totals behind get_stats; names match the keys it returns
+COUNTERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS ioc_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID
+'''
+
+# Time-series rollups behind the analytics page, maintained by triggers.
+# Buckets are UTC like detected_at; chat_id 0 stands for "no chat".
+ROLLUP_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS ioc_hourly (
+        hour TEXT NOT NULL,
+        ioc_type TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hour, ioc_type)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ioc_daily (
+        day TEXT NOT NULL,
+        ioc_type TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, ioc_type)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ioc_chat_daily (
+        chat_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        ioc_type TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, day, ioc_type)
+    ) WITHOUT ROWID
+    ''',
+)
+
+# One row per distinct indicator (canonical key and type), maintained by
+# triggers so unique-IOC listings read a page of it instead of scanning iocs.
+# ioc_value is the form it was first seen in; chats counts distinct non-NULL chat IDs.
+SUMMARY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS ioc_summary (
+        ioc_key TEXT NOT NULL,
+        ioc_type TEXT NOT NULL,
+        ioc_value TEXT NOT NULL,
+        first_seen TIMESTAMP NOT NULL,
+        last_seen TIMESTAMP NOT NULL,
+        sightings INTEGER NOT NULL,
+        chats INTEGER NOT NULL,
+        PRIMARY KEY (ioc_key, ioc_type)
+    ) WITHOUT ROWID
+'''
+
+# Chats, senders and message bodies are stored once and referenced by id, so a
+# message with many indicators doesn't repeat its text on every IOC row.
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS chats (
+        id INTEGER PRIMARY KEY,
+        title TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS senders (
+        id INTEGER PRIMARY KEY,
+        username TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER REFERENCES chats (id),
+        message_id INTEGER,
+        sender_id INTEGER REFERENCES senders (id),
+        content BLOB,
+        UNIQUE(chat_id, message_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS iocs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ioc_value TEXT NOT NULL,
+        ioc_key TEXT,
+        ioc_type TEXT NOT NULL,
+        message_ref INTEGER REFERENCES messages (id),
+        detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        chat_id INTEGER,
+        UNIQUE(ioc_value, ioc_type, message_ref)
+    )
+    ''',
+    # Highest message id per chat processed by the history backfill
+    '''
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        chat_id INTEGER PRIMARY KEY,
+        last_message_id INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Calendar months moved out to compressed archives by archive_month
+    '''
+    CREATE TABLE IF NOT EXISTS archived_months (
+        month TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        last_id INTEGER NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_ioc_value ON iocs (ioc_value)',
+    # ioc_value is kept as written; ioc_key is its canonical, refanged form
+    # (see ioc_extractor.canonicalize) and is what dedup and lookups probe
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_ioc_key ON iocs (ioc_key, ioc_type, message_ref)',
+    'CREATE INDEX IF NOT EXISTS idx_ioc_message ON iocs (message_ref)',
+    # Lets the summary triggers check whether an indicator was already seen in a chat
+    'CREATE INDEX IF NOT EXISTS idx_ioc_key_chat ON iocs (ioc_key, ioc_type, chat_id)',
+    # Keyset pagination walks (detected_at, id) newest first; every index
+    # implicitly ends in the rowid, so these serve the type and chat filters
+    'CREATE INDEX IF NOT EXISTS idx_detected_at ON iocs (detected_at)',
+    'CREATE INDEX IF NOT EXISTS idx_type_detected_at ON iocs (ioc_type, detected_at)',
+    'CREATE INDEX IF NOT EXISTS idx_chat_detected_at ON iocs (chat_id, detected_at)',
+    COUNTERS_TABLE,
+    # Keep get_stats an O(1) read: totals per type and the number of distinct
+    # (key, type) indicators, as listed by ioc_summary, are adjusted on every
+    # insert/delete (one index probe on idx_ioc_key decides whether an
+    # indicator is new or gone)
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_counters_insert AFTER INSERT ON iocs BEGIN
+        INSERT INTO ioc_counters (name, value) VALUES ('total_iocs', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+        INSERT INTO ioc_counters (name, value) VALUES (new.ioc_type || '_count', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+        INSERT INTO ioc_counters (name, value)
+            SELECT 'unique_iocs', 1
+            WHERE NOT EXISTS (SELECT 1 FROM iocs WHERE ioc_key = new.ioc_key AND ioc_type = new.ioc_type
+                              AND id <> new.id)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_counters_delete AFTER DELETE ON iocs BEGIN
+        UPDATE ioc_counters SET value = value - 1 WHERE name IN ('total_iocs', old.ioc_type || '_count');
+        UPDATE ioc_counters SET value = value - 1
+            WHERE name = 'unique_iocs'
+            AND NOT EXISTS (SELECT 1 FROM iocs WHERE ioc_key = old.ioc_key AND ioc_type = old.ioc_type);
+    END
+    ''',
+    *ROLLUP_TABLES,
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_rollup_insert AFTER INSERT ON iocs BEGIN
+        INSERT INTO ioc_hourly (hour, ioc_type, count)
+            VALUES (strftime('%Y-%m-%d %H:00', new.detected_at), new.ioc_type, 1)
+            ON CONFLICT(hour, ioc_type) DO UPDATE SET count = count + 1;
+        INSERT INTO ioc_daily (day, ioc_type, count)
+            VALUES (date(new.detected_at), new.ioc_type, 1)
+            ON CONFLICT(day, ioc_type) DO UPDATE SET count = count + 1;
+        INSERT INTO ioc_chat_daily (chat_id, day, ioc_type, count)
+            VALUES (COALESCE(new.chat_id, 0), date(new.detected_at), new.ioc_type, 1)
+            ON CONFLICT(chat_id, day, ioc_type) DO UPDATE SET count = count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_rollup_delete AFTER DELETE ON iocs BEGIN
+        UPDATE ioc_hourly SET count = count - 1
+            WHERE hour = strftime('%Y-%m-%d %H:00', old.detected_at) AND ioc_type = old.ioc_type;
+        UPDATE ioc_daily SET count = count - 1
+            WHERE day = date(old.detected_at) AND ioc_type = old.ioc_type;
+        UPDATE ioc_chat_daily SET count = count - 1
+            WHERE chat_id = COALESCE(old.chat_id, 0) AND day = date(old.detected_at)
+            AND ioc_type = old.ioc_type;
+    END
+    ''',
+    SUMMARY_TABLE,
+    # Secondary indexes of a WITHOUT ROWID table end in its primary key, so
+    # these serve the (column, ioc_key, ioc_type) keyset pagination of get_unique_iocs
+    'CREATE INDEX IF NOT EXISTS idx_summary_sightings ON ioc_summary (sightings)',
+    'CREATE INDEX IF NOT EXISTS idx_summary_last_seen ON ioc_summary (last_seen)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_summary_insert AFTER INSERT ON iocs BEGIN
+        INSERT INTO ioc_summary (ioc_key, ioc_type, ioc_value, first_seen, last_seen, sightings, chats)
+            VALUES (new.ioc_key, new.ioc_type, new.ioc_value, new.detected_at, new.detected_at, 1,
+                    new.chat_id IS NOT NULL)
+            ON CONFLICT(ioc_key, ioc_type) DO UPDATE SET
+                first_seen = MIN(first_seen, excluded.first_seen),
+                last_seen = MAX(last_seen, excluded.last_seen),
+                sightings = sightings + 1,
+                chats = chats + (new.chat_id IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM iocs WHERE ioc_key = new.ioc_key AND ioc_type = new.ioc_type
+                    AND chat_id = new.chat_id AND id <> new.id));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_summary_delete AFTER DELETE ON iocs BEGIN
+        DELETE FROM ioc_summary
+            WHERE ioc_key = old.ioc_key AND ioc_type = old.ioc_type AND sightings <= 1;
+        UPDATE ioc_summary SET
+            sightings = sightings - 1,
+            chats = chats - (old.chat_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM iocs WHERE ioc_key = old.ioc_key AND ioc_type = old.ioc_type
+                AND chat_id = old.chat_id)),
+            -- The unary + keeps the MIN/MAX optimization from walking a
+            -- detected_at index instead of probing the key's few rows
+            first_seen = CASE WHEN first_seen < old.detected_at THEN first_seen ELSE (
+                SELECT MIN(+detected_at) FROM iocs WHERE ioc_key = old.ioc_key AND ioc_type = old.ioc_type) END,
+            last_seen = CASE WHEN last_seen > old.detected_at THEN last_seen ELSE (
+                SELECT MAX(+detected_at) FROM iocs WHERE ioc_key = old.ioc_key AND ioc_type = old.ioc_type) END
+            WHERE ioc_key = old.ioc_key AND ioc_type = old.ioc_type;
+    END
+    ''',
+    # Same columns, in the same order, as the original single iocs table
+    '''
+    CREATE VIEW IF NOT EXISTS ioc_view AS
+    SELECT i.id, i.ioc_value, i.ioc_type,
+           m.chat_id AS source_chat_id, c.title AS source_chat_title,
+           m.message_id AS source_message_id, m.content AS message_content,
+           m.sender_id, s.username AS sender_username, i.detected_at
+    FROM iocs i
+    LEFT JOIN messages m ON m.id = i.message_ref
+    LEFT JOIN chats c ON c.id = m.chat_id
+    LEFT JOIN senders s ON s.id = m.sender_id
+    ''',
+)
+
+# Trigram full-text indexes for substring search, kept in sync by triggers.
+# Compressed message bodies are BLOBs and are left out of message_fts.
+SEARCH_SCHEMA = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ioc_fts USING fts5(
+        ioc_value, content='iocs', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_fts_insert AFTER INSERT ON iocs BEGIN
+        INSERT INTO ioc_fts (rowid, ioc_value) VALUES (new.id, new.ioc_value);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_fts_delete AFTER DELETE ON iocs BEGIN
+        INSERT INTO ioc_fts (ioc_fts, rowid, ioc_value) VALUES ('delete', old.id, old.ioc_value);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS iocs_fts_update AFTER UPDATE OF ioc_value ON iocs BEGIN
+        INSERT INTO ioc_fts (ioc_fts, rowid, ioc_value) VALUES ('delete', old.id, old.ioc_value);
+        INSERT INTO ioc_fts (rowid, ioc_value) VALUES (new.id, new.ioc_value);
+    END
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+    WHEN typeof(new.content) = 'text' BEGIN
+        INSERT INTO message_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+    WHEN typeof(old.content) = 'text' BEGIN
+        INSERT INTO message_fts (message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    ''',
+)
+
+# The trigram tokenizer can't match anything shorter than this
+MIN_INDEXED_SEARCH = 3
+
+EXPORT_HEADER = [
+    'ID', 'IOC Value', 'IOC Type', 'Chat ID', 'Chat Title',
+    'Message ID', 'Message Content', 'Sender ID', 'Sender Username',
+    'Detected At'
+]
+
+# get_unique_iocs orderings: summary column sorted descending, or None for
+# ascending by canonical value
+UNIQUE_SORTS = {
+    'value': None,
+    'sightings': 'sightings',
+    'recent': 'last_seen',
+}
+
+# Where archive_month writes its iocs-YYYY-MM.csv.gz files by default
+ARCHIVE_DIR = 'archive'
+
+# Bodies shorter than this aren't worth compressing
+COMPRESS_MIN_LENGTH = 256
+
+# Dropped by import_iocs(rebuild_indexes=True) while loading; create_schema
+# brings them back and apply_insert_triggers catches up on the new rows. The
+# unique indexes stay, since they decide which rows are duplicates.
+BULK_LOAD_TRIGGERS = ('iocs_counters_insert', 'iocs_rollup_insert', 'iocs_summary_insert',
+                      'iocs_fts_insert', 'messages_fts_insert')
+BULK_LOAD_INDEXES = ('idx_ioc_value', 'idx_ioc_message', 'idx_ioc_key_chat', 'idx_detected_at',
+                     'idx_type_detected_at', 'idx_chat_detected_at')
+
+# Checkpoints only move forward, whoever (backfill or the live handler) writes them
+ADVANCE_CHECKPOINT = '''
+    INSERT INTO backfill_checkpoints (chat_id, last_message_id) VALUES (?, ?)
+    ON CONFLICT(chat_id) DO UPDATE SET
+        last_message_id = MAX(last_message_id, excluded.last_message_id),
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+def upgrade_chat_column(cursor: sqlite3.Cursor):
+    """Version 1: copy the chat ID onto iocs so chat filters can use an index."""
+    cursor.execute('ALTER TABLE iocs ADD COLUMN chat_id INTEGER')
+    cursor.execute('''
+        UPDATE iocs SET chat_id = (SELECT chat_id FROM messages WHERE messages.id = iocs.message_ref)
+    ''')
+    # Superseded by idx_type_detected_at
+    cursor.execute('DROP INDEX IF EXISTS idx_ioc_type')
+
+
+def recount_stats(cursor: sqlite3.Cursor):
+    """Recompute the ioc_counters table from scratch (full scan)."""
+    cursor.execute(COUNTERS_TABLE)
+    cursor.execute('DELETE FROM ioc_counters')
+    cursor.execute("INSERT INTO ioc_counters SELECT 'total_iocs', COUNT(*) FROM iocs")
+    cursor.execute('''
+        INSERT INTO ioc_counters SELECT ioc_type || '_count', COUNT(*) FROM iocs GROUP BY ioc_type
+    ''')
+    cursor.execute('''
+        INSERT INTO ioc_counters SELECT 'unique_iocs', COUNT(*) FROM (SELECT DISTINCT ioc_key, ioc_type FROM iocs)
+    ''')
+
+
+def rebuild_rollups(cursor: sqlite3.Cursor):
+    """Recompute the hourly and daily rollup tables from iocs (full scan)."""
+    for statement in ROLLUP_TABLES:
+        cursor.execute(statement)
+    cursor.execute('DELETE FROM ioc_hourly')
+    cursor.execute('DELETE FROM ioc_daily')
+    cursor.execute('DELETE FROM ioc_chat_daily')
+    cursor.execute('''
+        INSERT INTO ioc_hourly (hour, ioc_type, count)
+        SELECT strftime('%Y-%m-%d %H:00', detected_at), ioc_type, COUNT(*)
+        FROM iocs GROUP BY 1, 2
+    ''')
+    cursor.execute('''
+        INSERT INTO ioc_daily (day, ioc_type, count)
+        SELECT date(detected_at), ioc_type, COUNT(*) FROM iocs GROUP BY 1, 2
+    ''')
+    cursor.execute('''
+        INSERT INTO ioc_chat_daily (chat_id, day, ioc_type, count)
+        SELECT COALESCE(chat_id, 0), date(detected_at), ioc_type, COUNT(*)
+        FROM iocs GROUP BY 1, 2, 3
+    ''')
+
+
+def create_counters(cursor: sqlite3.Cursor):
+    """Version 2: counters table (filled by the version 4 recount)."""
+    cursor.execute(COUNTERS_TABLE)
+
+
+def upgrade_ioc_keys(cursor: sqlite3.Cursor):
+    """Version 4: canonical IOC keys; rows that turn out to be duplicates are dropped."""
+    cursor.execute('ALTER TABLE iocs ADD COLUMN ioc_key TEXT')
+    cursor.connection.create_function('canonical_ioc', 2, canonicalize, deterministic=True)
+    cursor.execute('UPDATE iocs SET ioc_key = canonical_ioc(ioc_value, ioc_type)')
+    cursor.execute('''
+        DELETE FROM iocs WHERE message_ref IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM iocs WHERE message_ref IS NOT NULL
+            GROUP BY ioc_key, ioc_type, message_ref
+        )
+    ''')
+    # Recreated from SCHEMA to count by key
+    cursor.execute('DROP TRIGGER IF EXISTS iocs_counters_insert')
+    cursor.execute('DROP TRIGGER IF EXISTS iocs_counters_delete')
+    recount_stats(cursor)
+    rebuild_rollups(cursor)
+
+
+def rebuild_summary(cursor: sqlite3.Cursor):
+    """Recompute the ioc_summary table from iocs (full scan)."""
+    cursor.execute(SUMMARY_TABLE)
+    cursor.execute('DELETE FROM ioc_summary')
+    cursor.execute('''
+        INSERT INTO ioc_summary (ioc_key, ioc_type, ioc_value, first_seen, last_seen, sightings, chats)
+        SELECT ioc_key, ioc_type,
+               (SELECT ioc_value FROM iocs j
+                WHERE j.ioc_key = i.ioc_key AND j.ioc_type = i.ioc_type ORDER BY j.id LIMIT 1),
+               MIN(detected_at), MAX(detected_at), COUNT(*), COUNT(DISTINCT chat_id)
+        FROM iocs i GROUP BY ioc_key, ioc_type
+    ''')
+
+
+def apply_insert_triggers(cursor: sqlite3.Cursor, after_id: int, after_message: int):
+    """
+    Do what BULK_LOAD_TRIGGERS would have done for rows inserted without them.
+    
+    Set-based equivalent of the triggers for iocs rows above `after_id` and
+    messages above `after_message`: counters, rollups and the summary are
+    adjusted and the new rows are added to the search indexes. Needs the
+    secondary indexes in place.
+    """
+    cursor.execute('''
+        INSERT INTO ioc_counters (name, value)
+        SELECT 'total_iocs', COUNT(*) FROM iocs WHERE id > ?
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    ''', (after_id,))
+    cursor.execute('''
+        INSERT INTO ioc_counters (name, value)
+        SELECT ioc_type || '_count', COUNT(*) FROM iocs WHERE id > ? GROUP BY ioc_type
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    ''', (after_id,))
+    cursor.execute('''
+        INSERT INTO ioc_counters (name, value)
+        SELECT 'unique_iocs', COUNT(*) FROM (
+            SELECT DISTINCT ioc_key, ioc_type FROM iocs i
+            WHERE id > ?1 AND NOT EXISTS (
+                SELECT 1 FROM iocs o WHERE o.ioc_key = i.ioc_key AND o.ioc_type = i.ioc_type AND o.id <= ?1))
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    ''', (after_id,))
+    
+    cursor.execute('''
+        INSERT INTO ioc_hourly (hour, ioc_type, count)
+        SELECT strftime('%Y-%m-%d %H:00', detected_at), ioc_type, COUNT(*) FROM iocs
+        WHERE id > ? GROUP BY 1, 2
+        ON CONFLICT(hour, ioc_type) DO UPDATE SET count = count + excluded.count
+    ''', (after_id,))
+    cursor.execute('''
+        INSERT INTO ioc_daily (day, ioc_type, count)
+        SELECT date(detected_at), ioc_type, COUNT(*) FROM iocs WHERE id > ? GROUP BY 1, 2
+        ON CONFLICT(day, ioc_type) DO UPDATE SET count = count + excluded.count
+    ''', (after_id,))
+    cursor.execute('''
+        INSERT INTO ioc_chat_daily (chat_id, day, ioc_type, count)
+        SELECT COALESCE(chat_id, 0), date(detected_at), ioc_type, COUNT(*) FROM iocs
+        WHERE id > ? GROUP BY 1, 2, 3
+        ON CONFLICT(chat_id, day, ioc_type) DO UPDATE SET count = count + excluded.count
+    ''', (after_id,))
+    
+    # chats counts only the chats an indicator hadn't been seen in before
+    cursor.execute('''
+        INSERT INTO ioc_summary (ioc_key, ioc_type, ioc_value, first_seen, last_seen, sightings, chats)
+        SELECT ioc_key, ioc_type,
+               (SELECT ioc_value FROM iocs j
+                WHERE j.ioc_key = i.ioc_key AND j.ioc_type = i.ioc_type ORDER BY j.id LIMIT 1),
+               MIN(detected_at), MAX(detected_at), COUNT(*),
+               COUNT(DISTINCT CASE WHEN NOT EXISTS (
+                   SELECT 1 FROM iocs o WHERE o.ioc_key = i.ioc_key AND o.ioc_type = i.ioc_type
+                   AND o.chat_id = i.chat_id AND o.id <= ?1) THEN chat_id END)
+        FROM iocs i WHERE id > ?1 GROUP BY ioc_key, ioc_type
+        ON CONFLICT(ioc_key, ioc_type) DO UPDATE SET
+            first_seen = MIN(first_seen, excluded.first_seen),
+            last_seen = MAX(last_seen, excluded.last_seen),
+            sightings = sightings + excluded.sightings,
+            chats = chats + excluded.chats
+    ''', (after_id,))
+    
+    if has_search_index(cursor.connection):
+        cursor.execute('INSERT INTO ioc_fts (rowid, ioc_value) SELECT id, ioc_value FROM iocs WHERE id > ?',
+                       (after_id,))
+        cursor.execute('''
+            INSERT INTO message_fts (rowid, content)
+            SELECT id, content FROM messages WHERE id > ? AND typeof(content) = 'text'
+        ''', (after_message,))
+
+
+def upgrade_summary_delete(cursor: sqlite3.Cursor):
+    """Version 6: recreate the summary delete trigger (from SCHEMA) with index-friendly MIN/MAX."""
+    cursor.execute('DROP TRIGGER IF EXISTS iocs_summary_delete')
+
+
+def upgrade_unique_counter(cursor: sqlite3.Cursor):
+    """Version 7: count unique IOCs by (key, type) like ioc_summary; triggers are recreated from SCHEMA."""
+    cursor.execute('DROP TRIGGER IF EXISTS iocs_counters_insert')
+    cursor.execute('DROP TRIGGER IF EXISTS iocs_counters_delete')
+    recount_stats(cursor)
+
+
+# SCHEMA_UPGRADES[n] brings a database from user_version n to n + 1
+SCHEMA_UPGRADES = (
+    upgrade_chat_column,
+    create_counters,         # version 2: counters table
+    rebuild_rollups,         # version 3: analytics rollups
+    upgrade_ioc_keys,        # version 4: canonical keys
+    rebuild_summary,         # version 5: per-indicator summary
+    upgrade_summary_delete,  # version 6: faster deletes for archiving
+    upgrade_unique_counter,  # version 7: unique IOCs counted per type
+)
+SCHEMA_VERSION = len(SCHEMA_UPGRADES)
+
+
+def create_schema(cursor: sqlite3.Cursor):
+    """Create all tables, indexes and views if they don't exist, upgrading older databases first."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'iocs'")
+    if cursor.fetchone() is not None:
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for upgrade in SCHEMA_UPGRADES[version:]:
+            upgrade(cursor)
+    
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
+    # Older SQLite builds lack FTS5 or the trigram tokenizer (3.34+);
+    # search_ioc falls back to LIKE there
+    try:
+        cursor.execute('SAVEPOINT search_schema')
+        for statement in SEARCH_SCHEMA:
+            cursor.execute(statement)
+        cursor.execute('RELEASE search_schema')
+    except sqlite3.OperationalError:
+        cursor.execute('ROLLBACK TO search_schema')
+        cursor.execute('RELEASE search_schema')
+
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    """Check whether the full-text search tables exist."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'ioc_fts'"
+    ).fetchone() is not None
+
+
+def rebuild_search_index(cursor: sqlite3.Cursor):
+    """Repopulate the full-text indexes from the iocs and messages tables."""
+    cursor.execute("INSERT INTO ioc_fts (ioc_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO message_fts (message_fts) VALUES ('delete-all')")
+    cursor.execute('''
+        INSERT INTO message_fts (rowid, content)
+        SELECT id, content FROM messages WHERE typeof(content) = 'text'
+    ''')
+
+
+def is_legacy_schema(conn: sqlite3.Connection) -> bool:
+    """Check whether iocs is still the original denormalized table."""
+    return conn.execute(
+        "SELECT 1 FROM pragma_table_info('iocs') WHERE name = 'message_content'"
+    ).fetchone() is not None
+
+
+def pack_message(content: Optional[str], compress: bool):
+    """Encode a message body for storage; long bodies become zlib BLOBs if compress is set."""
+    if compress and content and len(content) >= COMPRESS_MIN_LENGTH:
+        return zlib.compress(content.encode('utf-8'))
+    return content
+
+
+def unpack_message(content) -> Optional[str]:
+    """Decode a stored message body (plain TEXT or zlib BLOB)."""
+    if isinstance(content, bytes):
+        return zlib.decompress(content).decode('utf-8')
+    return content
+
+
+def encode_cursor(detected_at: str, ioc_id: int) -> str:
+    """Build the opaque pagination cursor for the row a page ended on."""
+    return base64.urlsafe_b64encode(f"{detected_at}|{ioc_id}".encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Split a pagination cursor back into (detected_at, id); raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        detected_at, ioc_id = raw.rsplit('|', 1)
+        return detected_at, int(ioc_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+def encode_keyset(values: Sequence[Any]) -> str:
+    """Build an opaque pagination cursor from the sort key of the row a page ended on."""
+    raw = json.dumps(list(values), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_keyset(cursor: str, size: int) -> List[Any]:
+    """Inverse of encode_keyset; raises ValueError unless the cursor holds `size` values."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values
+
+
+def month_bounds(month: str) -> Tuple[str, str]:
+    """Return the [start, end) detected_at range of a 'YYYY-MM' month; raises ValueError if malformed."""
+    try:
+        start = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        raise ValueError(f"Invalid month {month!r}; expected YYYY-MM") from None
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def normalize_timestamp(value: str) -> str:
+    """Bring an ISO date/time into the 'YYYY-MM-DD HH:MM:SS' form stored by SQLite."""
+    return value.strip().replace('T', ' ')
+
+
+def ioc_filters(ioc_type: Optional[str] = None, chat_id: Optional[int] = None,
+                since: Optional[str] = None, until: Optional[str] = None
+                ) -> Tuple[List[str], List[Any]]:
+    """Build WHERE conditions (on iocs aliased as i) and parameters for the common filters."""
+    conditions = []
+    params = []
+    if ioc_type:
+        conditions.append('i.ioc_type = ?')
+        params.append(ioc_type)
+    if chat_id is not None:
+        conditions.append('i.chat_id = ?')
+        params.append(chat_id)
+    if since:
+        conditions.append('i.detected_at >= ?')
+        params.append(normalize_timestamp(since))
+    if until:
+        conditions.append('i.detected_at < ?')
+        params.append(normalize_timestamp(until))
+    return conditions, params
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a stream of byte chunks on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def ioc_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert an ioc_view row to the dict shape used throughout the project."""
+    ioc = dict(row)
+    ioc['message_content'] = unpack_message(ioc['message_content'])
+    return ioc
+
+
+def store_messages(cursor: sqlite3.Cursor, records: Sequence[IOCRecord],
+                   compress: bool = False, update_names: bool = True) -> List[Optional[int]]:
+    """
+    Upsert the chats, senders and messages referenced by a batch.
+    
+    Must run inside a write transaction.
+    
+    Args:
+        cursor: Cursor of the open transaction
+        records: The batch
+        compress: zlib-compress long message bodies
+        update_names: Overwrite known chat titles and usernames (False for
+            old data, which should only fill in missing ones)
+    
+    Returns:
+        The messages row id for each record (None if it has no message)
+    """
+    newer, older = ('excluded.title', 'title') if update_names else ('title', 'excluded.title')
+    chats = {r.chat_id: r.chat_title for r in records if r.chat_id is not None}
+    cursor.executemany(f'''
+        INSERT INTO chats (id, title) VALUES (?, ?)
+        ON CONFLICT(id) DO UPDATE SET title = COALESCE({newer}, {older})
+    ''', chats.items())
+    
+    newer, older = ('excluded.username', 'username') if update_names else ('username', 'excluded.username')
+    senders = {r.sender_id: r.sender_username for r in records if r.sender_id is not None}
+    cursor.executemany(f'''
+        INSERT INTO senders (id, username) VALUES (?, ?)
+        ON CONFLICT(id) DO UPDATE SET username = COALESCE({newer}, {older})
+    ''', senders.items())
+    
+    refs = []
+    known = {}
+    for record in records:
+        if record.message_id is None and record.message_content is None:
+            refs.append(None)
+            continue
+        
+        # Without a Telegram message ID, identical text from the same place
+        # in one batch is treated as one message
+        if record.message_id is None:
+            key = (record.chat_id, None, record.sender_id, record.message_content)
+        else:
+            key = (record.chat_id, record.message_id)
+        
+        if key not in known:
+            row = None
+            if record.message_id is not None:
+                cursor.execute(
+                    'SELECT id FROM messages WHERE chat_id IS ? AND message_id = ?', key)
+                row = cursor.fetchone()
+            if row is None:
+                cursor.execute('''
+                    INSERT INTO messages (chat_id, message_id, sender_id, content)
+                    VALUES (?, ?, ?, ?)
+                ''', (record.chat_id, record.message_id, record.sender_id,
+                      pack_message(record.message_content, compress)))
+                known[key] = cursor.lastrowid
+            else:
+                known[key] = row[0]
+        refs.append(known[key])
+    
+    return refs
+
+
+def migrate_legacy_schema(db_path: str, chunk_size: int = 5000, compress: bool = False,
+                          vacuum: bool = True, progress=None) -> int:
+    """
+    Convert a database using the original single iocs table to the
+    normalized schema, in place.
+    
+    Rows are copied in chunks of `chunk_size`, each in its own transaction,
+    keeping their ids and timestamps. If interrupted, running it again resumes
+    after the last copied row.
+    
+    Args:
+        db_path: SQLite database file
+        chunk_size: Rows copied per transaction
+        compress: zlib-compress long message bodies
+        vacuum: VACUUM afterwards to return the freed space to the OS
+        progress: Optional callback(migrated_rows, total_rows) after each chunk
+    
+    Returns:
+        Number of rows migrated (0 if the database was already up to date)
+    """
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    try:
+        if is_legacy_schema(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            # The old indexes follow the table on rename; free their names
+            for index in ('idx_ioc_value', 'idx_ioc_type', 'idx_detected_at'):
+                conn.execute(f'DROP INDEX IF EXISTS {index}')
+            conn.execute('ALTER TABLE iocs RENAME TO iocs_legacy')
+            create_schema(conn.cursor())
+            conn.execute('COMMIT')
+        elif conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'iocs_legacy'"
+        ).fetchone() is None:
+            return 0
+        
+        total = conn.execute('SELECT COUNT(*) FROM iocs_legacy').fetchone()[0]
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM iocs').fetchone()[0]
+        migrated = conn.execute('SELECT COUNT(*) FROM iocs_legacy WHERE id <= ?',
+                                (last_id,)).fetchone()[0]
+        
+        while True:
+            rows = conn.execute('''
+                SELECT id, ioc_value, ioc_type, source_chat_id, source_chat_title,
+                       source_message_id, message_content, sender_id, sender_username,
+                       detected_at
+                FROM iocs_legacy WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor()
+            refs = store_messages(cursor, [IOCRecord(*row[1:9]) for row in rows], compress)
+            cursor.executemany('''
+                INSERT OR IGNORE INTO iocs (id, ioc_value, ioc_key, ioc_type, message_ref, detected_at, chat_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(row[0], row[1], canonicalize(row[1], row[2]), row[2], ref, row[9], row[3])
+                  for row, ref in zip(rows, refs)])
+            conn.execute('COMMIT')
+            
+            last_id = rows[-1][0]
+            migrated += len(rows)
+            if progress:
+                progress(migrated, total)
+        
+        conn.execute('DROP TABLE iocs_legacy')
+        if vacuum:
+            conn.execute('VACUUM')
+        return migrated
+    finally:
+        conn.close()
+
+
+# Per-method latency and result sizes, labelled with the method name
+QUERY_SECONDS = metrics.histogram('ioc_db_query_seconds', 'IOCDatabase call latency', ['query'])
+QUERY_ROWS = metrics.counter('ioc_db_query_rows', 'Rows returned or written by IOCDatabase calls', ['query'])
+
+
+def instrumented(method):
+    """Record a method's latency and the number of rows it returned or wrote."""
+    name = method.__name__
+    
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not metrics.enabled:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - start, name)
+        # Lists of rows, (rows, cursor) pages and {period: count} activity
+        if isinstance(result, tuple) and result:
+            QUERY_ROWS.inc(name, amount=len(result[0]))
+        elif isinstance(result, (list, dict)):
+            QUERY_ROWS.inc(name, amount=len(result))
+        return result
+    return wrapper
+
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections shared by the threads of one process.
+    
+    A thread checks a connection out for the duration of a `with` block (and
+    gets the same one back if it nests blocks); afterwards the connection goes
+    back to the idle list instead of being closed, so pragmas, the page cache
+    and the prepared statement cache survive between calls.
+    """
+    
+    # Applied to every new connection
+    PRAGMAS = (
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA mmap_size = 268435456',   # 256 MiB
+        'PRAGMA cache_size = -65536',     # 64 MiB
+        'PRAGMA temp_store = MEMORY',
+    )
+    
+    def __init__(self, db_path: str, read_only: bool = False, max_idle: int = 8,
+                 timeout: float = 30.0, cached_statements: int = 256):
+        """
+        Initialize the pool.
+        
+        Args:
+            db_path: SQLite database file
+            read_only: Open connections with mode=ro so they can never write
+            max_idle: Maximum number of idle connections kept open
+            timeout: Seconds to wait on a locked database before failing
+            cached_statements: Size of each connection's prepared statement cache
+        """
+        self.db_path = db_path
+        self.read_only = read_only
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            target, uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro", True
+        else:
+            target, uri = self.db_path, False
+        
+        # Autocommit mode: transactions are opened explicitly by the callers
+        conn = sqlite3.connect(target, uri=uri, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out this thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if not self._closed and len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+    
+    def close(self):
+        """Close all idle connections; checked-out ones close on return."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
 
 
 class IOCDatabase:
-    def __init__(self, db_path: str = "ioc_database.db"):
-        """Initialize the IOC database."""
+    def __init__(self, db_path: str = "ioc_database.db", read_only_pool: bool = False,
+                 compress_messages: bool = False):
+        """
+        Initialize the IOC database.
+        
+        Args:
+            db_path: SQLite database file
+            read_only_pool: Serve queries from a separate pool of read-only
+                connections (used by the web GUI). Writes still go through
+                the read-write pool.
+            compress_messages: zlib-compress long message bodies on write
+        """
         self.db_path = db_path
+        self.compress_messages = compress_messages
+        self._pool = ConnectionPool(db_path)
         self.init_database()
+        self._read_pool = ConnectionPool(db_path, read_only=True) if read_only_pool else self._pool
+        self._marker_conn = None
+        self._marker_lock = threading.Lock()
+    
+    def close(self):
+        """Close all pooled connections."""
+        self._pool.close()
+        if self._read_pool is not self._pool:
+            self._read_pool.close()
+        with self._marker_lock:
+            if self._marker_conn is not None:
+                self._marker_conn.close()
+                self._marker_conn = None
+    
+    def change_marker(self) -> int:
+        """
+        Return a number that changes whenever anything is committed to the database.
+        
+        Uses PRAGMA data_version on a dedicated connection that never writes,
+        so commits from every other connection and process count. It costs no
+        I/O beyond a shared-memory check. Values are only comparable within
+        this IOCDatabase instance.
+        
+        Raises:
+            sqlite3.Error: If the database can't be read
+        """
+        with self._marker_lock:
+            if self._marker_conn is None:
+                self._marker_conn = self._read_pool._connect()
+            return self._marker_conn.execute('PRAGMA data_version').fetchone()[0]
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block in one write transaction, taking the write lock up front."""
+        with self._pool.connection() as conn:
+            if conn.in_transaction:
+                # Nested call: join the outer transaction
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+    
+    def _read(self):
+        """Check out a connection for queries."""
+        return self._read_pool.connection()
     
     def init_database(self):
         """Create the database and tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._pool.connection() as conn:
+            if is_legacy_schema(conn):
+                raise RuntimeError(
+                    f"{self.db_path} uses the old single-table schema; "
+                    f"run `python ioc_manager.py --db {self.db_path} migrate` first")
             
-            # Create IOCs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS iocs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ioc_value TEXT NOT NULL,
-                    ioc_type TEXT NOT NULL,
-                    source_chat_id INTEGER,
-                    source_chat_title TEXT,
-                    source_message_id INTEGER,
-                    message_content TEXT,
-                    sender_id INTEGER,
-                    sender_username TEXT,
-                    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(ioc_value, ioc_type, source_message_id)
-                )
-            ''')
-            
-            # Create index for faster searches
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_ioc_value ON iocs (ioc_value)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_ioc_type ON iocs (ioc_type)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_detected_at ON iocs (detected_at)
-            ''')
+            # Lets archive_month hand freed pages back to the OS without a full
+            # VACUUM. Only takes effect on new databases; reclaim_space converts old ones
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # WAL lets the web GUI read while the collector writes
+            conn.execute('PRAGMA journal_mode = WAL')
+        
+        with self._transaction() as conn:
+            had_search_index = has_search_index(conn)
+            create_schema(conn.cursor())
+            self.has_search_index = has_search_index(conn)
             
-            conn.commit()
+            # Index rows written before the search tables existed
+            if self.has_search_index and not had_search_index:
+                rebuild_search_index(conn.cursor())
+    
+    def rebuild_search_index(self) -> bool:
+        """Rebuild and optimize the full-text search indexes."""
+        if not self.has_search_index:
+            log.warning("Full-text search is not available in this SQLite build")
+            return False
+        
+        try:
+            with self._transaction() as conn:
+                cursor = conn.cursor()
+                rebuild_search_index(cursor)
+                cursor.execute("INSERT INTO ioc_fts (ioc_fts) VALUES ('optimize')")
+                cursor.execute("INSERT INTO message_fts (message_fts) VALUES ('optimize')")
+            return True
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return False
     
     def save_ioc(self, ioc_value: str, ioc_type: str, chat_id: Optional[int] = None, 
                  chat_title: Optional[str] = None, message_id: Optional[int] = None,
@@ -67,22 +1056,96 @@ class IOCDatabase:
         Returns:
             bool: True if saved successfully, False if duplicate
         """
+        return self.save_iocs([IOCRecord(ioc_value, ioc_type, chat_id, chat_title, message_id,
+                                         message_content, sender_id, sender_username)])[0]
+    
+    def save_iocs(self, records: Sequence[IOCRecord],
+                  checkpoint: Optional[Tuple[int, int]] = None) -> List[bool]:
+        """
+        Save a batch of IOCs in a single transaction.
+        
+        Args:
+            records: IOC records to insert
+            checkpoint: Optional (chat_id, last_message_id) backfill checkpoint
+                to store in the same transaction
+            
+        Returns:
+            List of booleans parallel to records: True if the row was new,
+            False if it was a duplicate (or the batch failed)
+        """
+        try:
+            return self.insert_iocs(records, checkpoint)
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return [False] * len(records)
+    
+    @instrumented
+    def insert_iocs(self, records: Sequence[IOCRecord],
+                    checkpoint: Optional[Tuple[int, int]] = None) -> List[bool]:
+        """
+        Like save_iocs, but raises instead of reporting a failed batch as duplicates.
+        
+        Raises:
+            sqlite3.Error: If the transaction failed (nothing was written)
+        """
+        if not records and checkpoint is None:
+            return []
+        
+        # The write lock is taken up front so MAX(id) can't move under us
+        with self._transaction() as conn:
+            cursor = conn.cursor()
+            if checkpoint is not None:
+                cursor.execute(ADVANCE_CHECKPOINT, checkpoint)
+            
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM iocs')
+            last_id = cursor.fetchone()[0]
+            
+            refs = store_messages(cursor, records, self.compress_messages)
+            keys = [canonicalize(record[0], record[1]) for record in records]
+            cursor.executemany('''
+                INSERT OR IGNORE INTO iocs (ioc_value, ioc_key, ioc_type, message_ref, chat_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(record[0], key, record[1], ref, record[2])
+                  for record, key, ref in zip(records, keys, refs)])
+            
+            cursor.execute('''
+                SELECT ioc_key, ioc_type, message_ref FROM iocs WHERE id > ?
+            ''', (last_id,))
+            new_keys = set(cursor.fetchall())
+        
+        results = []
+        for record, ioc_key, ref in zip(records, keys, refs):
+            key = (ioc_key, record[1], ref)
+            results.append(key in new_keys)
+            # A repeat within the same batch is a duplicate
+            new_keys.discard(key)
+        return results
+    
+    def advance_checkpoints(self, checkpoints: Dict[int, int]):
+        """
+        Move backfill checkpoints forward (never back) in one transaction.
+        
+        Args:
+            checkpoints: {chat_id: last_message_id} of messages already stored
+            
+        Raises:
+            sqlite3.Error: If the transaction failed
+        """
+        with self._transaction() as conn:
+            conn.executemany(ADVANCE_CHECKPOINT, checkpoints.items())
+    
+    def get_checkpoints(self) -> Dict[int, int]:
+        """Return the backfill checkpoints as {chat_id: last_message_id}."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._read() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR IGNORE INTO iocs 
-                    (ioc_value, ioc_type, source_chat_id, source_chat_title, 
-                     source_message_id, message_content, sender_id, sender_username)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (ioc_value, ioc_type, chat_id, chat_title, message_id, 
-                      message_content, sender_id, sender_username))
-                
-                return cursor.rowcount > 0
+                cursor.execute('SELECT chat_id, last_message_id FROM backfill_checkpoints')
+                return dict(cursor.fetchall())
         except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return False
+            log.error("Database error: %s", e)
+            return {}
     
+    @instrumented
     def get_iocs(self, ioc_type: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
         """
         Retrieve IOCs from the database.
@@ -94,126 +1157,840 @@ class IOCDatabase:
         Returns:
             List of IOC records as dictionaries
         """
+        return self.get_ioc_page(ioc_type=ioc_type, limit=limit)[0]
+    
+    @instrumented
+    def get_ioc_page(self, ioc_type: Optional[str] = None, chat_id: Optional[int] = None,
+                     since: Optional[str] = None, until: Optional[str] = None,
+                     limit: int = 100, cursor: Optional[str] = None
+                     ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Retrieve one page of IOCs, newest first.
+        
+        Pages are keyed on (detected_at, id) rather than an offset, so every
+        page is a single index range scan no matter how deep it is.
+        
+        Args:
+            ioc_type: Filter by IOC type ('ip', 'domain', 'url')
+            chat_id: Filter by Telegram chat ID
+            since: Only IOCs detected at or after this ISO date/time
+            until: Only IOCs detected before this ISO date/time
+            limit: Page size (at least 1)
+            cursor: The `next` cursor returned with the previous page
+            
+        Returns:
+            Tuple of (IOC records as dictionaries, cursor for the next page
+            or None if this is the last page)
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = max(1, limit)
+        conditions, params = ioc_filters(ioc_type, chat_id, since, until)
+        if cursor:
+            conditions.append('(i.detected_at, i.id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                if ioc_type:
-                    cursor.execute('''
-                        SELECT * FROM iocs 
-                        WHERE ioc_type = ? 
-                        ORDER BY detected_at DESC 
-                        LIMIT ?
-                    ''', (ioc_type, limit))
-                else:
-                    cursor.execute('''
-                        SELECT * FROM iocs 
-                        ORDER BY detected_at DESC 
-                        LIMIT ?
-                    ''', (limit,))
+            with self._read() as conn:
+                db_cursor = conn.cursor()
+                db_cursor.row_factory = sqlite3.Row
                 
-                return [dict(row) for row in cursor.fetchall()]
+                # Fetch one extra row to learn whether another page exists
+                db_cursor.execute(f'''
+                    SELECT v.* FROM iocs i
+                    JOIN ioc_view v ON v.id = i.id
+                    {where}
+                    ORDER BY i.detected_at DESC, i.id DESC
+                    LIMIT ?
+                ''', (*params, limit + 1))
+                rows = db_cursor.fetchall()
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return [], None
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['detected_at'], rows[-1]['id'])
+        
+        return [ioc_dict(row) for row in rows], next_cursor
+    
+    @instrumented
+    def get_iocs_since(self, last_id: int, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Retrieve IOCs stored after a known row, oldest first.
+        
+        Used to tail the table: pass the highest id seen so far as a
+        watermark and it becomes a single primary key range scan.
+        
+        Args:
+            last_id: Only return IOCs with an id greater than this
+            limit: Maximum number of results
+            
+        Returns:
+            List of IOC records as dictionaries, in insertion order
+        """
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                cursor.execute('''
+                    SELECT * FROM ioc_view WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, limit))
+                return [ioc_dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
-            print(f"Database error: {e}")
+            log.error("Database error: %s", e)
             return []
     
-    def get_unique_iocs(self, ioc_type: Optional[str] = None) -> List[str]:
-        """Get unique IOC values."""
+    def get_last_id(self) -> int:
+        """Return the id of the newest IOC row (0 if there are none)."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._read() as conn:
                 cursor = conn.cursor()
+                cursor.execute('SELECT MAX(id) FROM iocs')
+                return cursor.fetchone()[0] or 0
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return 0
+    
+    @instrumented
+    def get_unique_iocs(self, ioc_type: Optional[str] = None, sort: str = 'value',
+                        limit: int = 100, cursor: Optional[str] = None
+                        ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Retrieve one page of distinct indicators with their sighting summary.
+        
+        Reads the trigger-maintained ioc_summary table with keyset
+        pagination, so a page costs the same however many indicators exist.
+        
+        Args:
+            ioc_type: Filter by IOC type ('ip', 'domain', 'url')
+            sort: 'value' (canonical value A-Z), 'sightings' (most sighted
+                first) or 'recent' (most recently seen first)
+            limit: Page size (at least 1)
+            cursor: The `next` cursor returned with the previous page
+            
+        Returns:
+            Tuple of (summaries with ioc_value, ioc_key, ioc_type, first_seen,
+            last_seen, sightings and chats, cursor for the next page or None
+            if this is the last page)
+            
+        Raises:
+            ValueError: If the sort order or cursor is invalid
+        """
+        if sort not in UNIQUE_SORTS:
+            raise ValueError(f"Unknown sort order: {sort!r}")
+        limit = max(1, limit)
+        column = UNIQUE_SORTS[sort]
+        keyset = [column, 'ioc_key', 'ioc_type'] if column else ['ioc_key', 'ioc_type']
+        direction = 'DESC' if column else 'ASC'
+        
+        conditions = []
+        params = []
+        if ioc_type:
+            conditions.append('ioc_type = ?')
+            params.append(ioc_type)
+        if cursor:
+            placeholders = ', '.join('?' for _ in keyset)
+            conditions.append(f"({', '.join(keyset)}) {'<' if column else '>'} ({placeholders})")
+            params.extend(decode_keyset(cursor, len(keyset)))
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = ', '.join(f'{name} {direction}' for name in keyset)
+        
+        try:
+            with self._read() as conn:
+                db_cursor = conn.cursor()
+                db_cursor.row_factory = sqlite3.Row
                 
-                if ioc_type:
-                    cursor.execute('''
-                        SELECT DISTINCT ioc_value FROM iocs 
-                        WHERE ioc_type = ? 
-                        ORDER BY ioc_value
-                    ''', (ioc_type,))
-                else:
-                    cursor.execute('''
-                        SELECT DISTINCT ioc_value FROM iocs 
-                        ORDER BY ioc_value
-                    ''')
-                
-                return [row[0] for row in cursor.fetchall()]
+                # Fetch one extra row to learn whether another page exists
+                db_cursor.execute(f'''
+                    SELECT ioc_value, ioc_key, ioc_type, first_seen, last_seen, sightings, chats
+                    FROM ioc_summary
+                    {where}
+                    ORDER BY {order}
+                    LIMIT ?
+                ''', (*params, limit + 1))
+                rows = db_cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return []
+            log.error("Database error: %s", e)
+            return [], None
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_keyset([rows[-1][name] for name in keyset])
+        
+        return [dict(row) for row in rows], next_cursor
+    
+    def rebuild_summary(self) -> bool:
+        """Recompute the per-indicator summary from the iocs table."""
+        try:
+            with self._transaction() as conn:
+                rebuild_summary(conn.cursor())
+            return True
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return False
     
+    @instrumented
     def get_stats(self) -> Dict[str, int]:
-        """Get database statistics."""
+        """
+        Get database statistics.
+        
+        Reads the counters maintained by triggers on iocs, so the cost
+        doesn't grow with the table.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._read() as conn:
                 cursor = conn.cursor()
-                
-                stats = {}
-                
-                # Total IOCs
-                cursor.execute('SELECT COUNT(*) FROM iocs')
-                stats['total_iocs'] = cursor.fetchone()[0]
-                
-                # IOCs by type
-                cursor.execute('''
-                    SELECT ioc_type, COUNT(*) 
-                    FROM iocs 
-                    GROUP BY ioc_type
-                ''')
-                for ioc_type, count in cursor.fetchall():
-                    stats[f'{ioc_type}_count'] = count
-                
-                # Unique IOCs
-                cursor.execute('SELECT COUNT(DISTINCT ioc_value) FROM iocs')
-                stats['unique_iocs'] = cursor.fetchone()[0]
-                
-                return stats
+                cursor.execute('SELECT name, value FROM ioc_counters')
+                counters = dict(cursor.fetchall())
         except sqlite3.Error as e:
-            print(f"Database error: {e}")
+            log.error("Database error: %s", e)
             return {}
+        
+        # Same keys and order as before: total, per-type counts, unique
+        stats = {'total_iocs': counters.pop('total_iocs', 0)}
+        unique_iocs = counters.pop('unique_iocs', 0)
+        for name in sorted(counters):
+            if counters[name] > 0:
+                stats[name] = counters[name]
+        stats['unique_iocs'] = unique_iocs
+        return stats
     
-    def search_ioc(self, search_term: str) -> List[Dict[str, Any]]:
-        """Search for IOCs containing the search term."""
+    def recount_stats(self) -> bool:
+        """Rebuild the statistics counters with a full scan."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._transaction() as conn:
+                recount_stats(conn.cursor())
+            return True
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return False
+    
+    @instrumented
+    def get_activity(self, since: datetime, until: Optional[datetime] = None, period: str = 'day',
+                     ioc_type: Optional[str] = None, chat_id: Optional[int] = None) -> Dict[str, int]:
+        """
+        Count IOCs per hour or day from the rollup tables.
+        
+        Args:
+            since: Start of the range (UTC)
+            until: End of the range (UTC), defaults to now
+            period: 'hour' or 'day'
+            ioc_type: Filter by IOC type ('ip', 'domain', 'url')
+            chat_id: Filter by Telegram chat ID (daily only)
+            
+        Returns:
+            Ordered dict of bucket label ('YYYY-MM-DD' or 'YYYY-MM-DD HH:00')
+            to count, including empty buckets
+        """
+        until = until or datetime.utcnow()
+        if period == 'hour':
+            if chat_id is not None:
+                raise ValueError("Per-chat activity is only kept per day")
+            table, column, fmt, step = 'ioc_hourly', 'hour', '%Y-%m-%d %H:00', timedelta(hours=1)
+            start = since.replace(minute=0, second=0, microsecond=0)
+        elif period == 'day':
+            table, column, fmt, step = 'ioc_daily', 'day', '%Y-%m-%d', timedelta(days=1)
+            if chat_id is not None:
+                table = 'ioc_chat_daily'
+            start = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            raise ValueError(f"Unknown period: {period!r}")
+        
+        conditions = [f'{column} >= ?', f'{column} <= ?']
+        params = [start.strftime(fmt), until.strftime(fmt)]
+        if chat_id is not None:
+            conditions.append('chat_id = ?')
+            params.append(chat_id)
+        if ioc_type:
+            conditions.append('ioc_type = ?')
+            params.append(ioc_type)
+        
+        try:
+            with self._read() as conn:
                 cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT {column}, SUM(count) FROM {table}
+                    WHERE {' AND '.join(conditions)}
+                    GROUP BY {column}
+                ''', params)
+                counts = dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            counts = {}
+        
+        activity = {}
+        bucket = start
+        while bucket <= until:
+            label = bucket.strftime(fmt)
+            activity[label] = counts.get(label, 0)
+            bucket += step
+        return activity
+    
+    def rebuild_rollups(self) -> bool:
+        """Recompute the analytics rollup tables from all stored IOCs."""
+        try:
+            with self._transaction() as conn:
+                rebuild_rollups(conn.cursor())
+            return True
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return False
+    
+    @instrumented
+    def search_ioc(self, search_term: str, limit: int = 100, offset: int = 0,
+                   include_messages: bool = False) -> List[Dict[str, Any]]:
+        """
+        Search for IOCs containing the search term.
+        
+        Terms of three or more characters are answered from the trigram
+        full-text index and ranked by relevance; shorter terms fall back to a
+        LIKE scan over the newest IOCs.
+        
+        Args:
+            search_term: Substring to look for (case-insensitive)
+            limit: Maximum number of results
+            offset: Number of results to skip, for paging
+            include_messages: Also match IOCs whose message text contains the term
+            
+        Returns:
+            List of IOC records as dictionaries
+        """
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
                 
-                cursor.execute('''
-                    SELECT * FROM iocs 
-                    WHERE ioc_value LIKE ? 
-                    ORDER BY detected_at DESC
-                ''', (f'%{search_term}%',))
+                if not self.has_search_index or len(search_term) < MIN_INDEXED_SEARCH:
+                    cursor.execute('''
+                        SELECT * FROM ioc_view 
+                        WHERE ioc_value LIKE ? 
+                        ORDER BY detected_at DESC
+                        LIMIT ? OFFSET ?
+                    ''', (f'%{search_term}%', limit, offset))
+                    return [ioc_dict(row) for row in cursor.fetchall()]
                 
-                return [dict(row) for row in cursor.fetchall()]
+                # Quote the term as a single FTS5 phrase
+                phrase = '"' + search_term.replace('"', '""') + '"'
+                if include_messages:
+                    cursor.execute('''
+                        SELECT v.* FROM (
+                            SELECT rowid AS id, rank FROM ioc_fts WHERE ioc_fts MATCH :phrase
+                            UNION ALL
+                            SELECT i.id, f.rank FROM message_fts f
+                            JOIN iocs i ON i.message_ref = f.rowid
+                            WHERE message_fts MATCH :phrase
+                        ) hits
+                        JOIN ioc_view v ON v.id = hits.id
+                        GROUP BY v.id
+                        ORDER BY MIN(hits.rank), v.id DESC
+                        LIMIT :limit OFFSET :offset
+                    ''', {'phrase': phrase, 'limit': limit, 'offset': offset})
+                else:
+                    cursor.execute('''
+                        SELECT v.* FROM ioc_fts f
+                        JOIN ioc_view v ON v.id = f.rowid
+                        WHERE ioc_fts MATCH ?
+                        ORDER BY f.rank, v.id DESC
+                        LIMIT ? OFFSET ?
+                    ''', (phrase, limit, offset))
+                
+                return [ioc_dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
-            print(f"Database error: {e}")
+            log.error("Database error: %s", e)
             return []
     
-    def export_to_csv(self, filename: str = "iocs_export.csv") -> bool:
-        """Export IOCs to CSV file."""
+    @instrumented
+    def lookup_ioc(self, value: str, ioc_type: Optional[str] = None,
+                   limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Find every sighting of an exact indicator, however it was written.
+        
+        The value is canonicalized (refanged, lowercased, ...) and answered
+        with a single probe of idx_ioc_key, so "hxxp://Evil[.]com" finds
+        rows stored as "http://evil.com".
+        
+        Args:
+            value: The indicator to look up
+            ioc_type: Restrict to one type; otherwise the value is looked up
+                as every type
+            limit: Maximum number of sightings
+            
+        Returns:
+            List of IOC records as dictionaries, newest first
+        """
+        types = [ioc_type] if ioc_type else list(IOC_TYPES)
+        keys = [(canonicalize(value, t), t) for t in types]
         try:
-            import csv
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                conditions = ' OR '.join('(i.ioc_key = ? AND i.ioc_type = ?)' for _ in keys)
+                cursor.execute(f'''
+                    SELECT v.* FROM iocs i
+                    JOIN ioc_view v ON v.id = i.id
+                    WHERE {conditions}
+                    ORDER BY i.detected_at DESC, i.id DESC
+                    LIMIT ?
+                ''', [part for key in keys for part in key] + [limit])
+                return [ioc_dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return []
+    
+    def lookup_many(self, values: Iterable[str], ioc_type: Optional[str] = None,
+                    chunk_size: int = 300) -> Iterator[Dict[str, Any]]:
+        """
+        Look up a large batch of indicators, yielding one result per value.
+        
+        Values are canonicalized as in lookup_ioc and matched against
+        ioc_summary in chunks, one IN list over its primary key per chunk, so
+        the cost grows with the batch rather than the table. Input is
+        consumed lazily and blank values are skipped.
+        
+        Args:
+            values: Indicators to look up (defanged forms are fine)
+            ioc_type: Restrict to one type; otherwise each value is tried as
+                every type
+            chunk_size: Values per query (each is up to three keys, which
+                keeps the default under SQLite's old 999-parameter limit)
+            
+        Yields:
+            Dicts in input order: value, seen, and hits, a list with one
+            summary per matching type (as returned by get_unique_iocs) plus
+            chat_ids, the chats it was seen in
+            
+        Raises:
+            sqlite3.Error: If a query fails
+        """
+        types = [ioc_type] if ioc_type else list(IOC_TYPES)
+        batch = []
+        for value in values:
+            value = value.strip()
+            if value:
+                batch.append(value)
+            if len(batch) >= chunk_size:
+                yield from self._lookup_chunk(batch, types)
+                batch = []
+        if batch:
+            yield from self._lookup_chunk(batch, types)
+    
+    def _lookup_chunk(self, values: List[str], types: List[str]) -> Iterator[Dict[str, Any]]:
+        wanted = [[(canonicalize(value, t), t) for t in types] for value in values]
+        keys = sorted({key for candidates in wanted for key, _ in candidates})
+        
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            # One snapshot for both queries, so every chat row has its summary
+            cursor.execute('BEGIN')
+            cursor.execute(f'''
+                SELECT ioc_value, ioc_key, ioc_type, first_seen, last_seen, sightings, chats
+                FROM ioc_summary WHERE ioc_key IN ({', '.join('?' for _ in keys)})
+            ''', keys)
+            hits = {(row['ioc_key'], row['ioc_type']): dict(row, chat_ids=[]) for row in cursor.fetchall()}
+            
+            found = sorted({key for key, _ in hits})
+            if found:
+                cursor.execute(f'''
+                    SELECT ioc_key, ioc_type, chat_id FROM iocs
+                    WHERE ioc_key IN ({', '.join('?' for _ in found)}) AND chat_id IS NOT NULL
+                    GROUP BY ioc_key, ioc_type, chat_id
+                ''', found)
+                for ioc_key, ioc_type, chat_id in cursor.fetchall():
+                    if (ioc_key, ioc_type) in hits:
+                        hits[(ioc_key, ioc_type)]['chat_ids'].append(chat_id)
+            cursor.execute('COMMIT')
+        
+        for value, candidates in zip(values, wanted):
+            matches = [hits[candidate] for candidate in candidates if candidate in hits]
+            yield {'value': value, 'seen': bool(matches), 'hits': matches}
+    
+    def iter_export_rows(self, ioc_type: Optional[str] = None, chat_id: Optional[int] = None,
+                         since: Optional[str] = None, until: Optional[str] = None,
+                         chunk_size: int = 1000) -> Iterator[tuple]:
+        """
+        Yield IOC rows for export, newest first, in EXPORT_HEADER column order.
+        
+        Rows are read with fetchmany, so memory use doesn't grow with the
+        size of the table. A read connection is held until the generator is
+        exhausted or closed.
+        """
+        conditions, params = ioc_filters(ioc_type, chat_id, since, until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        with self._read() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = chunk_size
+            cursor.execute(f'''
+                SELECT v.* FROM iocs i
+                JOIN ioc_view v ON v.id = i.id
+                {where}
+                ORDER BY i.detected_at DESC, i.id DESC
+            ''', params)
+            
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[:6] + (unpack_message(row[6]),) + row[7:]
+    
+    def iter_csv_export(self, ioc_type: Optional[str] = None, chat_id: Optional[int] = None,
+                        since: Optional[str] = None, until: Optional[str] = None,
+                        compress: bool = False, chunk_size: int = 1000) -> Iterator[bytes]:
+        """
+        Stream IOCs as CSV (UTF-8 bytes), optionally gzip-compressed.
+        
+        Args:
+            ioc_type: Filter by IOC type ('ip', 'domain', 'url')
+            chat_id: Filter by Telegram chat ID
+            since: Only IOCs detected at or after this ISO date/time
+            until: Only IOCs detected before this ISO date/time
+            compress: gzip the output on the fly
+            chunk_size: Rows per database fetch and per yielded chunk
+        """
+        def chunks():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_HEADER)
             
-            with sqlite3.connect(self.db_path) as conn:
+            rows = 0
+            for row in self.iter_export_rows(ioc_type, chat_id, since, until, chunk_size):
+                writer.writerow(row)
+                rows += 1
+                if rows % chunk_size == 0:
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode('utf-8')
+        
+        return gzip_stream(chunks()) if compress else chunks()
+    
+    def archive_month(self, month: str, directory: str = ARCHIVE_DIR, chunk_size: int = 5000) -> int:
+        """
+        Move one calendar month of IOCs out of the database into a compressed archive.
+        
+        The month is first exported to `directory`/iocs-YYYY-MM.csv.gz (in
+        export_to_csv format) and made durable, then deleted in chunks of
+        `chunk_size` rows per transaction so the collector is never blocked
+        for long. Triggers keep the counters, rollups, summary and search
+        index consistent, and messages left without IOCs are removed too. If
+        interrupted, running it again finishes the deletion without
+        rewriting the archive.
+        
+        Args:
+            month: 'YYYY-MM', UTC like detected_at; must be over
+            directory: Archive directory
+            chunk_size: Rows deleted per transaction
+            
+        Returns:
+            Number of IOC rows removed
+            
+        Raises:
+            ValueError: If the month is malformed or not over yet
+            OSError: If the archive can't be written
+            sqlite3.Error: If the database can't be updated
+        """
+        start, end = month_bounds(month)
+        if end > datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'):
+            raise ValueError(f"{month} is not over yet")
+        
+        with self._read() as conn:
+            recorded = conn.execute('SELECT last_id FROM archived_months WHERE month = ?',
+                                    (month,)).fetchone()
+        
+        if recorded is None:
+            # Rows stored after this point aren't in the archive, so they stay
+            last_id = self.get_last_id()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.abspath(os.path.join(directory, f'iocs-{month}.csv.gz'))
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                for chunk in self.iter_csv_export(since=start, until=end, compress=True):
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            
+            with self._transaction() as conn:
+                conn.execute('INSERT INTO archived_months (month, path, last_id) VALUES (?, ?, ?)',
+                             (month, path, last_id))
+        else:
+            last_id = recorded[0]
+        
+        removed = 0
+        while True:
+            with self._transaction() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM iocs ORDER BY detected_at DESC')
+                cursor.execute('''
+                    SELECT id, message_ref FROM iocs
+                    WHERE detected_at >= ? AND detected_at < ? AND id <= ?
+                    LIMIT ?
+                ''', (start, end, last_id, chunk_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
                 
-                with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile)
-                    
-                    # Write header
-                    writer.writerow([
-                        'ID', 'IOC Value', 'IOC Type', 'Chat ID', 'Chat Title',
-                        'Message ID', 'Message Content', 'Sender ID', 'Sender Username',
-                        'Detected At'
-                    ])
+                cursor.executemany('DELETE FROM iocs WHERE id = ?', [(row[0],) for row in rows])
+                refs = {row[1] for row in rows if row[1] is not None}
+                cursor.executemany('''
+                    DELETE FROM messages
+                    WHERE id = ? AND NOT EXISTS (SELECT 1 FROM iocs WHERE message_ref = messages.id)
+                ''', [(ref,) for ref in refs])
+                cursor.execute('UPDATE archived_months SET rows = rows + ? WHERE month = ?',
+                               (len(rows), month))
+            removed += len(rows)
+        
+        return removed
+    
+    def restore_archive(self, path: str, batch_size: int = 5000) -> int:
+        """
+        Load an archive written by archive_month back into the database.
+        
+        Rows keep their original ids and timestamps, so restoring twice (or
+        a month that was only partly deleted) adds nothing twice. Chat titles
+        and usernames from the archive only fill in unknown ones.
+        
+        Args:
+            path: iocs-YYYY-MM.csv.gz file
+            batch_size: Rows per transaction
+            
+        Returns:
+            Number of IOC rows added
+            
+        Raises:
+            ValueError: If the file isn't an IOC export
+            OSError: If it can't be read
+            sqlite3.Error: If the database can't be updated
+        """
+        def optional_int(value: str) -> Optional[int]:
+            return int(value) if value else None
+        
+        restored = 0
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            if next(reader, None) != EXPORT_HEADER:
+                raise ValueError(f"{path} is not an IOC export")
+            
+            while True:
+                rows = [row for _, row in zip(range(batch_size), reader)]
+                if not rows:
+                    break
+                records = [
+                    IOCRecord(row[1], row[2], optional_int(row[3]), row[4] or None, optional_int(row[5]),
+                              row[6] or None, optional_int(row[7]), row[8] or None)
+                    for row in rows
+                ]
+                with self._transaction() as conn:
+                    cursor = conn.cursor()
+                    refs = store_messages(cursor, records, self.compress_messages, update_names=False)
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO iocs (id, ioc_value, ioc_key, ioc_type, message_ref, detected_at, chat_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', [(int(row[0]), record.ioc_value, canonicalize(record.ioc_value, record.ioc_type),
+                           record.ioc_type, ref, row[9], record.chat_id)
+                          for row, record, ref in zip(rows, records, refs)])
+                    restored += cursor.rowcount
+        
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM archived_months WHERE path = ?', (os.path.abspath(path),))
+        return restored
+    
+    def import_iocs(self, rows: Iterable[Tuple[IOCRecord, Optional[str]]], source: str,
+                    batch_size: int = 50000, rebuild_indexes: bool = False,
+                    progress: Optional[Callable[[int, int, float], None]] = None) -> Tuple[int, int]:
+        """
+        Bulk-load IOCs from an external feed.
+        
+        Rows are inserted with one prepared statement per batch of
+        `batch_size`, sorted by canonical key so index updates stay local.
+        Records without a message of their own are attached to a single
+        message named after `source`, so importing the same feed again adds
+        nothing twice. Chat titles and usernames only fill in unknown ones.
+        
+        With rebuild_indexes, the insert triggers and secondary indexes are
+        dropped while loading. At the end the indexes are recreated and the
+        counters, rollups, summary and search indexes are brought up to date
+        with a few set-based statements over the new rows
+        (apply_insert_triggers). That is much faster for large loads, but the
+        whole import becomes a single transaction that holds the write lock
+        until it finishes.
+        
+        Args:
+            rows: (record, detected_at) pairs; detected_at is 'YYYY-MM-DD
+                HH:MM:SS' or None for the time of the import
+            source: Feed name, stored as the content of its message
+            batch_size: Rows per statement (and per transaction without
+                rebuild_indexes)
+            rebuild_indexes: Drop and rebuild indexes and triggers
+            progress: Called with (rows read, new IOCs, elapsed seconds) after each batch
+        
+        Returns:
+            Tuple of (rows read, new IOCs stored)
+        
+        Raises:
+            sqlite3.Error: If the database can't be updated (batches
+                committed before the failure are kept unless rebuild_indexes
+                was set)
+        """
+        content = f"Imported from {source}"
+        started = time.monotonic()
+        read = added = 0
+        feed_ref = None
+        
+        with ExitStack() as stack:
+            if rebuild_indexes:
+                cursor = stack.enter_context(self._transaction()).cursor()
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM iocs')
+                last_id = cursor.fetchone()[0]
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM messages')
+                last_message = cursor.fetchone()[0]
+                for name in BULK_LOAD_TRIGGERS:
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+                for name in BULK_LOAD_INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {name}')
+            
+            rows = iter(rows)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                with self._transaction() as conn:
+                    cursor = conn.cursor()
+                    if feed_ref is None:
+                        cursor.execute('''
+                            SELECT id FROM messages
+                            WHERE chat_id IS NULL AND message_id IS NULL AND content = ?
+                        ''', (content,))
+                        row = cursor.fetchone()
+                        if row is None:
+                            cursor.execute('INSERT INTO messages (content) VALUES (?)', (content,))
+                            feed_ref = cursor.lastrowid
+                        else:
+                            feed_ref = row[0]
                     
-                    # Write data
-                    writer.writerows(cursor.fetchall())
-                
-                return True
+                    records = [record for record, _ in batch]
+                    refs = store_messages(cursor, records, self.compress_messages, update_names=False)
+                    values = sorted(
+                        (canonicalize(record.ioc_value, record.ioc_type), record.ioc_type,
+                         record.ioc_value, feed_ref if ref is None else ref, detected_at, record.chat_id)
+                        for (record, detected_at), ref in zip(batch, refs))
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO iocs (ioc_key, ioc_type, ioc_value, message_ref, detected_at, chat_id)
+                        VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+                    ''', values)
+                    added += cursor.rowcount
+                read += len(batch)
+                if progress:
+                    progress(read, added, time.monotonic() - started)
+            
+            if rebuild_indexes:
+                create_schema(cursor)
+                apply_insert_triggers(cursor, last_id, last_message)
+        
+        return read, added
+    
+    def get_archived_months(self) -> List[Dict[str, Any]]:
+        """List archived months (month, path, rows, archived_at), oldest first."""
+        try:
+            with self._read() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                cursor.execute('SELECT month, path, rows, archived_at FROM archived_months ORDER BY month')
+                return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            log.error("Database error: %s", e)
+            return []
+    
+    def apply_retention(self, months: int, directory: str = ARCHIVE_DIR) -> Dict[str, int]:
+        """
+        Archive every month that ended more than `months` full months ago, then reclaim the space.
+        
+        Months with data are found from the daily rollup, not the iocs table.
+        
+        Args:
+            months: Number of complete months to keep besides the current one
+            directory: Archive directory
+            
+        Returns:
+            {month: rows removed} for each month archived
+            
+        Raises:
+            OSError, sqlite3.Error: As archive_month
+        """
+        now = datetime.utcnow()
+        year, month = divmod(now.year * 12 + now.month - 1 - months, 12)
+        cutoff = f'{year:04d}-{month + 1:02d}-01'
+        
+        with self._read() as conn:
+            expired = [row[0] for row in conn.execute('''
+                SELECT DISTINCT substr(day, 1, 7) FROM ioc_daily WHERE day < ? AND count > 0 ORDER BY 1
+            ''', (cutoff,))]
+        
+        archived = {month: self.archive_month(month, directory) for month in expired}
+        if archived:
+            self.reclaim_space()
+        return archived
+    
+    def reclaim_space(self) -> int:
+        """
+        Return free pages to the OS.
+        
+        Full-text index segments are merged first, since deleted rows
+        linger there until then. Then incremental vacuum moves free pages to
+        the end of the file and truncates it. A database created before
+        auto_vacuum was enabled gets one full VACUUM to convert it.
+        
+        Returns:
+            Number of pages freed
+            
+        Raises:
+            sqlite3.Error: If the vacuum fails
+        """
+        if self.has_search_index:
+            with self._transaction() as conn:
+                conn.execute("INSERT INTO ioc_fts (ioc_fts) VALUES ('optimize')")
+                conn.execute("INSERT INTO message_fts (message_fts) VALUES ('optimize')")
+        
+        with self._pool.connection() as conn:
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            else:
+                # execute() stops after the first freed page; a script runs it to completion
+                conn.executescript('PRAGMA incremental_vacuum')
+            freed = free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # The file only shrinks once the WAL is checkpointed into it
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            return freed
+    
+    def export_to_csv(self, filename: str = "iocs_export.csv", ioc_type: Optional[str] = None,
+                      chat_id: Optional[int] = None, since: Optional[str] = None,
+                      until: Optional[str] = None, compress: bool = False) -> bool:
+        """Export IOCs to CSV file ('-' writes to stdout), streaming in constant memory."""
+        try:
+            chunks = self.iter_csv_export(ioc_type, chat_id, since, until, compress)
+            
+            if filename == '-':
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+            else:
+                with open(filename, 'wb') as csvfile:
+                    for chunk in chunks:
+                        csvfile.write(chunk)
+            
+            return True
         except Exception as e:
-            print(f"Export error: {e}")
+            log.error("Export error: %s", e)
             return False
 
 
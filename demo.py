@@ -34,13 +34,13 @@ def demo_database():
         ("suspicious.ru", "domain", "Demo Russian domain"),
     ]
     
-    for ioc_value, ioc_type, description in demo_iocs:
+    for i, (ioc_value, ioc_type, description) in enumerate(demo_iocs):
         success = db.save_ioc(
             ioc_value=ioc_value,
             ioc_type=ioc_type,
             chat_id=999999,
             chat_title="Demo Chat",
-            message_id=12345,
+            message_id=12345 + i,
             message_content=f"Demo message containing {description}",
             sender_id=123,
             sender_username="demo_user"
@@ -116,14 +116,14 @@ def demo_analytics(db):
     print(f"\n📈 Analytics Demo")
     print("=" * 50)
     
-    # Get unique IOCs by type
+    # Most sighted unique IOCs by type
     for ioc_type in ['ip', 'domain', 'url']:
-        unique_iocs = db.get_unique_iocs(ioc_type)
-        print(f"📊 Unique {ioc_type.upper()}s: {len(unique_iocs)}")
-        if unique_iocs:
-            print(f"   Examples: {', '.join(unique_iocs[:3])}")
-            if len(unique_iocs) > 3:
-                print(f"   ... and {len(unique_iocs) - 3} more")
+        unique_iocs, more = db.get_unique_iocs(ioc_type, sort='sightings', limit=3)
+        print(f"📊 Top {ioc_type.upper()}s:")
+        for ioc in unique_iocs:
+            print(f"   {ioc['ioc_key']} ({ioc['sightings']} sightings in {ioc['chats']} chat(s))")
+        if more:
+            print("   ... and more")
     
     # Recent activity
     recent_iocs = db.get_iocs(limit=10)
@@ -159,6 +159,8 @@ def show_cli_info():
     print("   python ioc_manager.py search <term>  # Search for specific IOCs")
     print("   python ioc_manager.py export         # Export to CSV")
     print("   python ioc_manager.py unique         # Show unique IOCs")
+    print("   python ioc_manager.py reindex        # Rebuild the search index")
+    print("   python ioc_manager.py migrate        # Upgrade an old database")
     print("\nMain monitoring script:")
     print("   python main.py                       # Start Telegram monitoring")
 
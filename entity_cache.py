@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _LoaderCancelled(Exception):
+    """The task running a shared lookup was cancelled; its waiters retry on their own."""
+
+
+class EntityCache:
+    """
+    Bounded async cache for Telegram entity lookups (chat titles, usernames).
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted once `max_size` is reached. Concurrent misses for the same key
+    share a single lookup.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size: Maximum number of cached entries
+            ttl: Seconds before an entry is looked up again
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for `key`, calling `loader` on a miss.
+
+        Args:
+            key: Cache key, e.g. ("chat", chat_id)
+            loader: Coroutine function producing the value
+
+        Returns:
+            The cached or freshly loaded value. Exceptions from `loader`
+            propagate and nothing is cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            if time.monotonic() < expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        # Another task is already resolving this key
+        pending = self._pending.get(key)
+        if pending is not None:
+            try:
+                value = await asyncio.shield(pending)
+            except _LoaderCancelled:
+                # Only the task running the lookup was cancelled, not this one
+                return await self.get(key, loader)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.set_exception(_LoaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            # Unless invalidate() dropped it, or a newer lookup replaced it
+            current = self._pending.get(key) is future
+            if current:
+                del self._pending[key]
+
+        future.set_result(value)
+        if current:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Hashable):
+        """
+        Drop `key` so the next lookup goes back to Telegram.
+
+        A lookup already in flight still answers its callers, but its result
+        (possibly read before the change) is not cached.
+        """
+        self._entries.pop(key, None)
+        self._pending.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
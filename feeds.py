@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+import csv
+import gzip
+import io
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from database import EXPORT_HEADER, IOCDatabase, IOCRecord
+from ingest import JSONStreamReader
+from ioc_extractor import IOC, IOCExtractor
+
+
+FEED_FORMATS = ("text", "csv", "export", "stix")
+
+# Column names (lowercase) that hold the indicator or its first sighting in third-party CSV feeds
+VALUE_COLUMNS = ("ioc_value", "ioc value", "ioc", "indicator", "value", "url", "domain", "hostname",
+                 "host", "ip", "ip_address", "dst_ip")
+TIME_COLUMNS = ("first_seen", "first_seen_utc", "firstseen", "dateadded", "date_added", "detected_at",
+                "timestamp", "created", "date")
+
+# Comparison expressions of a STIX pattern, e.g. [domain-name:value = 'evil.com']
+STIX_PATTERN = re.compile(r"(?:ipv4-addr|domain-name|hostname|url):value\s*=\s*'((?:[^'\\]|\\.)*)'")
+STIX_TIME_FIELDS = ("valid_from", "first_seen", "created", "timestamp")
+
+FeedRow = Tuple[IOCRecord, Optional[str]]
+
+
+class ImportResult(NamedTuple):
+    """Outcome of importing one feed."""
+    indicators: int  # valid indicators read
+    new_iocs: int
+    rejected: int  # values the extractor did not accept
+    seconds: float
+
+
+def feed_timestamp(value: Any) -> Optional[str]:
+    """Convert an ISO 8601 date/time (any offset) to the UTC 'YYYY-MM-DD HH:MM:SS' form stored by SQLite."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _optional_int(value: str) -> Optional[int]:
+    return int(value) if value else None
+
+
+def _data_lines(f: TextIO) -> Tuple[Iterator[str], Optional[str]]:
+    """Skip a feed's leading comment block; return the remaining lines and the last comment."""
+    comment = None
+    for line in f:
+        if line.startswith("#"):
+            comment = line.lstrip("#").strip() or comment
+        elif line.strip():
+            return _prepend(line, f), comment
+    return iter(()), comment
+
+
+def _prepend(first: str, rest: Iterable[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+class FeedParser:
+    """
+    Stream indicators out of feed files.
+
+    Every value goes through the collector's extractor, so only what the
+    collector would have stored is imported (TLD-checked domains, defanged
+    forms accepted, trailing punctuation stripped). Values it rejects are
+    counted in `rejected`.
+    """
+
+    def __init__(self, extractor: IOCExtractor):
+        self.extractor = extractor
+        self.rejected = 0
+
+    def _indicators(self, value: Any) -> List[IOC]:
+        if not isinstance(value, str):
+            return []  # e.g. STIX objects other than indicators and observables
+        iocs = self.extractor.extract(value)
+        if not iocs:
+            self.rejected += 1
+        return iocs
+
+    def text(self, f: TextIO) -> Iterator[FeedRow]:
+        """One or more indicators per line; blank lines and #, ; or // comments are skipped."""
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(("#", ";", "//")):
+                continue
+            for ioc in self._indicators(line):
+                yield IOCRecord(ioc.value, ioc.type), None
+
+    def csv(self, f: TextIO) -> Iterator[FeedRow]:
+        """
+        Indicators from a CSV feed.
+
+        The indicator column is found by name in the header row (or in the
+        last line of a leading # comment block, as in abuse.ch feeds), along
+        with an optional first-seen column. Without a recognizable header,
+        every cell is scanned.
+        """
+        lines, comment = _data_lines(f)
+        reader = csv.reader(lines)
+        first = next(reader, None)
+        if first is None:
+            return
+
+        header = [name.strip().lower() for name in first]
+        if not any(name in VALUE_COLUMNS for name in header):
+            # The first row is data
+            reader = _prepend(first, reader)
+            header = [name.strip().lower() for name in next(csv.reader([comment]))] if comment else []
+
+        value_column = next((header.index(name) for name in VALUE_COLUMNS if name in header), None)
+        time_column = next((header.index(name) for name in TIME_COLUMNS if name in header), None)
+
+        for row in reader:
+            if value_column is None:
+                iocs = self._indicators(" ".join(row))
+            elif value_column < len(row):
+                iocs = self._indicators(row[value_column])
+            else:
+                continue
+            detected_at = None
+            if time_column is not None and time_column < len(row):
+                detected_at = feed_timestamp(row[time_column])
+            for ioc in iocs:
+                yield IOCRecord(ioc.value, ioc.type), detected_at
+
+    def export(self, f: TextIO) -> Iterator[FeedRow]:
+        """
+        Rows of this project's own CSV export (export_to_csv, archive files).
+
+        Chats, messages and timestamps are kept; rows whose value doesn't
+        extract as its recorded type are rejected.
+        """
+        reader = csv.reader(f)
+        if next(reader, None) != EXPORT_HEADER:
+            raise ValueError("Not an IOC export: unexpected header")
+        for row in reader:
+            if IOC(row[1], row[2]) not in self.extractor.extract(row[1]):
+                self.rejected += 1
+                continue
+            yield (IOCRecord(row[1], row[2], _optional_int(row[3]), row[4] or None, _optional_int(row[5]),
+                             row[6] or None, _optional_int(row[7]), row[8] or None),
+                   row[9] or None)
+
+    def stix(self, f: TextIO) -> Iterator[FeedRow]:
+        """
+        Indicators from STIX-like JSON, read one object at a time.
+
+        Accepts a bundle ({"objects": [...]}), a bare array or a single
+        object. Indicator objects contribute the values compared in their
+        pattern; observables and other objects their "value" (or
+        "indicator"); plain strings are taken as values. The first of
+        valid_from, first_seen, created and timestamp is the sighting time.
+        """
+        for item in _json_objects(JSONStreamReader(f)):
+            if isinstance(item, dict):
+                if isinstance(item.get("pattern"), str):
+                    values = [re.sub(r"\\(.)", r"\1", value) for value in STIX_PATTERN.findall(item["pattern"])]
+                else:
+                    values = [item.get("value", item.get("indicator"))]
+                detected_at = next((feed_timestamp(item[field]) for field in STIX_TIME_FIELDS
+                                    if item.get(field)), None)
+            else:
+                values, detected_at = [item], None
+            for value in values:
+                for ioc in self._indicators(value):
+                    yield IOCRecord(ioc.value, ioc.type), detected_at
+
+
+def _json_objects(reader: JSONStreamReader) -> Iterator[Any]:
+    char = reader.peek()
+    if char == "[":
+        yield from _json_array(reader)
+        return
+
+    # An object: a bundle if it has an "objects" array, otherwise a single item
+    reader.take("{")
+    item = {}
+    bundle = False
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        reader.take(":")
+        if key == "objects" and reader.peek() == "[":
+            bundle = True
+            yield from _json_array(reader)
+        else:
+            item[key] = reader.value()
+        char = reader.peek()
+        reader.pos += 1
+        if char == "}":
+            break
+        if char != ",":
+            raise ValueError(f"Expected ',' or '}}', found {char or 'end of file'!r}")
+    if not bundle:
+        yield item
+
+
+def _json_array(reader: JSONStreamReader) -> Iterator[Any]:
+    reader.take("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        char = reader.peek()
+        reader.pos += 1
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or ']', found {char or 'end of file'!r}")
+
+
+def open_feed(path: str) -> TextIO:
+    """Open a feed for reading as text; '-' is stdin and .gz files are decompressed."""
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace", newline="")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, encoding="utf-8", errors="replace", newline="")
+
+
+def detect_format(path: str, f: TextIO) -> str:
+    """Guess a feed's format from its name and, for CSV, its first line (the stream is rewound)."""
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension in (".json", ".stix"):
+        return "stix"
+    if extension == ".csv":
+        first = f.readline()
+        f.seek(0)
+        return "export" if next(csv.reader([first]), None) == EXPORT_HEADER else "csv"
+    return "text"
+
+
+def import_feed(db: IOCDatabase, path: str, extractor: IOCExtractor, format: Optional[str] = None,
+                source: Optional[str] = None, batch_size: int = 50000, rebuild_indexes: bool = False,
+                progress: Optional[Callable[[int, int, float], None]] = None) -> ImportResult:
+    """
+    Validate and bulk-load the indicators in a feed file.
+
+    The file is parsed as a stream and stored by IOCDatabase.import_iocs, so
+    memory use doesn't depend on its size.
+
+    Args:
+        db: Database to write to
+        path: Feed file ('-' for stdin, which needs `format`)
+        extractor: Extractor with the collector's TLD list
+        format: One of FEED_FORMATS (default: guessed from the file)
+        source: Name the sightings are recorded under (default: the file name)
+        batch_size: Rows per insert batch
+        rebuild_indexes: Drop and rebuild indexes and triggers around the load
+        progress: Called with (rows read, new IOCs, elapsed seconds) after each batch
+
+    Returns:
+        ImportResult with the counts and elapsed time
+
+    Raises:
+        ValueError: If the file doesn't match its format
+        OSError: If it can't be read
+        sqlite3.Error: If the database can't be updated
+    """
+    started = time.monotonic()
+    parser = FeedParser(extractor)
+    with open_feed(path) as f:
+        if format is None:
+            format = "text" if path == "-" else detect_format(path, f)
+        rows = getattr(parser, format)(f)
+        source = source or ("stdin" if path == "-" else os.path.basename(path))
+        indicators, new_iocs = db.import_iocs(rows, source, batch_size=batch_size,
+                                              rebuild_indexes=rebuild_indexes, progress=progress)
+    return ImportResult(indicators, new_iocs, parser.rejected, time.monotonic() - started)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from database import IOCDatabase, IOCRecord
+from ioc_extractor import IOC, IOCExtractor
+
+
+# Telegram Desktop exports use bare IDs; live events use Bot API style "marked" IDs
+CHANNEL_TYPES = ("public_channel", "private_channel", "public_supergroup", "private_supergroup")
+_WHITESPACE = re.compile(r"\s*")
+# Longest partial token that can still end the buffer mid-value ("-Infinit", "\ud83d\u")
+_PARTIAL_TOKEN = 12
+
+
+class JSONStreamReader:
+    """
+    Read a JSON document piece by piece from a text file.
+
+    Only the current value is ever decoded, so memory stays bounded by the
+    largest single value (one message) instead of the file size. Malformed
+    input raises as soon as it is seen; a value still incomplete after
+    `max_value_size` characters raises too.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 20, max_value_size: int = 64 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, expected: str):
+        """Consume one structural character."""
+        char = self.peek()
+        if char != expected:
+            raise ValueError(f"Expected {expected!r}, found {char or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Only a value cut off by the end of the buffer can be fixed by reading on
+                incomplete = e.pos >= len(self.buffer) - _PARTIAL_TOKEN or e.msg.startswith("Unterminated string")
+                if not incomplete or not self._fill():
+                    raise
+                if len(self.buffer) - self.pos > self.max_value_size:
+                    raise ValueError(f"JSON value longer than {self.max_value_size} characters") from e
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _walk_object(reader: JSONStreamReader) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    # Scalar fields seen so far describe the chat a "messages" array belongs to
+    info = {}
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        reader.take(":")
+        char = reader.peek()
+        if key == "messages" and char == "[":
+            yield from _walk_messages(reader, info)
+        elif char == "{":
+            reader.pos += 1
+            yield from _walk_object(reader)
+        elif char == "[":
+            reader.pos += 1
+            yield from _walk_array(reader)
+        else:
+            info[key] = reader.value()
+
+        char = reader.peek()
+        reader.pos += 1
+        if char == "}":
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or '}}', found {char or 'end of file'!r}")
+
+
+def _walk_array(reader: JSONStreamReader) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        char = reader.peek()
+        if char == "{":
+            reader.pos += 1
+            yield from _walk_object(reader)
+        elif char == "[":
+            reader.pos += 1
+            yield from _walk_array(reader)
+        else:
+            reader.value()
+
+        char = reader.peek()
+        reader.pos += 1
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or ']', found {char or 'end of file'!r}")
+
+
+def _walk_messages(reader: JSONStreamReader, chat: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    reader.take("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield chat, reader.value()
+        char = reader.peek()
+        reader.pos += 1
+        if char == "]":
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or ']', found {char or 'end of file'!r}")
+
+
+def iter_export_messages(f: TextIO, chunk_size: int = 1 << 20) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Stream the messages out of a Telegram Desktop JSON export.
+
+    Handles both single-chat exports and full account exports (chats.list,
+    left_chats.list).
+
+    Args:
+        f: The export (result.json) opened in text mode
+        chunk_size: Characters read at a time
+
+    Yields:
+        Tuples of (chat fields such as name/type/id, message object)
+    """
+    reader = JSONStreamReader(f, chunk_size)
+    reader.take("{")
+    yield from _walk_object(reader)
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Flatten an exported message's text, which may be a list of plain and formatted parts."""
+    text = message.get("text", "")
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+    return text or ""
+
+
+def export_chat_id(chat: Dict[str, Any]) -> Optional[int]:
+    """Convert an exported chat's ID to the form Telethon events use."""
+    bare_id = chat.get("id")
+    if bare_id is None:
+        return None
+    if chat.get("type") in CHANNEL_TYPES:
+        return -1000000000000 - bare_id
+    if chat.get("type") == "private_group":
+        return -bare_id
+    return bare_id
+
+
+def export_sender_id(from_id: Optional[str]) -> Optional[int]:
+    """Convert an exported "from_id" ("user123", "channel123", "chat123") to a marked ID."""
+    if not from_id:
+        return None
+    match = re.fullmatch(r"(user|channel|chat)(\d+)", from_id)
+    if match is None:
+        return None
+    kind, bare_id = match.group(1), int(match.group(2))
+    if kind == "channel":
+        return -1000000000000 - bare_id
+    if kind == "chat":
+        return -bare_id
+    return bare_id
+
+
+# Worker process state, set up once by the pool initializer
+_extractor: Optional[IOCExtractor] = None
+
+
+def _init_worker(tlds: List[str]):
+    global _extractor
+    _extractor = IOCExtractor(tlds)
+
+
+def _extract_batch(texts: List[str]) -> List[List[IOC]]:
+    return [_extractor.extract(text) for text in texts]
+
+
+def _batches(f: TextIO, batch_size: int) -> Iterator[List[Tuple]]:
+    batch = []
+    for chat, message in iter_export_messages(f):
+        if message.get("type") != "message":
+            continue
+        text = message_text(message)
+        if not text:
+            continue
+        batch.append((export_chat_id(chat), chat.get("name"), message.get("id"), text,
+                      export_sender_id(message.get("from_id"))))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_export(db: IOCDatabase, path: str, tlds: Iterable[str], processes: Optional[int] = None,
+                  batch_size: int = 2000, progress: Optional[Callable[[int, int, float], None]] = None
+                  ) -> Tuple[int, int]:
+    """
+    Extract and store the IOCs in a Telegram Desktop JSON export.
+
+    The file is parsed incrementally in this process while batches of
+    message text are extracted by a pool of worker processes; at most two
+    batches per worker are in flight, so memory stays bounded. Each batch
+    is saved in one transaction.
+
+    Args:
+        db: Database to write to
+        path: Path to the export's result.json
+        tlds: Valid top-level domains for the extractor
+        processes: Worker processes (default: CPU count; 1 extracts inline)
+        batch_size: Messages per batch
+        progress: Called with (messages, new IOCs, elapsed seconds) after each batch
+
+    Returns:
+        Tuple of (text messages processed, new IOCs stored)
+    """
+    tlds = list(tlds)
+    processes = processes or os.cpu_count() or 1
+    messages = 0
+    new_iocs = 0
+    started = time.monotonic()
+
+    def save(batch, results):
+        nonlocal messages, new_iocs
+        records = [
+            IOCRecord(ioc.value, ioc.type, chat, title, message_id, text, sender, None)
+            for (chat, title, message_id, text, sender), iocs in zip(batch, results)
+            for ioc in iocs
+        ]
+        new_iocs += sum(db.save_iocs(records))
+        messages += len(batch)
+        if progress:
+            progress(messages, new_iocs, time.monotonic() - started)
+
+    with open(path, encoding="utf-8") as f:
+        if processes == 1:
+            _init_worker(tlds)
+            for batch in _batches(f, batch_size):
+                save(batch, _extract_batch([item[3] for item in batch]))
+        else:
+            with multiprocessing.Pool(processes, _init_worker, (tlds,)) as pool:
+                in_flight = deque()
+                for batch in _batches(f, batch_size):
+                    in_flight.append((batch, pool.apply_async(_extract_batch, ([item[3] for item in batch],))))
+                    if len(in_flight) >= processes * 2:
+                        done, result = in_flight.popleft()
+                        save(done, result.get())
+                while in_flight:
+                    done, result = in_flight.popleft()
+                    save(done, result.get())
+
+    return messages, new_iocs
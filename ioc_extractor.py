@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+import re
+from bisect import bisect_right
+from typing import Iterable, List, NamedTuple, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+
+IOC_TYPES = ("ip", "domain", "url")
+
+
+class IOC(NamedTuple):
+    """An indicator found in a message."""
+    value: str
+    type: str  # one of IOC_TYPES
+
+
+# A single alternation so every message is scanned exactly once. Matches may
+# only start after whitespace or punctuation, which keeps the scan cheap on
+# plain chatter. Domains and IPs must also end on a delimiter (a trailing full
+# stop is fine), URLs run until the next whitespace or quote.
+_OCTET = r"(?:25[0-5]|2[0-4][0-9]|[0-1]?[0-9]{1,2})"
+IOC_PATTERN = re.compile(rf"""
+    (?<![\w.-])
+    (?:
+        (?P<url>https?://[^\s<>"'`]+)
+      | (?P<ip>(?:{_OCTET}\.){{3}}{_OCTET})(?![\w-]|\.\w)
+      | (?P<domain>(?:[a-z0-9-]+\.)+(?:[a-z]{{2,}}|xn--[a-z0-9-]+))(?![\w-]|\.\w)
+    )
+""", re.IGNORECASE | re.VERBOSE)
+
+
+# Common ways of "defanging" indicators so they can't be clicked
+DEFANG_PATTERN = re.compile(r"""
+    \[\.\] | \(\.\) | \{\.\} | \[dot\] | \(dot\) | \{dot\}
+  | \[://\] | \[:\] | \[/\] | \bhxxp
+""", re.IGNORECASE | re.VERBOSE)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_TRAILING_PUNCTUATION = ".,;:!?"
+_CLOSING_BRACKETS = {")": "(", "]": "[", "}": "{"}
+_IPV4 = re.compile(rf"(?:{_OCTET}\.){{3}}{_OCTET}")
+
+
+def _maybe_defanged(text: str) -> bool:
+    # Every DEFANG_PATTERN alternative has a bracket, and hxxp is followed by "//"
+    return "[" in text or "(" in text or "{" in text or "//" in text
+
+
+def _refanged(defang: str) -> str:
+    defang = defang.lower()
+    if defang == "hxxp":
+        return "http"
+    if "dot" in defang:
+        return "."
+    return defang[1:-1]
+
+
+def refang(text: str) -> str:
+    """Undo defanging: hxxp:// -> http://, example[.]com -> example.com, ..."""
+    if not _maybe_defanged(text):
+        return text
+    return DEFANG_PATTERN.sub(lambda match: _refanged(match.group()), text)
+
+
+def _refang_with_offsets(text: str) -> Tuple[str, List[int], List[int]]:
+    # Also returns, for every replacement, where it ends in the refanged text
+    # and how many characters shorter the text is from there on
+    pieces = []
+    ends = []
+    shifts = []
+    last = length = shift = 0
+    for match in DEFANG_PATTERN.finditer(text):
+        replacement = _refanged(match.group())
+        pieces.append(text[last:match.start()])
+        pieces.append(replacement)
+        length += match.start() - last + len(replacement)
+        shift += len(match.group()) - len(replacement)
+        ends.append(length)
+        shifts.append(shift)
+        last = match.end()
+    pieces.append(text[last:])
+    return "".join(pieces), ends, shifts
+
+
+def strip_trailing_punctuation(url: str) -> str:
+    """Drop sentence punctuation and unbalanced closing brackets from the end of a URL."""
+    while url:
+        last = url[-1]
+        if last in _TRAILING_PUNCTUATION:
+            url = url[:-1]
+        elif last in _CLOSING_BRACKETS and url.count(last) > url.count(_CLOSING_BRACKETS[last]):
+            url = url[:-1]
+        else:
+            break
+    return url
+
+
+def _canonical_host(host: str) -> str:
+    host = host.rstrip(".").lower()
+    if host.isascii():
+        return host
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+def _canonical_url(url: str) -> str:
+    try:
+        parts = urlsplit(strip_trailing_punctuation(url))
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    netloc = _canonical_host(parts.hostname or "")
+    if ":" in netloc:
+        netloc = f"[{netloc}]"  # IPv6 literal
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc += f":{port}"
+    userinfo = parts.netloc.rpartition("@")[0]
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def canonicalize(value: str, ioc_type: str) -> str:
+    """
+    Canonical form of an indicator, used as its deduplication and lookup key.
+
+    Refangs the value, then: IPs lose leading zeros; domains are lowercased,
+    punycoded and lose a trailing dot; URLs also get a lowercase scheme,
+    lose default ports, fragments and trailing punctuation, and an empty
+    path becomes "/".
+
+    Args:
+        value: The indicator as found (possibly defanged)
+        ioc_type: One of IOC_TYPES
+
+    Returns:
+        The canonical key
+    """
+    return _canonical(refang(value.strip()), ioc_type)
+
+
+def _canonical(value: str, ioc_type: str) -> str:
+    if ioc_type == "ip":
+        if (value.startswith("0") or ".0" in value) and _IPV4.fullmatch(value):
+            return ".".join(str(int(octet)) for octet in value.split("."))
+        return value
+    if ioc_type == "domain":
+        return _canonical_host(value)
+    if ioc_type == "url":
+        return _canonical_url(value)
+    return value
+
+
+def parse_tlds(text: str) -> List[str]:
+    """Parse the IANA tlds-alpha-by-domain.txt format into lowercase TLDs."""
+    return [line.strip().lower() for line in text.splitlines()
+            if line.strip() and not line.startswith("#")]
+
+
+def _shift_at(ends: List[int], shifts: List[int], position: int) -> int:
+    index = bisect_right(ends, position)
+    return shifts[index - 1] if index else 0
+
+
+class IOCExtractor:
+    def __init__(self, tlds: Iterable[str]):
+        """
+        Initialize the extractor.
+
+        Args:
+            tlds: Valid top-level domains, any case, without leading dot
+        """
+        self.update_tlds(tlds)
+
+    def update_tlds(self, tlds: Iterable[str]):
+        """Replace the TLD set; safe while other threads are extracting."""
+        self.tlds = frozenset(tld.strip().lower().lstrip(".") for tld in tlds)
+
+    @staticmethod
+    def may_contain_iocs(text: str) -> bool:
+        """Cheap pre-check: every indicator we recognise contains a dot or a scheme."""
+        if not text:
+            return False
+        return "." in text or "://" in text or (_maybe_defanged(text) and DEFANG_PATTERN.search(text) is not None)
+
+    def extract(self, text: str) -> List[IOC]:
+        """
+        Extract IOCs from a message in a single pass.
+
+        Args:
+            text: Raw message text
+
+        Returns:
+            List of IOCs in order of first appearance, as written in the
+            message; indicators with the same canonical key are reported once
+        """
+        if not self.may_contain_iocs(text):
+            return []
+
+        # Match on refanged text, but report each IOC as it was written
+        ends = shifts = None
+        scanned = text
+        if _maybe_defanged(text) and DEFANG_PATTERN.search(text):
+            scanned, ends, shifts = _refang_with_offsets(text)
+
+        found = []
+        for match in IOC_PATTERN.finditer(scanned):
+            ioc_type = match.lastgroup
+            start, end = match.span(ioc_type)
+            value = scanned[start:end]
+
+            if ioc_type == "url":
+                value = strip_trailing_punctuation(value)
+                end = start + len(value)
+            elif ioc_type == "domain" and value.rsplit(".", 1)[1].lower() not in self.tlds:
+                continue
+
+            raw = value
+            if ends:
+                raw = text[start + _shift_at(ends, shifts, start):end + _shift_at(ends, shifts, end)]
+            found.append((value, IOC(raw, ioc_type)))
+
+        if len(found) < 2:
+            return [ioc for _, ioc in found]
+
+        iocs = []
+        seen = set()
+        for value, ioc in found:
+            key = (_canonical(value, ioc.type), ioc.type)
+            if key not in seen:
+                seen.add(key)
+                iocs.append(ioc)
+        return iocs
+
+
+if __name__ == "__main__":
+    # Quick manual check with a handful of TLDs
+    extractor = IOCExtractor(["com", "net", "ru"])
+    sample = ("C2 at 45.9.148.3, payload https://evil.example.com/x.bin (mirror: evil.ru). notes.txt "
+              "defanged: hxxps://Evil.Example.com/x.bin, 45.9.148[.]3 and evil[dot]ru")
+    for ioc in extractor.extract(sample):
+        print(f"{ioc.type}: {ioc.value} -> {canonicalize(ioc.value, ioc.type)}")
@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
+import sqlite3
 import sys
+import time
 from datetime import datetime
-from database import IOCDatabase
+from database import ARCHIVE_DIR, IOCDatabase, migrate_legacy_schema
+from feeds import FEED_FORMATS, import_feed
+from ingest import ingest_export
+from ioc_extractor import IOCExtractor
+from tld_registry import TLDRegistry
 
 
 def print_table(data, headers):
@@ -37,6 +44,7 @@ def main():
     
     # Stats command
     stats_parser = subparsers.add_parser("stats", help="Show database statistics")
+    stats_parser.add_argument("--recount", action="store_true", help="Rebuild the counters with a full scan first")
     
     # List command
     list_parser = subparsers.add_parser("list", help="List IOCs")
@@ -46,14 +54,77 @@ def main():
     # Search command
     search_parser = subparsers.add_parser("search", help="Search IOCs")
     search_parser.add_argument("term", help="Search term")
+    search_parser.add_argument("--limit", type=int, default=50, help="Maximum number of results")
+    search_parser.add_argument("--offset", type=int, default=0, help="Skip this many results")
+    search_parser.add_argument("--messages", action="store_true", help="Also match message text")
+    
+    # Lookup command
+    lookup_parser = subparsers.add_parser("lookup", help="Find every sighting of an exact IOC (defanged values accepted)")
+    lookup_parser.add_argument("value", nargs="?", help="IOC value, e.g. hxxp://evil[.]com")
+    lookup_parser.add_argument("--file", help="Look up one value per line from this file ('-' for stdin) "
+                                              "and print JSON lines")
+    lookup_parser.add_argument("--type", choices=["ip", "domain", "url"], help="IOC type (default: any)")
+    lookup_parser.add_argument("--limit", type=int, default=50, help="Maximum number of results")
     
     # Export command
     export_parser = subparsers.add_parser("export", help="Export IOCs to CSV")
-    export_parser.add_argument("--output", default="iocs_export.csv", help="Output CSV file")
+    export_parser.add_argument("--output", default="iocs_export.csv", help="Output CSV file ('-' for stdout)")
+    export_parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    export_parser.add_argument("--type", choices=["ip", "domain", "url"], help="Filter by IOC type")
+    export_parser.add_argument("--chat", type=int, help="Filter by chat ID")
+    export_parser.add_argument("--since", help="Only IOCs detected at or after this date/time (ISO format)")
+    export_parser.add_argument("--until", help="Only IOCs detected before this date/time (ISO format)")
     
     # Unique command
     unique_parser = subparsers.add_parser("unique", help="List unique IOCs")
     unique_parser.add_argument("--type", choices=["ip", "domain", "url"], help="Filter by IOC type")
+    unique_parser.add_argument("--sort", choices=["value", "sightings", "recent"], default="value",
+                               help="Order by value, most sighted or most recently seen")
+    unique_parser.add_argument("--limit", type=int, default=100, help="Maximum number of results")
+    unique_parser.add_argument("--cursor", help="Continue after a previous page")
+    
+    # Reindex command
+    reindex_parser = subparsers.add_parser("reindex", help="Rebuild the full-text search index")
+    
+    # Ingest command
+    ingest_parser = subparsers.add_parser("ingest", help="Extract IOCs from a Telegram Desktop JSON export")
+    ingest_parser.add_argument("export", help="Path to the export's result.json")
+    ingest_parser.add_argument("--processes", type=int, help="Extraction worker processes (default: CPU count)")
+    ingest_parser.add_argument("--batch-size", type=int, default=2000, help="Messages per batch")
+    ingest_parser.add_argument("--tld-cache", default="tlds_cache.txt", help="TLD list cache used by the collector")
+    
+    # Import command
+    import_parser = subparsers.add_parser("import", help="Bulk-load indicators from external feeds")
+    import_parser.add_argument("files", nargs="+", help="Feed files ('-' for stdin); .gz files are decompressed")
+    import_parser.add_argument("--format", choices=FEED_FORMATS,
+                               help="text (indicators per line), csv, export (this tool's CSV export) or "
+                                    "stix (STIX-like JSON); default: guessed from the file")
+    import_parser.add_argument("--source", help="Name the sightings are recorded under (default: file name)")
+    import_parser.add_argument("--batch-size", type=int, default=50000, help="Rows per insert batch")
+    import_parser.add_argument("--rebuild-indexes", action="store_true",
+                               help="Drop indexes and triggers while loading and rebuild them at the end "
+                                    "(faster for very large loads; one transaction holding the write lock)")
+    import_parser.add_argument("--tld-cache", default="tlds_cache.txt", help="TLD list cache used by the collector")
+    
+    # Archive / restore commands
+    archive_parser = subparsers.add_parser("archive", help="Move old months out to compressed archive files")
+    archive_parser.add_argument("--month", help="Archive this month (YYYY-MM, UTC)")
+    archive_parser.add_argument("--older-than", type=int, metavar="MONTHS",
+                                help="Archive every month before the last MONTHS complete months")
+    archive_parser.add_argument("--dir", default=ARCHIVE_DIR, help="Archive directory")
+    archive_parser.add_argument("--list", action="store_true", help="List archived months")
+    restore_parser = subparsers.add_parser("restore", help="Load an archived month back into the database")
+    restore_parser.add_argument("archive", help="iocs-YYYY-MM.csv.gz file written by archive")
+    
+    # Backfill rollups command
+    rollup_parser = subparsers.add_parser("backfill-rollups",
+                                          help="Rebuild the analytics rollups and IOC summary from stored IOCs")
+    
+    # Migrate command
+    migrate_parser = subparsers.add_parser("migrate", help="Convert an old single-table database to the normalized schema")
+    migrate_parser.add_argument("--chunk-size", type=int, default=5000, help="Rows copied per transaction")
+    migrate_parser.add_argument("--compress", action="store_true", help="zlib-compress long message bodies")
+    migrate_parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM after migrating")
     
     args = parser.parse_args()
     
@@ -61,6 +132,24 @@ def main():
         parser.print_help()
         return
     
+    if args.command == "migrate":
+        # Runs before IOCDatabase, which refuses to open the old schema
+        def progress(done, total):
+            print(f"\r🔄 Migrated {done}/{total} rows", end="", flush=True)
+        
+        try:
+            migrated = migrate_legacy_schema(args.db, chunk_size=args.chunk_size, compress=args.compress,
+                                             vacuum=not args.no_vacuum, progress=progress)
+        except Exception as e:
+            print(f"\n❌ Migration failed: {e}")
+            return
+        
+        if migrated:
+            print(f"\n✅ Migrated {migrated} IOCs to the normalized schema")
+        else:
+            print("✅ Database already uses the normalized schema")
+        return
+    
     try:
         db = IOCDatabase(args.db)
     except Exception as e:
@@ -68,6 +157,9 @@ def main():
         return
     
     if args.command == "stats":
+        if args.recount and not db.recount_stats():
+            print("❌ Recount failed")
+            return
         stats = db.get_stats()
         print("📊 IOC Database Statistics:")
         print("=" * 30)
@@ -93,7 +185,8 @@ def main():
             print("No IOCs found.")
     
     elif args.command == "search":
-        results = db.search_ioc(args.term)
+        results = db.search_ioc(args.term, limit=args.limit, offset=args.offset,
+                                include_messages=args.messages)
         print(f"🔍 Search results for '{args.term}':")
         print("=" * 50)
         
@@ -110,22 +203,157 @@ def main():
         else:
             print("No matching IOCs found.")
     
+    elif args.command == "lookup" and args.file:
+        try:
+            source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        except OSError as e:
+            print(f"❌ Cannot read {args.file}: {e}", file=sys.stderr)
+            return
+        try:
+            seen = total = 0
+            for result in db.lookup_many(source, ioc_type=args.type):
+                print(json.dumps(result))
+                total += 1
+                seen += result["seen"]
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ Lookup failed: {e}", file=sys.stderr)
+            return
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"✅ {seen} of {total} indicators seen", file=sys.stderr)
+    
+    elif args.command == "lookup":
+        if not args.value:
+            parser.error("lookup needs a value or --file")
+        results = db.lookup_ioc(args.value, ioc_type=args.type, limit=args.limit)
+        print(f"🎯 Sightings of '{args.value}':")
+        print("=" * 50)
+        
+        if results:
+            headers = ["IOC Value", "Type", "Chat", "Detected At"]
+            data = []
+            for result in results:
+                detected_at = datetime.fromisoformat(result['detected_at']).strftime("%Y-%m-%d %H:%M")
+                chat_info = result['source_chat_title'] or f"ID:{result['source_chat_id']}"
+                data.append([result['ioc_value'], result['ioc_type'], chat_info, detected_at])
+            
+            print_table(data, headers)
+        else:
+            print("No sightings found.")
+    
     elif args.command == "export":
-        success = db.export_to_csv(args.output)
+        success = db.export_to_csv(args.output, ioc_type=args.type, chat_id=args.chat,
+                                   since=args.since, until=args.until, compress=args.gzip)
+        # Keep stdout clean when the CSV itself goes there
+        status_stream = sys.stderr if args.output == "-" else sys.stdout
         if success:
-            print(f"✅ IOCs exported successfully to {args.output}")
+            print(f"✅ IOCs exported successfully to {args.output}", file=status_stream)
+        else:
+            print("❌ Export failed", file=status_stream)
+    
+    elif args.command == "reindex":
+        print("🔄 Rebuilding search index...")
+        if db.rebuild_search_index():
+            print("✅ Search index rebuilt")
         else:
-            print("❌ Export failed")
+            print("❌ Rebuild failed")
+    
+    elif args.command == "ingest":
+        def progress(messages, new_iocs, elapsed):
+            print(f"\r📥 {messages} messages, {new_iocs} new IOCs ({messages / max(elapsed, 1e-9):,.0f} msg/s)",
+                  end="", flush=True)
+        
+        tlds = TLDRegistry(cache_path=args.tld_cache).load()
+        started = time.monotonic()
+        try:
+            messages, new_iocs = ingest_export(db, args.export, tlds, processes=args.processes,
+                                               batch_size=args.batch_size, progress=progress)
+        except (OSError, ValueError) as e:
+            print(f"\n❌ Ingest failed: {e}")
+            return
+        elapsed = time.monotonic() - started
+        print(f"\n✅ Ingested {messages} messages in {elapsed:.1f}s "
+              f"({messages / max(elapsed, 1e-9):,.0f} msg/s): {new_iocs} new IOCs")
+    
+    elif args.command == "import":
+        def progress(rows, new_iocs, elapsed):
+            print(f"\r📥 {rows:,} indicators, {new_iocs:,} new ({rows / max(elapsed, 1e-9):,.0f} rows/s)",
+                  end="", flush=True)
+        
+        extractor = IOCExtractor(TLDRegistry(cache_path=args.tld_cache).load())
+        for path in args.files:
+            print(f"📂 {path}")
+            try:
+                result = import_feed(db, path, extractor, format=args.format, source=args.source,
+                                     batch_size=args.batch_size, rebuild_indexes=args.rebuild_indexes,
+                                     progress=progress)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                print(f"\n❌ Import of {path} failed: {e}")
+                continue
+            print(f"\n✅ Imported {result.indicators:,} indicators in {result.seconds:.1f}s "
+                  f"({result.indicators / max(result.seconds, 1e-9):,.0f} rows/s): "
+                  f"{result.new_iocs:,} new, {result.rejected:,} rejected")
+    
+    elif args.command == "archive":
+        if args.list:
+            archived = db.get_archived_months()
+            print_table([[a['month'], a['rows'], a['archived_at'], a['path']] for a in archived],
+                        ["Month", "Rows", "Archived At", "File"])
+            return
+        if not args.month and args.older_than is None:
+            parser.error("archive needs --month, --older-than or --list")
+        
+        try:
+            if args.month:
+                archived = {args.month: db.archive_month(args.month, args.dir)}
+                freed = db.reclaim_space()
+            else:
+                archived = db.apply_retention(args.older_than, args.dir)
+                freed = None
+        except (ValueError, OSError, sqlite3.Error) as e:
+            print(f"❌ Archive failed: {e}")
+            return
+        
+        for month, rows in archived.items():
+            print(f"📦 {month}: {rows} IOCs archived to {args.dir}")
+        if not archived:
+            print("✅ Nothing to archive")
+        elif freed is not None:
+            print(f"✅ Freed {freed} database pages")
+    
+    elif args.command == "restore":
+        try:
+            restored = db.restore_archive(args.archive)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            print(f"❌ Restore failed: {e}")
+            return
+        print(f"✅ Restored {restored} IOCs from {args.archive}")
+    
+    elif args.command == "backfill-rollups":
+        print("🔄 Rebuilding hourly and daily rollups and the IOC summary...")
+        if db.rebuild_rollups() and db.rebuild_summary():
+            print("✅ Rollups rebuilt")
+        else:
+            print("❌ Rebuild failed")
     
     elif args.command == "unique":
-        unique_iocs = db.get_unique_iocs(ioc_type=args.type)
-        print(f"🎯 Unique IOCs ({args.type or 'all types'}):")
+        try:
+            unique_iocs, next_cursor = db.get_unique_iocs(ioc_type=args.type, sort=args.sort,
+                                                          limit=args.limit, cursor=args.cursor)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        print(f"🎯 Unique IOCs ({args.type or 'all types'}, by {args.sort}):")
         print("=" * 50)
         
         if unique_iocs:
-            for ioc in unique_iocs:
-                print(ioc)
-            print(f"\nTotal: {len(unique_iocs)} unique IOCs")
+            headers = ["IOC", "Type", "Sightings", "Chats", "First Seen", "Last Seen"]
+            data = [[ioc['ioc_key'], ioc['ioc_type'], ioc['sightings'], ioc['chats'],
+                     ioc['first_seen'], ioc['last_seen']] for ioc in unique_iocs]
+            print_table(data, headers)
+            if next_cursor:
+                print(f"\nMore results: --cursor {next_cursor}")
         else:
             print("No unique IOCs found.")
 
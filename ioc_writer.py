@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import metrics
+from database import IOCDatabase, IOCRecord
+
+BATCH_SECONDS = metrics.histogram("ioc_writer_batch_seconds", "Time to write one batch of IOCs")
+BATCH_ROWS = metrics.histogram("ioc_writer_batch_rows", "IOCs per written batch",
+                               buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+log = logging.getLogger(__name__)
+
+
+class IOCWriter:
+    """
+    Write-behind queue in front of IOCDatabase.
+
+    Records submitted from any thread (typically the asyncio event loop) are
+    collected by a dedicated writer thread and flushed with a single
+    executemany transaction every `batch_size` rows or `flush_interval`
+    seconds, whichever comes first. A batch that fails (e.g. "database is
+    locked") is retried with backoff; if it keeps failing, its futures get
+    the error rather than being reported as duplicates.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db: IOCDatabase, batch_size: int = 500, flush_interval: float = 0.25,
+                 retries: int = 3, retry_delay: float = 0.5):
+        """
+        Initialize the writer.
+
+        Args:
+            db: Database to write to
+            batch_size: Flush once this many rows are pending
+            flush_interval: Flush pending rows at least this often (seconds)
+            retries: Retries of a failed batch before giving up on it
+            retry_delay: Wait before the first retry (doubled for each one)
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.written = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.batches = 0
+
+        self._queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "IOCWriter":
+        """Start the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="ioc-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, record: IOCRecord) -> Future:
+        """
+        Queue a record for writing without blocking.
+
+        Returns:
+            Future resolving to True if the row was new, False if duplicate;
+            it raises sqlite3.Error if the batch could not be written
+        """
+        future = Future()
+        self._queue.put((record, future))
+        return future
+
+    async def save(self, record: IOCRecord) -> bool:
+        """Queue a record and wait (without blocking the loop) for its flush."""
+        return await asyncio.wrap_future(self.submit(record))
+
+    def pending(self) -> int:
+        """Records (and flush requests) waiting for the writer thread."""
+        return self._queue.qsize()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted so far has been written."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush pending rows and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        pending = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size:
+                    continue
+
+            # Size or time limit reached, or a flush/stop was requested
+            if pending:
+                self._write(pending)
+                pending = []
+            deadline = None
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is self._STOP:
+                return
+
+    def _write(self, pending):
+        records = [record for record, _ in pending]
+        start = time.perf_counter()
+        results = None
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                results = self.db.insert_iocs(records)
+                break
+            except sqlite3.Error as e:
+                error = e
+                if attempt == self.retries:
+                    break
+                log.warning("IOC batch write failed, retrying in %.1fs: %s", delay, e,
+                            extra={"rows": len(records), "attempt": attempt + 1})
+                time.sleep(delay)
+                delay *= 2
+            except Exception as e:
+                error = e
+                break
+
+        if results is None:
+            log.error("Dropping a batch of %d IOCs: %s", len(records), error, extra={"rows": len(records)})
+            self.failed += len(records)
+            for _, future in pending:
+                future.set_exception(error)
+            return
+        BATCH_SECONDS.observe(time.perf_counter() - start)
+        BATCH_ROWS.observe(len(records))
+
+        self.batches += 1
+        for (_, future), is_new in zip(pending, results):
+            if is_new:
+                self.written += 1
+            else:
+                self.duplicates += 1
+            future.set_result(is_new)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO, Tuple
+
+import metrics
+
+# Attributes of every LogRecord; anything else was passed with extra= and is logged as a field
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, object]:
+    return {key: value for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_")}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extra fields and traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for terminals, with extra fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += "  " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class DebugLimiter(logging.Filter):
+    """
+    Thin out records below INFO, per call site (logger and format string).
+
+    A fraction `sample` of them is considered at all; of those, each call
+    site may log `rate` per second (with bursts of up to `burst`). The next
+    record that gets through reports how many were dropped before it as
+    `suppressed`. Records at INFO and above always pass.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 20, sample: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self.suppressed = 0
+        self._buckets: Dict[Tuple[str, str], list] = {}  # site -> [tokens, last refill, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.INFO:
+            return True
+        site = (record.name, str(record.msg))
+        keep = self.sample >= 1 or random.random() < self.sample
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(site)
+            if bucket is None:
+                bucket = self._buckets[site] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if not keep or bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting or waiting.
+
+    Formatting happens on the listener thread, so the caller's cost is a
+    filter pass and a queue put. When the queue is full the record is
+    dropped (and counted) rather than blocking the event loop.
+    """
+
+    def __init__(self, max_pending: int = 10000):
+        super().__init__(queue.Queue(max_pending))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None, format: Optional[str] = None,
+                  stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a background thread.
+
+    Settings default to the LOG_LEVEL (INFO), LOG_FORMAT ('json', or 'text'
+    when writing to a terminal), LOG_DEBUG_RATE (debug records per second
+    per call site) and LOG_DEBUG_SAMPLE (fraction of debug records kept)
+    environment variables. Calling it again replaces the previous setup.
+
+    Returns:
+        The queue listener; it is stopped (and the queue drained) at exit
+    """
+    global _listener
+
+    stream = stream or sys.stderr
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    format = format or os.getenv("LOG_FORMAT") or ("text" if stream.isatty() else "json")
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JSONFormatter() if format == "json" else TextFormatter())
+
+    limiter = DebugLimiter(rate=float(os.getenv("LOG_DEBUG_RATE", "10")),
+                           sample=float(os.getenv("LOG_DEBUG_SAMPLE", "1")))
+    handler = NonBlockingQueueHandler()
+    handler.addFilter(limiter)
+
+    if _listener is not None:
+        _listener.stop()
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    metrics.counter_function("ioc_log_records_dropped", "Log records dropped before reaching the output",
+                             lambda: {("queue_full",): handler.dropped, ("rate_limited",): limiter.suppressed},
+                             ["reason"])
+    return _listener
@@ -1,15 +1,30 @@
 #!/usr/bin/env python3
 
+import argparse
+import asyncio
+import logging
 import os
-import re
+import sqlite3
+import subprocess
+import sys
 import telethon
 from time import sleep
-from telethon import events
+from telethon import events, functions, types
 from dotenv import load_dotenv
-import requests
-from database import IOCDatabase
+import metrics
+from backfill import Backfiller
+from database import IOCDatabase, IOCRecord
+from entity_cache import EntityCache
+from ioc_extractor import IOCExtractor
+from ioc_writer import IOCWriter
+from logs import setup_logging
+from read_ack import ReadAckScheduler
+from spool import SpoolReader, SpoolWriter, message_record
+from tld_registry import TLDRegistry
 
 load_dotenv()
+setup_logging()
+log = logging.getLogger("collector")
 
 assert os.getenv("API_ID") is not None, "API_ID is not set in .env file"
 assert os.getenv("API_HASH") is not None, "API_HASH is not set in .env file"
@@ -20,102 +35,376 @@ API_HASH = str(os.getenv("API_HASH"))
 client = telethon.TelegramClient("status-collector", int(API_ID), API_HASH)
 update_event = events.UserUpdate()
 
-TLD_URL = "https://data.iana.org/TLD/tlds-alpha-by-domain.txt"
-tlds = []
-
 # Initialize IOC database
-db = IOCDatabase()
-print("IOC Database initialized successfully!")
+db = IOCDatabase(compress_messages=os.getenv("COMPRESS_MESSAGES", "0") == "1")
+writer = IOCWriter(db).start()
+log.info("IOC Database initialized successfully!", extra={"db": db.db_path})
+
+# Load TLDs from the local cache (or bundled snapshot); refresh in the background
+tld_registry = TLDRegistry(cache_path=os.getenv("TLD_CACHE", "tlds_cache.txt"))
+extractor = IOCExtractor(tld_registry.load())
+tld_registry.on_update = extractor.update_tlds
+tld_registry.start()
+
+# Chat titles and sender usernames, resolved only for messages with IOCs
+entities = EntityCache(max_size=int(os.getenv("ENTITY_CACHE_SIZE", "1024")),
+                       ttl=float(os.getenv("ENTITY_CACHE_TTL", "3600")))
+
+# Read acknowledgements, one request per chat every few seconds
+read_acks = ReadAckScheduler(client, interval=float(os.getenv("READ_ACK_INTERVAL", "5")),
+                             batch_size=int(os.getenv("READ_ACK_BATCH", "200")))
+
+# History backfill, also used to catch up on chats after a restart
+backfiller = Backfiller(client, db, extractor, concurrency=int(os.getenv("BACKFILL_CONCURRENCY", "4")))
+
+# Highest message id handled live per chat; every CHECKPOINT_INTERVAL seconds
+# it becomes the chat's checkpoint, so catch-up only reads the downtime
+live_checkpoints = {}
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "30"))
+
+# Months older than this many complete months are archived daily (0 keeps everything)
+RETENTION_MONTHS = int(os.getenv("RETENTION_MONTHS", "0"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Spool: in monitor mode the handler only appends messages to disk and
+# worker processes extract and store them (SPOOL_WORKERS=0 does it inline)
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_WORKERS = int(os.getenv("SPOOL_WORKERS", "1"))
+SPOOL_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool.py")
+spools = []  # one SpoolWriter per partition
+spool_workers = {}  # partition directory -> worker process
+
+# Prometheus metrics on a local port (0 disables); spool worker N serves on METRICS_PORT + 1 + N
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics.enabled = METRICS_PORT > 0
+
+HANDLER_SECONDS = metrics.histogram("ioc_handler_seconds", "Time to handle one new message")
+STAGE_SECONDS = metrics.histogram("ioc_handler_stage_seconds", "Time per message spent in each handler stage",
+                                  ["stage"])
+MESSAGES = metrics.counter("ioc_messages", "Messages received", ["chat"])
+IOCS_FOUND = metrics.counter("ioc_iocs_found", "IOCs extracted from received messages", ["chat"])
+
+# Read from the components only when scraped
+metrics.gauge("ioc_writer_queue", "Records waiting for the writer thread", lambda: {(): writer.pending()})
+metrics.counter_function("ioc_writer_rows", "Rows handled by the writer", lambda: {
+    ("new",): writer.written, ("duplicate",): writer.duplicates, ("failed",): writer.failed}, ["result"])
+metrics.counter_function("ioc_entity_cache_lookups", "Chat and sender name lookups", lambda: {
+    ("hit",): entities.hits, ("miss",): entities.misses}, ["result"])
+metrics.counter_function("ioc_read_ack_requests", "Read acknowledgement requests sent",
+                         lambda: {(): read_acks.stats()["requests"]})
+metrics.gauge("ioc_read_ack_pending_chats", "Chats with unsent read acknowledgements",
+              lambda: {(): read_acks.stats()["pending_chats"]})
+metrics.gauge("ioc_spool_lag_bytes", "Bytes spooled but not yet stored by the worker", lambda: {
+    (os.path.basename(spool.directory),): SpoolReader(spool.directory).lag() for spool in spools}, ["partition"])
+metrics.gauge("ioc_tlds", "Known top-level domains", lambda: {(): len(tld_registry.tlds)})
+
+tlds = sorted(tld_registry.tlds)
+log.info("TLDs loaded", extra={"source": tld_registry.source, "count": len(tlds), "first": tlds[0], "last": tlds[-1]})
+
+
+def saved_callback(ioc):
+    """Build a writer callback that reports the IOC once it is stored (debug level only)."""
+    def callback(future):
+        if future.exception() is None and future.result():
+            log.debug("✓ Saved %s to database: %s", ioc.type, ioc.value, extra={"type": ioc.type})
+    return callback
+
+
+async def load_chat_title(event):
+    chat = await event.get_chat()
+    return getattr(chat, 'title', getattr(chat, 'first_name', 'Unknown'))
+
+
+async def load_sender_username(event):
+    sender = await event.get_sender()
+    return getattr(sender, 'username', None)
 
-req = requests.get(TLD_URL)
-# print(req.text)
-for line in req.text.splitlines():
-    if line and not line.startswith("#"):
-        tlds.append(line.strip().lower())
 
-print("TLDs loaded:", len(tlds), "\nFirst TLD:", tlds[0], "\nLast TLD:", tlds[-1])
+async def lookup_names(event):
+    """Resolve the chat title and sender username through the entity cache."""
+    chat_title = None
+    sender_username = None
+    try:
+        chat_title = await entities.get(("chat", event.chat_id), lambda: load_chat_title(event))
+        if event.sender_id is not None:
+            sender_username = await entities.get(("sender", event.sender_id),
+                                                 lambda: load_sender_username(event))
+    except Exception as e:
+        log.warning("Error getting chat/sender info: %s", e, extra={"chat": event.chat_id})
+    return chat_title, sender_username
 
 
 @client.on(events.NewMessage)
 async def handler(event):
+    stopwatch = metrics.Stopwatch(STAGE_SECONDS, HANDLER_SECONDS)
+    
     # Get message and sender info
     message_text = event.message.message
     chat_id = event.chat_id
     message_id = event.message.id
     sender_id = event.sender_id
+    MESSAGES.inc(chat_id)
     
-    # Get chat and sender details
+    if spools:
+        # Extraction happens in the spool workers; only messages that could
+        # contain an indicator are worth resolving names for and spooling
+        candidate = IOCExtractor.may_contain_iocs(message_text)
+        stopwatch.lap("prefilter")
+        if candidate:
+            chat_title, sender_username = await lookup_names(event)
+            stopwatch.lap("entities")
+            spools[chat_id % len(spools)].append(message_record(
+                chat_id, chat_title, message_id, message_text, sender_id, sender_username))
+            stopwatch.lap("spool")
+        if message_id > live_checkpoints.get(chat_id, 0):
+            live_checkpoints[chat_id] = message_id
+        read_acks.mark(chat_id, message_id, event.input_chat)
+        stopwatch.lap("read_ack")
+        stopwatch.stop()
+        return
+    
+    iocs_found = extractor.extract(message_text)
+    stopwatch.lap("extract")
+    
+    # Get chat and sender details, only when there is something to store
     chat_title = None
     sender_username = None
     
-    try:
-        chat = await event.get_chat()
-        chat_title = getattr(chat, 'title', getattr(chat, 'first_name', 'Unknown'))
-        
-        sender = await event.get_sender()
-        sender_username = getattr(sender, 'username', None)
-    except Exception as e:
-        print(f"Error getting chat/sender info: {e}")
-    
-    # check if its an IP address or domain name
-    regex = r"^(?:(?:[0-1]?[0-9]{1,2}|2[0-4][0-9]|25[0-5])\.){3}(?:[0-1]?[0-9]{1,2}|2[0-4][0-9]|25[0-5])$|^(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}$"
-    words = message_text.split(" ")
-    print(f"Processing message from {chat_title}: {words}")
+    if iocs_found:
+        IOCS_FOUND.inc(chat_id, amount=len(iocs_found))
+        chat_title, sender_username = await lookup_names(event)
+        stopwatch.lap("entities")
     
-    iocs_found = []
+    # Per-message traces are debug output: rate limited, and skipped
+    # entirely (callbacks included) unless LOG_LEVEL=DEBUG
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug("Processing message from %s: %d IOC(s)", chat_title or chat_id, len(iocs_found),
+                  extra={"chat": chat_id, "message_id": message_id, "iocs": len(iocs_found)})
     
-    for word in words:
-        # Check for URLs/links
-        if word.startswith("http"):
-            print("Link Detected:", word)
-            iocs_found.append((word, "url"))
-            # Save to database
-            if db.save_ioc(word, "url", chat_id, chat_title, message_id, 
-                          message_text, sender_id, sender_username):
-                print(f"✓ Saved URL to database: {word}")
+    for ioc in iocs_found:
+        future = writer.submit(IOCRecord(ioc.value, ioc.type, chat_id, chat_title, message_id,
+                                         message_text, sender_id, sender_username))
+        if debug:
+            future.add_done_callback(saved_callback(ioc))
+    stopwatch.lap("submit")
         
-        # Check for IP addresses and domains
-        if re.match(regex, word):
-            # check if is domain name
-            if re.match(r"^(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}$", word):
-                # check if domain name ends with a TLD
-                domain = word.split(".")[-1].lower()
-                if domain in tlds:
-                    print("Domain:", word)
-                    iocs_found.append((word, "domain"))
-                    # Save to database
-                    if db.save_ioc(word, "domain", chat_id, chat_title, message_id,
-                                  message_text, sender_id, sender_username):
-                        print(f"✓ Saved domain to database: {word}")
-                else:
-                    print("Not a valid TLD:", word)
-            else:
-                print("IP Address:", word)
-                iocs_found.append((word, "ip"))
-                # Save to database
-                if db.save_ioc(word, "ip", chat_id, chat_title, message_id,
-                              message_text, sender_id, sender_username):
-                    print(f"✓ Saved IP to database: {word}")
+    if message_id > live_checkpoints.get(chat_id, 0):
+        live_checkpoints[chat_id] = message_id
+    read_acks.mark(chat_id, message_id, event.input_chat)
+    stopwatch.lap("read_ack")
+    stopwatch.stop()
+
+
+@client.on(events.ChatAction)
+async def chat_renamed(event):
+    if event.new_title:
+        entities.invalidate(("chat", event.chat_id))
+
+
+@client.on(events.Raw(types.UpdateUserName))
+async def user_renamed(update):
+    entities.invalidate(("sender", update.user_id))
+    entities.invalidate(("chat", update.user_id))  # private chats are titled by first name
+
+
+async def catch_up():
+    """
+    Backfill what was posted while we were offline in chats with a checkpoint.
     
-    # Print summary if IOCs were found
-    if iocs_found:
-        print(f"📊 Found {len(iocs_found)} IOC(s) in message from {chat_title}")
-        
-    await client.send_read_acknowledge(event.chat, event.message)
+    Returns:
+        IDs of the chats whose catch-up failed
+    """
+    chats = list(db.get_checkpoints())
+    if not chats:
+        return set()
+    summary = await backfiller.run(chats)
+    log.info("⏪ Caught up on %d chat(s): %d new IOC(s)", len(summary), sum(summary.values()),
+             extra={"chats": len(summary), "new_iocs": sum(summary.values())})
+    return set(chats) - set(summary)
+
+
+def store_checkpoints(checkpoints):
+    """
+    Store checkpoints for messages handled live, once their IOCs are safe.
+    
+    Everything submitted before the call is written by the writer thread (or
+    synced to the spool, which its workers always finish) first. After a
+    failed writer batch nothing is stored, so the next catch-up re-reads the
+    messages it lost.
+    
+    Returns:
+        False if checkpoints should no longer be advanced this run
+    """
+    if spools:
+        for spool in spools:
+            spool.sync()
+    else:
+        writer.flush()
+        if writer.failed:
+            log.warning("⚠️ Writer batches failed; no longer advancing checkpoints until restart",
+                        extra={"failed": writer.failed})
+            return False
+    try:
+        db.advance_checkpoints(checkpoints)
+    except sqlite3.Error as e:
+        log.error("❌ Could not store checkpoints: %s", e, extra={"chats": len(checkpoints)})
+    return True
+
+
+async def advance_checkpoints(interval=CHECKPOINT_INTERVAL):
+    """Catch up, then keep checkpoints level with the live handler."""
+    # A live checkpoint stored mid catch-up would skip the rest of the gap if we
+    # crashed, and one for a chat whose catch-up failed would skip it for good
+    failed = await catch_up()
+    if failed:
+        log.warning("⚠️ Catch-up failed for %d chat(s); their checkpoints stay put until the next run",
+                    len(failed), extra={"chats": sorted(failed)})
+    while True:
+        await asyncio.sleep(interval)
+        checkpoints = {chat_id: message_id for chat_id, message_id in live_checkpoints.items()
+                       if chat_id not in failed}
+        live_checkpoints.clear()
+        if checkpoints and not await asyncio.to_thread(store_checkpoints, checkpoints):
+            return
+
+
+async def backfill(chats, limit=None):
+    """Backfill the given chats, or every dialog if none are given."""
+    if not chats:
+        chats = [dialog.entity async for dialog in client.iter_dialogs()]
+    log.info("⏪ Backfilling %d chat(s)...", len(chats))
+    summary = await backfiller.run(chats, limit=limit)
+    log.info("✅ Backfill complete: %d new IOC(s) from %d chat(s)", backfiller.new_iocs, len(summary),
+             extra={"chats": len(summary), "new_iocs": backfiller.new_iocs})
+
+
+def spool_partitions():
+    """Partition directories to consume: the configured ones plus any left from a larger setup."""
+    partitions = [os.path.join(SPOOL_DIR, f"p{i}") for i in range(SPOOL_WORKERS)]
+    if os.path.isdir(SPOOL_DIR):
+        for name in sorted(os.listdir(SPOOL_DIR)):
+            path = os.path.join(SPOOL_DIR, name)
+            if name.startswith("p") and name[1:].isdigit() and path not in partitions:
+                partitions.append(path)
+    return partitions
+
+
+def start_spool_worker(directory):
+    command = [sys.executable, SPOOL_WORKER_SCRIPT, directory, "--db", db.db_path,
+               "--tld-cache", tld_registry.cache_path]
+    if db.compress_messages:
+        command.append("--compress")
+    if METRICS_PORT:
+        partition = int(os.path.basename(directory)[1:])
+        command += ["--metrics-port", str(METRICS_PORT + 1 + partition), "--metrics-host", METRICS_HOST]
+    spool_workers[directory] = subprocess.Popen(command)
+
+
+def stop_spool_workers(timeout=30):
+    """Ask the workers to finish their current batch and exit."""
+    for process in spool_workers.values():
+        process.terminate()
+    for process in spool_workers.values():
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    spool_workers.clear()
+
+
+async def supervise_spool_workers(interval=10):
+    """Restart spool workers that died; they resume from their committed offsets."""
+    while True:
+        await asyncio.sleep(interval)
+        for directory, process in list(spool_workers.items()):
+            if process.poll() is not None:
+                log.warning("⚠️ Spool worker for %s exited with %s; restarting", directory, process.returncode,
+                            extra={"partition": directory, "returncode": process.returncode})
+                start_spool_worker(directory)
+
+
+async def enforce_retention(interval=86400):
+    """Archive expired months once a day, off the event loop."""
+    while True:
+        try:
+            archived = await asyncio.to_thread(db.apply_retention, RETENTION_MONTHS, ARCHIVE_DIR)
+        except Exception as e:
+            log.exception("❌ Retention failed: %s", e)
+        else:
+            for month, rows in archived.items():
+                log.info("📦 Archived %d IOCs from %s to %s", rows, month, ARCHIVE_DIR,
+                         extra={"month": month, "rows": rows})
+        await asyncio.sleep(interval)
+
+
+async def wait_for_updates():
+    # Same as client.run_until_disconnected(), which would swallow Ctrl+C and
+    # disconnect before pending read acknowledgements could be sent
+    await client(functions.updates.GetStateRequest())
+    background = [asyncio.create_task(advance_checkpoints()), asyncio.create_task(supervise_spool_workers())]
+    if RETENTION_MONTHS > 0:
+        background.append(asyncio.create_task(enforce_retention()))
+    try:
+        await client.disconnected
+    finally:
+        for task in background:
+            task.cancel()
 
 
 if __name__ == "__main__":
-    print("🚀 Starting IOC Telegram Monitor...")
-    print("📊 Database stats:", db.get_stats())
+    parser = argparse.ArgumentParser(description="IOC Telegram Monitor")
+    parser.add_argument("mode", nargs="?", choices=["monitor", "backfill"], default="monitor",
+                        help="Watch new messages (default) or walk chat history once")
+    parser.add_argument("chats", nargs="*", help="Chats to backfill (IDs or usernames; default: all dialogs)")
+    parser.add_argument("--limit", type=int, help="Backfill at most this many messages per chat")
+    args = parser.parse_args()
+    
+    if METRICS_PORT and metrics.serve(METRICS_PORT, METRICS_HOST):
+        log.info("📈 Metrics on http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+    
+    if args.mode == "backfill":
+        chats = [int(chat) if chat.lstrip("-").isdigit() else chat for chat in args.chats]
+        try:
+            with client:
+                client.loop.run_until_complete(backfill(chats, limit=args.limit))
+        except KeyboardInterrupt:
+            log.info("⏸️ Interrupted; run backfill again to resume from the checkpoints")
+        writer.close()
+        tld_registry.stop()
+        db.close()
+        raise SystemExit
+    
+    log.info("🚀 Starting IOC Telegram Monitor...")
+    log.info("📊 Database stats", extra=db.get_stats())
+    
+    if SPOOL_WORKERS > 0:
+        spools.extend(SpoolWriter(os.path.join(SPOOL_DIR, f"p{i}")) for i in range(SPOOL_WORKERS))
+        for directory in spool_partitions():
+            start_spool_worker(directory)
+        log.info("📦 Spooling to %s with %d worker process(es)", SPOOL_DIR, len(spool_workers))
     
     while True:
         try:
             with client:
-                client.run_until_disconnected()
+                try:
+                    client.loop.run_until_complete(wait_for_updates())
+                finally:
+                    client.loop.run_until_complete(read_acks.close())
         except (KeyboardInterrupt, SystemExit):
-            print("\n📊 Final database stats:", db.get_stats())
-            print("💾 Exiting...")
+            log.info("💾 Flushing pending IOCs...")
+            for spool in spools:
+                spool.close()
+            stop_spool_workers()
+            writer.close()
+            tld_registry.stop()
+            log.info("📊 Final database stats", extra=db.get_stats())
+            log.info("📇 Entity cache", extra=entities.stats())
+            log.info("📨 Read acknowledgements", extra=read_acks.stats())
+            db.close()
+            log.info("💾 Exiting...")
             break
         except Exception as e:
-            print(f"❌ Error: {e}")
+            log.exception("❌ Error: %s", e)
             sleep(30)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond extraction up to slow Telegram requests
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+log = logging.getLogger(__name__)
+
+# Processes that don't expose their metrics switch this off, making every
+# recording call return immediately
+enabled = True
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        name += "{" + ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items()) + "}"
+    if value == float("inf"):
+        text = "+Inf"
+    elif isinstance(value, int) or value.is_integer():
+        text = str(int(value))
+    else:
+        text = repr(value)
+    return f"{name} {text}"
+
+
+class Metric:
+    """Base class: a named family of samples, one series per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def _labels(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labels, values))
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        """Add `amount` to the series for the given label values."""
+        if not enabled:
+            return
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                self._series[labels] = [amount]
+            else:
+                series[0] += amount
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            series = [(labels, values[0]) for labels, values in self._series.items()]
+        for labels, value in series:
+            yield self.name + "_total", self._labels(labels), value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        """Record one observation for the given label values."""
+        if enabled:
+            self.observe_many(((labels, value),))
+
+    def observe_many(self, observations: Sequence[Tuple[tuple, float]]):
+        """Record several (label values, value) observations under one lock."""
+        buckets = self.buckets
+        with self._lock:
+            for labels, value in observations:
+                series = self._series.get(labels)
+                if series is None:
+                    # One count per bucket, one for +Inf, then the sum
+                    series = self._series[labels] = [0] * (len(buckets) + 1) + [0.0]
+                series[bisect.bisect_left(buckets, value)] += 1
+                series[-1] += value
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        for labels, values in series:
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                yield self.name + "_bucket", {**base, "le": _format_bound(bound)}, cumulative
+            yield self.name + "_sum", base, values[-1]
+            yield self.name + "_count", base, cumulative
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Callback(Metric):
+    """
+    Series read from the application at scrape time (queue depths, stats()
+    counters), so keeping them costs nothing between scrapes.
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], kind: str,
+                 function: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self.function = function
+
+    def samples(self) -> Iterator[Sample]:
+        suffix = "_total" if self.kind == "counter" else ""
+        for labels, value in self.function().items():
+            yield self.name + suffix, self._labels(labels), value
+
+
+class Stopwatch:
+    """
+    Times the consecutive stages of one operation.
+
+    Laps are kept locally and recorded together by `stop`: each stage into
+    `stages` (labelled by stage name) and the whole operation into `total`.
+    """
+
+    __slots__ = ("stages", "total", "started", "_last", "_laps")
+
+    def __init__(self, stages: Histogram, total: Optional[Histogram] = None):
+        self.stages = stages
+        self.total = total
+        self.started = self._last = time.perf_counter()
+        self._laps = []
+
+    def lap(self, stage: str):
+        """End the current stage (started by the previous lap, or the start) as `stage`."""
+        now = time.perf_counter()
+        self._laps.append(((stage,), now - self._last))
+        self._last = now
+
+    def stop(self):
+        """Record the laps and the total time."""
+        if not enabled:
+            return
+        self.stages.observe_many(self._laps)
+        if self.total is not None:
+            self.total.observe(self._last - self.started)
+
+
+class Registry:
+    """The metrics of one process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric; registering a name twice returns the existing one."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, function: Callable[[], Dict[tuple, float]],
+              labels: Sequence[str] = ()) -> Callback:
+        """Register a gauge whose series `function` returns as {label values: value}."""
+        with self._lock:
+            metric = self._metrics[name] = Callback(name, help, labels, "gauge", function)
+        return metric
+
+    def counter_function(self, name: str, help: str, function: Callable[[], Dict[tuple, float]],
+                         labels: Sequence[str] = ()) -> Callback:
+        """Like gauge, for counts kept elsewhere (e.g. a stats() dictionary)."""
+        with self._lock:
+            metric = self._metrics[name] = Callback(name, help, labels, "counter", function)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} failed: {_escape(str(e))}")
+                continue
+            family = metric.name + "_total" if metric.kind == "counter" else metric.name
+            lines.append(f"# HELP {family} {_escape(metric.help)}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            lines.extend(_format_sample(name, labels, value) for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+counter_function = REGISTRY.counter_function
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """
+    Expose /metrics on a background thread.
+
+    Returns:
+        The server (call shutdown() to stop it), or None if the port is in use
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # one line per scrape is noise
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        log.warning("⚠️ Metrics not served on %s:%d: %s", host, port, e,
+                    extra={"host": host, "port": port, "error": str(e)})
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from telethon.errors import FloodWaitError
+
+import metrics
+
+REQUEST_SECONDS = metrics.histogram("ioc_read_ack_request_seconds", "Latency of read acknowledgement requests")
+FLOOD_WAITS = metrics.counter("ioc_flood_waits", "FloodWait errors returned by Telegram", ["request"])
+
+log = logging.getLogger(__name__)
+
+
+class ReadAckScheduler:
+    """
+    Coalesce read acknowledgements into one request per chat.
+
+    `mark` only records the highest message id seen in each chat. A
+    background task sends them every `interval` seconds, or as soon as
+    `batch_size` messages have been marked. On FloodWait the unsent acks are
+    kept and nothing is sent until Telegram's wait has passed.
+    """
+
+    def __init__(self, client, interval: float = 5.0, batch_size: int = 200):
+        """
+        Initialize the scheduler.
+
+        Args:
+            client: Anything with an async send_read_acknowledge(entity, max_id=...)
+            interval: Flush pending acknowledgements at least this often (seconds)
+            batch_size: Flush early once this many messages are pending
+        """
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.marked = 0
+        self.requests = 0
+        self.flood_waits = 0
+
+        self._pending: Dict[int, Tuple[Any, int]] = {}
+        self._since_flush = 0
+        self._resume_at = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def mark(self, chat_id: int, message_id: int, entity: Any = None):
+        """
+        Record a processed message. Must be called from the event loop.
+
+        Args:
+            chat_id: Chat the message belongs to
+            message_id: The message's ID
+            entity: Input entity for the chat (defaults to chat_id)
+        """
+        entry = self._pending.get(chat_id)
+        if entry is None or message_id > entry[1]:
+            self._pending[chat_id] = (entity if entity is not None else chat_id, message_id)
+        self.marked += 1
+        self._since_flush += 1
+
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if self._since_flush >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """
+        Send one acknowledgement per chat with pending messages.
+
+        Returns:
+            Number of requests sent
+        """
+        self._since_flush = 0
+        sent = 0
+        for chat_id in list(self._pending):
+            entity, max_id = self._pending[chat_id]
+            start = time.perf_counter()
+            try:
+                await self.client.send_read_acknowledge(entity, max_id=max_id)
+                sent += 1
+                REQUEST_SECONDS.observe(time.perf_counter() - start)
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                FLOOD_WAITS.inc("read_ack")
+                self._resume_at = time.monotonic() + e.seconds
+                log.warning("⏳ Read acknowledgements paused for %ds (FloodWait)", e.seconds)
+                break
+            except Exception as e:
+                log.error("Error acknowledging messages in chat %s: %s", chat_id, e, extra={"chat": chat_id})
+
+            # Keep the entry if a newer message arrived while we were sending
+            if self._pending.get(chat_id, (None, 0))[1] <= max_id:
+                del self._pending[chat_id]
+
+        self.requests += sent
+        return sent
+
+    async def close(self):
+        """Stop the background task and send whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._pending and time.monotonic() >= self._resume_at:
+            await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Messages marked versus requests actually sent."""
+        return {
+            "marked": self.marked,
+            "requests": self.requests,
+            "flood_waits": self.flood_waits,
+            "pending_chats": len(self._pending),
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._pending:
+                await self.flush()
+
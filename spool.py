@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from database import IOCDatabase, IOCRecord
+from ioc_extractor import IOCExtractor
+from logs import setup_logging
+from tld_registry import TLDRegistry
+
+
+SEGMENT_SUFFIX = ".log"
+
+BATCH_SECONDS = metrics.histogram("ioc_spool_batch_stage_seconds", "Time per spool batch spent in each stage",
+                                  ["stage"])
+IOCS_FOUND = metrics.counter("ioc_iocs_found", "IOCs extracted from received messages", ["chat"])
+
+log = logging.getLogger("spool")
+
+
+def _segments(directory: str) -> List[int]:
+    """Base offsets of the segment files in a spool directory, oldest first."""
+    bases = []
+    for name in os.listdir(directory):
+        stem = name[:-len(SEGMENT_SUFFIX)]
+        if name.endswith(SEGMENT_SUFFIX) and stem.isdigit():
+            bases.append(int(stem))
+    return sorted(bases)
+
+
+def _segment_path(directory: str, base: int) -> str:
+    return os.path.join(directory, f"{base:020d}{SEGMENT_SUFFIX}")
+
+
+def _fsync_directory(directory: str):
+    # Makes newly created or renamed files in the directory durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _complete_length(path: str, block_size: int = 1 << 16) -> int:
+    """Length of a segment up to and including its last newline."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            index = f.read(end - start).rfind(b"\n")
+            if index >= 0:
+                return start + index + 1
+            end = start
+    return 0
+
+
+class SpoolWriter:
+    """
+    Append-only, segmented log of message records.
+
+    Each record is one JSON line written straight to the OS, so a crash of
+    this process loses nothing; fsync is batched on a background thread
+    every `fsync_interval` seconds. Records are addressed by byte offset
+    across segments, and a new segment starts once the current one would
+    exceed `segment_bytes`.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 << 20, fsync_interval: float = 0.05):
+        """
+        Open (or create) a spool for appending.
+
+        Args:
+            directory: Spool directory, one per partition
+            segment_bytes: Roll over to a new segment file beyond this size
+            fsync_interval: Maximum seconds between fsyncs
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+
+        segments = _segments(directory)
+        self._base = segments[-1] if segments else 0
+        path = _segment_path(directory, self._base)
+        if os.path.exists(path):
+            # Drop a record torn by a crash mid-write
+            os.truncate(path, _complete_length(path))
+        self._file = open(path, "ab", buffering=0)
+        self.offset = self._base + self._file.tell()
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-fsync", daemon=True)
+        self._thread.start()
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """
+        Append a record.
+
+        Returns:
+            The spool offset just past the record
+        """
+        data = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self.offset > self._base and self.offset - self._base + len(data) > self.segment_bytes:
+                self._roll()
+            self._file.write(data)
+            self.offset += len(data)
+            self._dirty = True
+            return self.offset
+
+    def sync(self):
+        """fsync everything appended so far."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # fsync a duplicate descriptor outside the lock so appends don't wait on the disk
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        """Sync and close the current segment."""
+        self._stop.set()
+        self._thread.join()
+        self.sync()
+        self._file.close()
+
+    def _roll(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._base = self.offset
+        self._file = open(_segment_path(self.directory, self._base), "ab", buffering=0)
+        _fsync_directory(self.directory)
+
+    def _run(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+
+
+class SpoolReader:
+    """
+    Read records from a spool in order and remember how far they were processed.
+
+    The committed offset is stored next to the segments and only advances
+    on `commit`, so records are delivered at least once: after a crash,
+    everything since the last commit is read again.
+    """
+
+    def __init__(self, directory: str, name: str = "worker"):
+        """
+        Args:
+            directory: Spool directory written by a SpoolWriter
+            name: Consumer name, used for the offset file
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.offset_path = os.path.join(directory, f"{name}.offset")
+        try:
+            with open(self.offset_path, encoding="utf-8") as f:
+                self.committed = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            self.committed = 0
+
+    def read(self, max_records: int = 500) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read up to `max_records` complete records after the committed offset.
+
+        Returns:
+            Tuple of (records, offset to commit once they are processed)
+        """
+        records = []
+        offset = self.committed
+        while len(records) < max_records:
+            segments = _segments(self.directory)
+            base = max((b for b in segments if b <= offset), default=None)
+            if base is None:
+                break
+
+            before = offset
+            with open(_segment_path(self.directory, base), "rb") as f:
+                f.seek(offset - base)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written
+                    offset += len(line)
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        log.warning("⚠️ Skipping corrupt spool record at offset %d", offset - len(line),
+                                    extra={"partition": self.directory})
+                    if len(records) >= max_records:
+                        break
+
+            # Nothing new here; a segment starting at `offset` would have been picked
+            if offset == before:
+                break
+
+        return records, offset
+
+    def commit(self, offset: int):
+        """Durably record that everything before `offset` has been processed."""
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+        _fsync_directory(self.directory)
+        self.committed = offset
+
+        # Segments that end at or before the committed offset are no longer needed
+        segments = _segments(self.directory)
+        for base, next_base in zip(segments, segments[1:]):
+            if next_base <= offset:
+                os.remove(_segment_path(self.directory, base))
+
+    def lag(self) -> int:
+        """Bytes written to the spool but not yet committed."""
+        segments = _segments(self.directory)
+        if not segments:
+            return 0
+        end = segments[-1] + os.path.getsize(_segment_path(self.directory, segments[-1]))
+        return max(0, end - self.committed)
+
+
+def message_record(chat_id: Optional[int], chat_title: Optional[str], message_id: Optional[int],
+                   message_text: str, sender_id: Optional[int], sender_username: Optional[str]) -> Dict[str, Any]:
+    """Build the spool record for a received message."""
+    return {
+        "chat_id": chat_id,
+        "chat_title": chat_title,
+        "message_id": message_id,
+        "text": message_text,
+        "sender_id": sender_id,
+        "sender_username": sender_username,
+    }
+
+
+def run_worker(directory: str, db_path: str, tld_cache: str, batch_size: int = 500,
+               poll_interval: float = 0.2, compress_messages: bool = False, metrics_port: int = 0,
+               metrics_host: str = "127.0.0.1"):
+    """
+    Consume one spool partition: extract IOCs and store them until signalled.
+
+    Offsets are committed only after the batch's transaction succeeds;
+    re-delivered messages are absorbed by the iocs UNIQUE constraint.
+    With a metrics port, the worker's own metrics are served there.
+    """
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    db = IOCDatabase(db_path, compress_messages=compress_messages)
+    tlds = TLDRegistry(cache_path=tld_cache)
+    extractor = IOCExtractor(tlds.load())
+    tld_mtime = _mtime(tld_cache)
+    reader = SpoolReader(directory)
+    name = os.path.basename(os.path.normpath(directory))
+    metrics.enabled = metrics_port > 0
+    if metrics_port:
+        metrics.gauge("ioc_spool_lag_bytes", "Bytes spooled but not yet stored by the worker",
+                      lambda: {(name,): reader.lag()}, ["partition"])
+        metrics.serve(metrics_port, metrics_host)
+
+    while not stop.is_set():
+        stopwatch = metrics.Stopwatch(BATCH_SECONDS)
+        messages, offset = reader.read(batch_size)
+        if not messages:
+            stop.wait(poll_interval)
+            continue
+        stopwatch.lap("read")
+
+        # Pick up TLD lists downloaded by the collector
+        if _mtime(tld_cache) != tld_mtime:
+            tld_mtime = _mtime(tld_cache)
+            extractor.update_tlds(tlds.load())
+
+        records = []
+        for message in messages:
+            iocs = extractor.extract(message["text"])
+            if iocs:
+                IOCS_FOUND.inc(message["chat_id"], amount=len(iocs))
+            records.extend(IOCRecord(ioc.value, ioc.type, message["chat_id"], message["chat_title"],
+                                     message["message_id"], message["text"], message["sender_id"],
+                                     message["sender_username"])
+                           for ioc in iocs)
+        stopwatch.lap("extract")
+        try:
+            new_iocs = sum(db.insert_iocs(records))
+        except sqlite3.Error as e:
+            log.error("❌ [%s] Database error, retrying batch: %s", name, e, extra={"partition": name})
+            stop.wait(5)
+            continue
+        stopwatch.lap("store")
+
+        reader.commit(offset)
+        stopwatch.lap("commit")
+        stopwatch.stop()
+        if new_iocs:
+            log.debug("✓ [%s] Saved %d new IOC(s) from %d message(s)", name, new_iocs, len(messages),
+                      extra={"partition": name, "new_iocs": new_iocs, "messages": len(messages)})
+
+    db.close()
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spool consumer: extract and store IOCs from one partition")
+    parser.add_argument("directory", help="Spool partition directory")
+    parser.add_argument("--db", default="ioc_database.db", help="Database file path")
+    parser.add_argument("--tld-cache", default="tlds_cache.txt", help="TLD list cache")
+    parser.add_argument("--batch-size", type=int, default=500, help="Messages per transaction")
+    parser.add_argument("--compress", action="store_true", help="zlib-compress long message bodies")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address for the metrics port")
+    args = parser.parse_args()
+
+    setup_logging()
+    run_worker(args.directory, args.db, args.tld_cache, batch_size=args.batch_size,
+               compress_messages=args.compress, metrics_port=args.metrics_port,
+               metrics_host=args.metrics_host)
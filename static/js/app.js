@@ -96,23 +96,87 @@ window.IOCMonitor = {
     updateDashboardStats: function() {
         fetch('/api/stats')
             .then(response => response.json())
-            .then(stats => {
-                // Update stat cards if they exist
-                const totalElement = document.querySelector('[data-stat="total_iocs"]');
-                const ipElement = document.querySelector('[data-stat="ip_count"]');
-                const domainElement = document.querySelector('[data-stat="domain_count"]');
-                const urlElement = document.querySelector('[data-stat="url_count"]');
-                
-                if (totalElement) totalElement.textContent = stats.total_iocs || 0;
-                if (ipElement) ipElement.textContent = stats.ip_count || 0;
-                if (domainElement) domainElement.textContent = stats.domain_count || 0;
-                if (urlElement) urlElement.textContent = stats.url_count || 0;
-            })
+            .then(stats => IOCMonitor.renderStats(stats))
             .catch(error => {
                 console.error('Failed to update stats:', error);
             });
     },
 
+    // Write statistics into the dashboard stat cards
+    renderStats: function(stats) {
+        document.querySelectorAll('[data-stat]').forEach(element => {
+            element.textContent = stats[element.dataset.stat] || 0;
+        });
+    },
+
+    // Push new IOCs and stats to the dashboard as they are stored
+    liveUpdates: function(maxRows = 10) {
+        if (window.location.pathname !== '/') {
+            return;
+        }
+        if (!window.EventSource) {
+            IOCMonitor.autoRefresh();
+            return;
+        }
+
+        const tbody = document.getElementById('recentIocsBody');
+        let lastId = tbody ? parseInt(tbody.dataset.lastId || '0', 10) : 0;
+        const source = new EventSource('/api/stream');
+
+        source.addEventListener('stats', function(e) {
+            IOCMonitor.renderStats(JSON.parse(e.data));
+        });
+        source.addEventListener('ioc', function(e) {
+            const ioc = JSON.parse(e.data);
+            if (ioc.id <= lastId) {
+                return;  // already shown (replayed after a reconnect)
+            }
+            lastId = ioc.id;
+            if (!tbody) {
+                // First IOC ever: render the table server-side
+                source.close();
+                window.location.reload();
+                return;
+            }
+            tbody.prepend(IOCMonitor.recentIocRow(ioc));
+            while (tbody.rows.length > maxRows) {
+                tbody.deleteRow(-1);
+            }
+        });
+    },
+
+    // Build a Recent IOCs table row (same layout as dashboard.html)
+    recentIocRow: function(ioc) {
+        const labels = {'ip': 'IP', 'domain': 'Domain', 'url': 'URL'};
+        const row = document.createElement('tr');
+        const cell = () => row.appendChild(document.createElement('td'));
+
+        const valueCell = cell();
+        const code = valueCell.appendChild(document.createElement('code'));
+        code.className = 'ioc-value';
+        code.textContent = ioc.ioc_value;
+        if (labels[ioc.ioc_type]) {
+            const badge = valueCell.appendChild(document.createElement('span'));
+            badge.className = `badge bg-${IOCMonitor.getTypeBadgeColor(ioc.ioc_type)}`;
+            badge.textContent = labels[ioc.ioc_type];
+            valueCell.insertBefore(document.createTextNode(' '), badge);
+        }
+
+        const typeBadge = cell().appendChild(document.createElement('span'));
+        typeBadge.className = 'badge bg-secondary';
+        typeBadge.textContent = ioc.ioc_type.toUpperCase();
+
+        cell().textContent = ioc.source_chat_title || 'Unknown';
+
+        const message = cell().appendChild(document.createElement('small'));
+        message.className = 'text-muted';
+        const content = ioc.message_content || '';
+        message.textContent = !content ? 'N/A' : content.length > 60 ? content.slice(0, 60) + '...' : content;
+
+        cell().appendChild(document.createElement('small')).textContent = ioc.detected_at;
+        return row;
+    },
+
     // Search functionality
     performSearch: function(searchTerm, type = '', limit = 100) {
         const params = new URLSearchParams({
@@ -136,8 +200,8 @@ window.IOCMonitor = {
         // Initialize tooltips
         IOCMonitor.initializeTooltips();
         
-        // Start auto-refresh if on dashboard
-        IOCMonitor.autoRefresh();
+        // Start live updates if on dashboard
+        IOCMonitor.liveUpdates();
         
         // Add keyboard shortcuts
         IOCMonitor.initializeKeyboardShortcuts();
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sqlite3
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backfill import Backfiller  # noqa: E402
+from database import IOCDatabase  # noqa: E402
+from ioc_extractor import IOCExtractor  # noqa: E402
+
+CHATS = [-1001, -1002, -1003]
+
+
+class FakeClient:
+    """Synthetic chat history: message i of every chat mentions host<i>.example.com."""
+
+    def __init__(self, chat_ids, messages_per_chat):
+        self.reads = 0
+        self.active = 0
+        self.max_active = 0
+        self.history = {
+            chat_id: [SimpleNamespace(id=i, message=f"beacon to host{i}.example.com", sender_id=1000 + i % 5,
+                                      sender=None) for i in range(1, messages_per_chat + 1)]
+            for chat_id in chat_ids
+        }
+
+    async def get_entity(self, chat):
+        return SimpleNamespace(id=chat, title=f"Chat {chat}")
+
+    async def get_peer_id(self, entity):
+        return entity.id
+
+    async def iter_messages(self, entity, limit=None, min_id=0, reverse=False):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            for message in [m for m in self.history[entity.id] if m.id > min_id][:limit]:
+                self.reads += 1
+                await asyncio.sleep(0)
+                yield message
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = IOCDatabase(str(tmp_path / "backfill.db"))
+    yield database
+    database.close()
+
+
+def make_backfiller(db, client, concurrency=2):
+    return Backfiller(client, db, IOCExtractor(["com"]), concurrency=concurrency, batch_size=10)
+
+
+def test_chats_are_backfilled_concurrently(db):
+    client = FakeClient(CHATS, 50)
+
+    summary = asyncio.run(make_backfiller(db, client).run(CHATS))
+
+    assert summary == {chat_id: 50 for chat_id in CHATS}
+    assert client.max_active == 2
+    assert db.get_checkpoints() == {chat_id: 50 for chat_id in CHATS}
+
+
+def test_resume_reads_only_past_the_checkpoint(db):
+    client = FakeClient(CHATS, 50)
+    backfiller = make_backfiller(db, client)
+
+    asyncio.run(backfiller.run(CHATS, limit=25))
+    assert db.get_checkpoints() == {chat_id: 25 for chat_id in CHATS}
+
+    assert asyncio.run(backfiller.run(CHATS)) == {chat_id: 25 for chat_id in CHATS}
+    assert asyncio.run(backfiller.run(CHATS)) == {chat_id: 0 for chat_id in CHATS}
+    assert client.reads == 50 * len(CHATS)
+
+
+def test_checkpoint_is_stored_with_its_batch(db):
+    client = FakeClient([-1001], 30)
+    # The batch holding message 15 fails after its first rows were inserted
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute('''
+            CREATE TRIGGER fail_message_15 BEFORE INSERT ON iocs WHEN new.ioc_value = 'host15.example.com'
+            BEGIN SELECT RAISE(ABORT, 'disk full'); END
+        ''')
+
+    assert asyncio.run(make_backfiller(db, client).run([-1001])) == {}
+    assert db.get_checkpoints() == {-1001: 10}
+    assert db.get_stats()['total_iocs'] == 10
+
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute('DROP TRIGGER fail_message_15')
+    client.reads = 0
+    assert asyncio.run(make_backfiller(db, client).run([-1001])) == {-1001: 20}
+    assert client.reads == 20
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import IOCDatabase, IOCRecord  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = IOCDatabase(str(tmp_path / "iocs.db"))
+    yield database
+    database.close()
+
+
+def test_live_checkpoints_only_move_forward(db):
+    db.insert_iocs([IOCRecord("evil.com", "domain", 1, "Chat", 50)], (1, 50))
+
+    db.advance_checkpoints({1: 40, 2: 7})
+    assert db.get_checkpoints() == {1: 50, 2: 7}
+
+    db.advance_checkpoints({1: 60})
+    assert db.get_checkpoints() == {1: 60, 2: 7}
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_ioc_page_clamps_non_positive_limit(db, limit):
+    db.insert_iocs([IOCRecord("evil.com", "domain", 1, "Chat", 1), IOCRecord("1.2.3.4", "ip", 1, "Chat", 2)])
+
+    iocs, next_cursor = db.get_ioc_page(limit=limit)
+    assert len(iocs) == 1
+    assert next_cursor is not None
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_unique_iocs_clamps_non_positive_limit(db, limit):
+    db.insert_iocs([IOCRecord("evil.com", "domain", 1, "Chat", 1), IOCRecord("1.2.3.4", "ip", 1, "Chat", 2)])
+
+    iocs, next_cursor = db.get_unique_iocs(limit=limit)
+    assert len(iocs) == 1
+    assert next_cursor is not None
+
+
+def test_unique_count_matches_unique_listing(db):
+    # The same key under two types is two indicators, as in ioc_summary
+    db.insert_iocs([IOCRecord("evil.com", "domain", 1, "Chat", 1), IOCRecord("evil.com", "url", 1, "Chat", 1),
+                    IOCRecord("evil.com", "domain", 1, "Chat", 2)])
+    unique_iocs, _ = db.get_unique_iocs()
+    assert db.get_stats()['unique_iocs'] == len(unique_iocs) == 2
+
+    assert db.recount_stats()
+    assert db.get_stats()['unique_iocs'] == 2
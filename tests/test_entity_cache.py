@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_cache import EntityCache  # noqa: E402
+
+
+def test_invalidate_during_lookup_discards_its_result():
+    async def scenario():
+        cache = EntityCache()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def old_title():
+            started.set()
+            await release.wait()
+            return "Old title"
+
+        async def new_title():
+            return "New title"
+
+        lookup = asyncio.create_task(cache.get(("chat", 1), old_title))
+        await started.wait()
+        cache.invalidate(("chat", 1))  # renamed while the lookup was in flight
+        release.set()
+
+        assert await lookup == "Old title"
+        assert await cache.get(("chat", 1), new_title) == "New title"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_lookup_does_not_cancel_coalesced_waiters():
+    async def scenario():
+        cache = EntityCache()
+        started = asyncio.Event()
+        loads = []
+
+        async def hanging_title():
+            loads.append("first")
+            started.set()
+            await asyncio.Event().wait()
+
+        async def title():
+            loads.append("second")
+            return "Chat title"
+
+        first = asyncio.create_task(cache.get(("chat", 1), hanging_title))
+        await started.wait()
+        second = asyncio.create_task(cache.get(("chat", 1), title))
+        await asyncio.sleep(0)  # let the second lookup coalesce onto the first
+        first.cancel()
+
+        assert await second == "Chat title"
+        assert first.cancelled()
+        assert loads == ["first", "second"]
+        assert await cache.get(("chat", 1), hanging_title) == "Chat title"
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import JSONStreamReader  # noqa: E402
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_value_split_across_chunks():
+    document = json.dumps({"text": "evil[.]com \U0001F600 \"quoted\"", "ids": [-1.5e-3, 12345678901234567890]})
+    for chunk_size in range(1, 20):
+        reader = JSONStreamReader(io.StringIO(document), chunk_size=chunk_size)
+        assert reader.value() == json.loads(document)
+
+
+def test_malformed_value_raises_without_reading_on():
+    f = CountingReader('{"text": oops, "rest": "' + "x" * 100000 + '"}')
+    with pytest.raises(json.JSONDecodeError):
+        JSONStreamReader(f, chunk_size=64).value()
+    assert f.reads <= 2
+
+
+def test_unterminated_value_is_capped():
+    f = CountingReader('{"text": "' + "x" * 100000)
+    with pytest.raises(ValueError, match="longer than"):
+        JSONStreamReader(f, chunk_size=64, max_value_size=1000).value()
+    assert f.reads < 100
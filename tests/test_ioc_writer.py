@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import IOCRecord  # noqa: E402
+from ioc_writer import IOCWriter  # noqa: E402
+
+
+class FlakyDatabase:
+    """insert_iocs fails `failures` times with "database is locked", then succeeds."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def insert_iocs(self, records):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise sqlite3.OperationalError("database is locked")
+        return [True] * len(records)
+
+
+def test_failed_batch_is_retried():
+    db = FlakyDatabase(failures=2)
+    writer = IOCWriter(db, retries=3, retry_delay=0.01).start()
+    future = writer.submit(IOCRecord("evil.com", "domain"))
+    writer.close()
+
+    assert future.result(timeout=5) is True
+    assert db.calls == 3
+    assert writer.written == 1 and writer.failed == 0
+
+
+def test_failed_batch_is_not_reported_as_duplicates():
+    db = FlakyDatabase(failures=10)
+    writer = IOCWriter(db, retries=2, retry_delay=0.01).start()
+    futures = [writer.submit(IOCRecord(f"evil{i}.com", "domain")) for i in range(3)]
+    writer.close()
+
+    for future in futures:
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(timeout=5)
+    assert writer.duplicates == 0
+    assert writer.failed == 3
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+
+from telethon.errors import FloodWaitError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from read_ack import ReadAckScheduler  # noqa: E402
+
+
+class FakeClient:
+    """Records read acknowledgements; the first `flood_waits` calls raise FloodWait."""
+
+    def __init__(self, flood_waits=0, seconds=1):
+        self.flood_waits = flood_waits
+        self.seconds = seconds
+        self.attempts = 0
+        self.calls = []
+
+    async def send_read_acknowledge(self, entity, max_id=None):
+        self.attempts += 1
+        if self.attempts <= self.flood_waits:
+            raise FloodWaitError(request=None, capture=self.seconds)
+        self.calls.append((entity, max_id))
+
+
+def test_messages_in_one_chat_are_acknowledged_once():
+    async def scenario():
+        client = FakeClient()
+        acks = ReadAckScheduler(client, interval=0.05)
+        for message_id in range(1, 101):
+            acks.mark(42, message_id)
+        await asyncio.sleep(0.2)
+        await acks.close()
+        return client, acks
+
+    client, acks = asyncio.run(scenario())
+    assert client.calls == [(42, 100)]
+    assert acks.stats() == {"marked": 100, "requests": 1, "flood_waits": 0, "pending_chats": 0}
+
+
+def test_acks_wait_out_a_flood_wait():
+    async def scenario():
+        client = FakeClient(flood_waits=1, seconds=1)
+        acks = ReadAckScheduler(client, interval=0.05)
+        acks.mark(1, 10)
+        acks.mark(2, 20)
+        await asyncio.sleep(0.3)
+        during_wait = (list(client.calls), acks.stats()["pending_chats"])
+        await asyncio.sleep(1.0)
+        await acks.close()
+        return client, acks, during_wait
+
+    client, acks, (calls, pending_chats) = asyncio.run(scenario())
+    assert calls == []
+    assert pending_chats == 2
+    assert sorted(client.calls) == [(1, 10), (2, 20)]
+    assert acks.stats()["flood_waits"] == 1
+    assert acks.stats()["pending_chats"] == 0
@@ -0,0 +1,21 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tld_registry  # noqa: E402
+from tld_registry import TLDRegistry  # noqa: E402
+
+
+def test_refresh_applies_list_when_cache_cannot_be_written(tmp_path, monkeypatch):
+    response = SimpleNamespace(status_code=200, text="# Version 1\nCOM\nEVIL\n", headers={})
+    monkeypatch.setattr(tld_registry.requests, "get", lambda *args, **kwargs: response)
+    updates = []
+    # The cache directory doesn't exist, so writing the cache raises OSError
+    registry = TLDRegistry(cache_path=str(tmp_path / "missing" / "tlds_cache.txt"), on_update=updates.append)
+
+    assert registry.refresh()
+    assert registry.tlds == {"com", "evil"}
+    assert updates == [frozenset({"com", "evil"})]
+    assert registry.is_stale()
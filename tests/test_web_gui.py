@@ -0,0 +1,70 @@
+import importlib
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import IOCDatabase, IOCRecord  # noqa: E402
+
+
+@pytest.fixture
+def web_gui(tmp_path, monkeypatch):
+    # web_gui opens ioc_database.db in the working directory on import
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module("web_gui")
+    # The module is imported once; give every test its own database
+    database = IOCDatabase(str(tmp_path / "ioc_database.db"))
+    monkeypatch.setattr(module, "db", database)
+    yield module
+    database.close()
+
+
+def test_publish_drops_stalled_subscriber_without_blocking(web_gui):
+    feed = web_gui.LiveFeed(web_gui.db, max_pending=3)
+    stalled = feed.subscribe()
+    active = feed.subscribe()
+
+    def publish():
+        for i in range(10):
+            feed.publish(f"event {i}")
+            active.get_nowait()
+
+    publisher = threading.Thread(target=publish, daemon=True)
+    publisher.start()
+    publisher.join(timeout=5)
+
+    assert not publisher.is_alive(), "publish blocked on a stalled subscriber"
+    assert feed.subscribers() == 1
+    assert stalled.get_nowait() is None
+
+
+@pytest.mark.parametrize("path", ["/api/iocs?limit=0", "/api/iocs?limit=-1", "/iocs?limit=0",
+                                  "/api/unique_iocs?limit=0", "/api/unique_iocs?limit=-1"])
+def test_ioc_listing_accepts_non_positive_limit(web_gui, path):
+    web_gui.db.insert_iocs([IOCRecord("evil.com", "domain", 1, "Chat", 1), IOCRecord("1.2.3.4", "ip", 1, "Chat", 2)])
+    response = web_gui.app.test_client().get(path)
+    assert response.status_code == 200
+
+
+def test_stream_replays_full_backlog_without_duplicates(web_gui, monkeypatch):
+    feed = web_gui.LiveFeed(web_gui.db, interval=3600)
+    monkeypatch.setattr(web_gui, "live_feed", feed)
+    backlog = web_gui.STREAM_BACKLOG * 2 + 50
+    web_gui.db.insert_iocs([IOCRecord(f"host{i}.evil.com", "domain", 1, "Chat", i) for i in range(1, backlog + 1)])
+
+    response = web_gui.app.test_client().get("/api/stream", headers={"Last-Event-ID": "0"}, buffered=False)
+    # Stored during the replay, so also queued live, then a new row and a stats update
+    subscriber = next(iter(feed._subscribers))
+    subscriber.put((backlog, "event: ioc\nid: duplicate\n\n"))
+    subscriber.put((backlog + 1, "event: ioc\nid: live\n\n"))
+    subscriber.put((None, "event: stats\n\n"))
+    subscriber.put(None)
+    body = b"".join(response.response).decode()
+    response.close()
+
+    ids = [line[4:] for line in body.splitlines() if line.startswith("id: ")]
+    assert ids == [str(i) for i in range(1, backlog + 1)] + ["live"]
+    assert "event: stats" in body
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, FrozenSet, Iterable, Optional
+
+import requests
+
+from ioc_extractor import parse_tlds
+
+
+TLD_URL = "https://data.iana.org/TLD/tlds-alpha-by-domain.txt"
+
+# Copy of the IANA list shipped with the project, used until the first download
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tlds-alpha-by-domain.txt")
+
+log = logging.getLogger(__name__)
+
+
+class TLDRegistry:
+    """
+    Top-level domain list with an on-disk cache and background refresh.
+
+    Loading never touches the network: the list comes from the cache written
+    by the last successful download, or from the bundled snapshot if there
+    is none. A background thread revalidates the cache with a conditional
+    request (ETag / If-Modified-Since) once it is older than
+    `refresh_interval`, so an unchanged list costs a 304 and nothing else.
+    """
+
+    def __init__(self, cache_path: str = "tlds_cache.txt", url: str = TLD_URL,
+                 snapshot_path: str = SNAPSHOT_PATH, refresh_interval: float = 86400,
+                 timeout: float = 10, on_update: Optional[Callable[[FrozenSet[str]], None]] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            cache_path: Where downloaded lists are kept (metadata goes next to it)
+            url: IANA tlds-alpha-by-domain.txt URL
+            snapshot_path: Fallback list used when there is no cache yet
+            refresh_interval: Revalidate the cache once it is this old (seconds)
+            timeout: HTTP timeout for refreshes (seconds)
+            on_update: Called with the new TLD set whenever it changes
+        """
+        self.cache_path = cache_path
+        self.meta_path = cache_path + ".json"
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.on_update = on_update
+
+        self.source: Optional[str] = None  # "cache", "snapshot" or "network"
+        self._tlds: FrozenSet[str] = frozenset()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def tlds(self) -> FrozenSet[str]:
+        """The current TLDs, lowercase. Replaced wholesale on refresh, never mutated."""
+        return self._tlds
+
+    def __contains__(self, tld: str) -> bool:
+        return tld.lower() in self._tlds
+
+    def __len__(self) -> int:
+        return len(self._tlds)
+
+    def load(self) -> FrozenSet[str]:
+        """
+        Load the cached list, or the bundled snapshot if there is no cache.
+
+        Returns:
+            The loaded TLDs
+
+        Raises:
+            RuntimeError: If neither file can be read
+        """
+        for path, source in ((self.cache_path, "cache"), (self.snapshot_path, "snapshot")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    tlds = parse_tlds(f.read())
+            except OSError:
+                continue
+            if tlds:
+                self._set(tlds, source)
+                return self._tlds
+
+        raise RuntimeError(f"No TLD list available: {self.cache_path} and {self.snapshot_path} are missing or empty")
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Download the list if it changed since the cached copy.
+
+        Args:
+            force: Skip the conditional request headers
+
+        Returns:
+            True if a new list was downloaded and applied
+        """
+        meta = self._read_meta()
+        headers = {}
+        if not force and os.path.exists(self.cache_path):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = requests.get(self.url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            log.warning("⚠️ TLD list refresh failed: %s", e)
+            return False
+
+        if response.status_code == 304:
+            meta["checked_at"] = time.time()
+            try:
+                self._write_meta(meta)
+            except OSError as e:
+                log.warning("⚠️ Could not update TLD cache metadata: %s", e, extra={"path": self.meta_path})
+            return False
+
+        tlds = parse_tlds(response.text) if response.status_code == 200 else []
+        if not tlds:
+            log.warning("⚠️ TLD list refresh failed: HTTP %d", response.status_code)
+            return False
+
+        # Write to a temporary file first so a crash never leaves a truncated cache
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(response.text)
+            os.replace(tmp_path, self.cache_path)
+            self._write_meta({
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "checked_at": time.time(),
+            })
+        except OSError as e:
+            # The new list is still used; the cache is rewritten on the next refresh
+            log.warning("⚠️ Could not write TLD cache: %s", e, extra={"path": self.cache_path})
+
+        self._set(tlds, "network")
+        return True
+
+    def is_stale(self) -> bool:
+        """Whether the cache is missing or due for revalidation."""
+        if not os.path.exists(self.cache_path):
+            return True
+        checked_at = self._read_meta().get("checked_at", 0)
+        return time.time() - checked_at >= self.refresh_interval
+
+    def start(self) -> "TLDRegistry":
+        """Start refreshing in a background thread (first check runs immediately)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="tld-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the background refresh thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.is_stale():
+                self.refresh()
+            if self.is_stale():
+                # Download or cache write failed: retry within the hour rather than a full interval
+                delay = min(self.refresh_interval, 3600)
+            else:
+                checked_at = self._read_meta().get("checked_at", time.time())
+                delay = max(60.0, checked_at + self.refresh_interval - time.time())
+            self._stop.wait(delay)
+
+    def _set(self, tlds: Iterable[str], source: str):
+        new = frozenset(tld.lower() for tld in tlds)
+        changed = new != self._tlds
+        self._tlds = new
+        self.source = source
+        if changed and self.on_update is not None:
+            self.on_update(new)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, meta: dict):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
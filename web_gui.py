@@ -1,22 +1,206 @@
 #!/usr/bin/env python3
 
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, flash, redirect, url_for, stream_with_context
 from database import IOCDatabase
+from ioc_extractor import IOC_TYPES
+from logs import setup_logging
+import metrics
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import functools
+import logging
 import os
-import tempfile
 import json
+import queue
+import threading
+import time
 
 app = Flask(__name__)
+log = logging.getLogger('web_gui')
 app.secret_key = 'your-secret-key-change-this'  # Change this in production
 
-# Initialize database
-db = IOCDatabase()
+# Initialize database; queries use read-only connections so the GUI never
+# holds a write lock the collector is waiting on
+db = IOCDatabase(read_only_pool=True)
+
+# Every open dashboard polls /api/stats; serve them all from one read
+STATS_TTL = 5  # seconds
+_stats_cache = {'value': None, 'expires': 0.0}
+_stats_lock = threading.Lock()
+
+def get_cached_stats():
+    """Return database statistics, re-reading them at most every STATS_TTL seconds."""
+    with _stats_lock:
+        now = time.monotonic()
+        if _stats_cache['value'] is None or now >= _stats_cache['expires']:
+            _stats_cache['value'] = db.get_stats()
+            _stats_cache['expires'] = now + STATS_TTL
+        return _stats_cache['value']
+
+# Polled JSON endpoints answer If-None-Match with 304 and keep their last
+# responses in memory, both keyed on the database change marker, so repeat
+# polls don't touch the tables until the collector commits something
+RESPONSE_CACHE_SIZE = 256  # responses kept (one per endpoint + query string)
+# The change marker restarts with the process; keep old ETags from matching
+ETAG_PREFIX = os.urandom(4).hex()
+
+class ResponseCache:
+    """Small LRU of serialized responses, each valid for one change marker."""
+    
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, marker):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != marker:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key, marker, value):
+        with self._lock:
+            self._entries[key] = (marker, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+response_cache = ResponseCache()
+
+RESPONSES = metrics.counter('ioc_web_responses', 'Polled API responses by how they were served',
+                            ['endpoint', 'result'])
+
+def conditional(view):
+    """Serve a JSON view with an ETag, 304 responses and the response cache."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        marker = db.change_marker()
+        etag = f'{ETAG_PREFIX}-{marker}'
+        if request.if_none_match.contains(etag):
+            RESPONSES.inc(view.__name__, 'not_modified')
+            response = Response(status=304)
+        else:
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            cached = response_cache.get(key, marker)
+            RESPONSES.inc(view.__name__, 'miss' if cached is None else 'hit')
+            if cached is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                headers = [(name, response.headers[name]) for name in ('X-Next-Cursor', 'Link')
+                           if name in response.headers]
+                response_cache.put(key, marker, (response.get_data(), response.mimetype, headers))
+            else:
+                body, mimetype, headers = cached
+                response = Response(body, mimetype=mimetype, headers=headers)
+        response.set_etag(etag)
+        # Let browsers keep the body but revalidate on every poll
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+# Live feed: one reader thread tails the iocs table for every open dashboard
+STREAM_POLL_INTERVAL = 1.0  # seconds between watermark checks
+STREAM_KEEPALIVE = 15  # seconds of silence before a keepalive comment
+STREAM_BACKLOG = 100  # rows per query when replaying to a client reconnecting with Last-Event-ID
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Events message."""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+class LiveFeed:
+    """
+    Fan out newly stored IOCs to Server-Sent Events subscribers.
+    
+    A single background thread polls for rows above an id watermark, so the
+    database sees one cheap range scan per interval however many clients
+    are connected. Each event is serialized once and queued to every
+    subscriber as (event id, message); clients that stop reading are dropped.
+    """
+    
+    def __init__(self, database, interval=STREAM_POLL_INTERVAL, max_pending=1000):
+        self.db = database
+        self.interval = interval
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def subscribe(self):
+        """Register a client and return the queue its events arrive on."""
+        subscriber = queue.Queue(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+                self._thread.start()
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    def subscribers(self):
+        with self._lock:
+            return len(self._subscribers)
+    
+    def publish(self, message, event_id=None):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event_id, message))
+            except queue.Full:
+                # Too far behind; the client reconnects and resumes via Last-Event-ID
+                log.debug('Dropping live feed client %d events behind', self.max_pending)
+                self.unsubscribe(subscriber)
+                # Never block the feed thread on a stalled client: discard what
+                # it hasn't read so the end-of-stream marker fits
+                try:
+                    while True:
+                        subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(None)
+                except queue.Full:
+                    pass
+    
+    def _run(self):
+        watermark = self.db.get_last_id()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            
+            rows = self.db.get_iocs_since(watermark)
+            if not rows:
+                continue
+            watermark = rows[-1]['id']
+            for ioc in rows:
+                self.publish(sse_event('ioc', ioc, ioc['id']), ioc['id'])
+            
+            stats = self.db.get_stats()
+            with _stats_lock:
+                _stats_cache['value'] = stats
+                _stats_cache['expires'] = time.monotonic() + STATS_TTL
+            self.publish(sse_event('stats', stats))
+
+live_feed = LiveFeed(db)
+metrics.gauge('ioc_web_stream_clients', 'Connected live feed clients', lambda: {(): live_feed.subscribers()})
 
 @app.route('/')
 def dashboard():
     """Main dashboard with statistics and recent IOCs."""
-    stats = db.get_stats()
+    stats = get_cached_stats()
     recent_iocs = db.get_iocs(limit=10)
     
     # Process recent IOCs for display
@@ -33,16 +217,27 @@ def dashboard():
 
 @app.route('/iocs')
 def list_iocs():
-    """List IOCs with filtering and pagination."""
-    page = request.args.get('page', 1, type=int)
+    """List IOCs with filtering and cursor pagination."""
     ioc_type = request.args.get('type', '')
     search_term = request.args.get('search', '')
+    chat_id = request.args.get('chat', None, type=int)
+    since = request.args.get('since', '')
+    until = request.args.get('until', '')
     limit = request.args.get('limit', 50, type=int)
+    cursor = request.args.get('cursor', '')
+    next_cursor = None
     
     if search_term:
-        iocs = db.search_ioc(search_term)
+        iocs = db.search_ioc(search_term, limit=limit)
     else:
-        iocs = db.get_iocs(ioc_type=ioc_type if ioc_type else None, limit=limit)
+        filters = dict(ioc_type=ioc_type or None, chat_id=chat_id, since=since or None,
+                       until=until or None, limit=limit)
+        try:
+            iocs, next_cursor = db.get_ioc_page(cursor=cursor or None, **filters)
+        except ValueError:
+            flash('Invalid page link, showing the newest IOCs instead', 'error')
+            cursor = ''
+            iocs, next_cursor = db.get_ioc_page(**filters)
     
     # Process IOCs for display
     for ioc in iocs:
@@ -52,65 +247,204 @@ def list_iocs():
             pass
     
     return render_template('iocs.html', iocs=iocs, current_type=ioc_type, 
-                         current_search=search_term, current_limit=limit)
+                         current_search=search_term, current_limit=limit,
+                         current_chat=chat_id, current_since=since, current_until=until,
+                         current_cursor=cursor, next_cursor=next_cursor)
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events stream of new IOCs ('ioc') and updated counters ('stats')."""
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    subscriber = live_feed.subscribe()
+    
+    def events():
+        try:
+            yield 'retry: 5000\n\n'
+            replayed = last_id
+            if last_id is not None:
+                # Reconnecting client: replay everything it missed, a page at a time
+                while True:
+                    rows = db.get_iocs_since(replayed, limit=STREAM_BACKLOG)
+                    for ioc in rows:
+                        yield sse_event('ioc', ioc, ioc['id'])
+                        replayed = ioc['id']
+                    if len(rows) < STREAM_BACKLOG:
+                        break
+            while True:
+                try:
+                    item = subscriber.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if item is None:
+                    return
+                event_id, message = item
+                # Rows stored during the replay are queued live as well
+                if event_id is not None and replayed is not None and event_id <= replayed:
+                    continue
+                yield message
+        finally:
+            live_feed.unsubscribe(subscriber)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/stats')
+@conditional
 def api_stats():
     """API endpoint for statistics."""
     return jsonify(db.get_stats())
 
 @app.route('/api/iocs')
+@conditional
 def api_iocs():
-    """API endpoint for IOCs."""
+    """
+    API endpoint for IOCs.
+    
+    Listings are paginated with an opaque cursor: when more results exist the
+    response carries an X-Next-Cursor header (and a Link rel="next"); pass it
+    back as ?cursor= to get the following page. Searches page with ?offset=.
+    """
     ioc_type = request.args.get('type')
     limit = request.args.get('limit', 100, type=int)
+    offset = request.args.get('offset', 0, type=int)
     search_term = request.args.get('search')
+    include_messages = request.args.get('messages', '') in ('1', 'true')
     
     if search_term:
-        iocs = db.search_ioc(search_term)
-    else:
-        iocs = db.get_iocs(ioc_type=ioc_type, limit=limit)
+        iocs = db.search_ioc(search_term, limit=limit, offset=offset, include_messages=include_messages)
+        return jsonify(iocs)
+    
+    try:
+        iocs, next_cursor = db.get_ioc_page(
+            ioc_type=ioc_type,
+            chat_id=request.args.get('chat', None, type=int),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(iocs)
+    response = jsonify(iocs)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("api_iocs", **args)}>; rel="next"'
+    return response
 
 @app.route('/api/unique_iocs')
+@conditional
 def api_unique_iocs():
-    """API endpoint for unique IOCs."""
-    ioc_type = request.args.get('type')
-    unique_iocs = db.get_unique_iocs(ioc_type=ioc_type)
-    return jsonify(unique_iocs)
+    """
+    API endpoint for unique IOCs with their sighting summary.
+    
+    ?sort= is 'value' (default), 'sightings' or 'recent'. Paginated like
+    /api/iocs: follow the X-Next-Cursor header (or Link rel="next") with ?cursor=.
+    """
+    try:
+        unique_iocs, next_cursor = db.get_unique_iocs(
+            ioc_type=request.args.get('type') or None,
+            sort=request.args.get('sort', 'value'),
+            limit=request.args.get('limit', 100, type=int),
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(unique_iocs)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("api_unique_iocs", **args)}>; rel="next"'
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process (request and database timings)."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+# Largest batch accepted by /api/lookup
+MAX_LOOKUP_VALUES = 100000
+
+@app.route('/api/lookup', methods=['POST'])
+def api_lookup():
+    """
+    Bulk indicator lookup for enrichment.
+    
+    The body is a JSON array of values, a JSON object {"values": [...],
+    "type": "ip"}, or plain text with one value per line (?type= also
+    restricts the type). Responds with newline-delimited JSON, one object
+    per value in input order, streamed as each chunk is looked up.
+    """
+    ioc_type = request.args.get('type') or None
+    if request.is_json:
+        values = request.get_json(silent=True)
+        if isinstance(values, dict):
+            ioc_type = values.get('type') or ioc_type
+            values = values.get('values')
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            return jsonify({'error': 'Expected a JSON array of strings or {"values": [...]}'}), 400
+    else:
+        values = request.get_data(as_text=True).splitlines()
+    
+    if ioc_type is not None and ioc_type not in IOC_TYPES:
+        return jsonify({'error': f'Unknown IOC type: {ioc_type}'}), 400
+    if len(values) > MAX_LOOKUP_VALUES:
+        return jsonify({'error': f'At most {MAX_LOOKUP_VALUES} values per request'}), 413
+    
+    def lines():
+        for result in db.lookup_many(values, ioc_type=ioc_type):
+            yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
 
 @app.route('/export')
 def export_csv():
-    """Export IOCs to CSV."""
-    try:
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv')
-        temp_file.close()
-        
-        # Export to temp file
-        success = db.export_to_csv(temp_file.name)
-        
-        if success:
-            return send_file(temp_file.name, as_attachment=True, 
-                           download_name=f'iocs_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                           mimetype='text/csv')
-        else:
-            flash('Export failed', 'error')
-            return redirect(url_for('dashboard'))
-    except Exception as e:
-        flash(f'Export error: {str(e)}', 'error')
-        return redirect(url_for('dashboard'))
+    """
+    Stream IOCs as CSV.
+    
+    Accepts the same type/chat/since/until filters as /iocs, and gzip=1 to
+    download a compressed .csv.gz. Rows are sent as they are read, so the
+    download starts immediately and memory use stays flat.
+    """
+    compress = request.args.get('gzip', '') in ('1', 'true')
+    chunks = db.iter_csv_export(
+        ioc_type=request.args.get('type') or None,
+        chat_id=request.args.get('chat', None, type=int),
+        since=request.args.get('since') or None,
+        until=request.args.get('until') or None,
+        compress=compress,
+    )
+    
+    filename = f'iocs_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    if compress:
+        filename += '.gz'
+    
+    return Response(stream_with_context(chunks),
+                    mimetype='application/gzip' if compress else 'text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @app.route('/search')
 def search():
     """Search page."""
     return render_template('search.html')
 
+# range parameter -> (time span, rollup period)
+ANALYTICS_RANGES = {
+    '24h': (timedelta(hours=24), 'hour'),
+    '7d': (timedelta(days=7), 'day'),
+    '30d': (timedelta(days=30), 'day'),
+    '1y': (timedelta(days=365), 'day'),
+}
+
 @app.route('/analytics')
 def analytics():
     """Analytics page with charts and insights."""
-    stats = db.get_stats()
+    stats = get_cached_stats()
     
     # Get IOCs by type for chart
     ioc_types = {}
@@ -119,24 +453,22 @@ def analytics():
             ioc_type = key.replace('_count', '')
             ioc_types[ioc_type] = value
     
-    # Get recent activity (last 7 days)
-    recent_iocs = db.get_iocs(limit=1000)  # Get more for analysis
-    
-    # Process for daily activity chart
-    daily_activity = {}
-    for ioc in recent_iocs:
-        try:
-            date = datetime.fromisoformat(ioc['detected_at']).date()
-            daily_activity[str(date)] = daily_activity.get(str(date), 0) + 1
-        except:
-            pass
+    # Activity over the selected range, read from the rollup tables
+    range_key = request.args.get('range', '7d')
+    if range_key not in ANALYTICS_RANGES:
+        range_key = '7d'
+    span, period = ANALYTICS_RANGES[range_key]
+    chat_id = request.args.get('chat', type=int)
+    if chat_id is not None:
+        period = 'day'  # per-chat rollups are daily only
     
-    # Sort by date and get last 7 days
-    sorted_dates = sorted(daily_activity.keys())[-7:]
-    daily_data = {date: daily_activity.get(date, 0) for date in sorted_dates}
+    now = datetime.utcnow()
+    activity = db.get_activity(now - span, now, period=period,
+                               ioc_type=request.args.get('type') or None, chat_id=chat_id)
     
-    return render_template('analytics.html', stats=stats, ioc_types=ioc_types, 
-                         daily_activity=daily_data)
+    return render_template('analytics.html', stats=stats, ioc_types=ioc_types,
+                         daily_activity=activity, ranges=ANALYTICS_RANGES,
+                         current_range=range_key, chat_id=chat_id)
 
 @app.template_filter('datetime')
 def datetime_filter(timestamp):
@@ -160,4 +492,5 @@ def truncate_text_filter(text, length=50):
     return text[:length] + '...'
 
 if __name__ == '__main__':
+    setup_logging()
     app.run(debug=True, host='0.0.0.0', port=5000)